@@ -1,13 +1,15 @@
 import os
 import sys
+import math
 import asyncio
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
 from services.secure_api_manager import SecureAPIManager
 from bson.objectid import ObjectId 
-from services.trade_manager import TradeManager  # ודא שזה נמצא למעלה בקובץ
 from markupsafe import escape  # נשתמש כדי למנוע XSS
+from core.metrics import metrics
+from core.profiling import profiler
 from datetime import datetime, timedelta
 
 
@@ -260,6 +262,37 @@ def dashboard_table():
     return render_template("master_table.html", master_positions=master_positions)
 
 
+# 📈 מדדי ביצועים של לולאת המסחר (failover, מאגר חיבורים וכו')
+@app.route("/metrics")
+def metrics_view():
+    if not session.get("user"):
+        return "", 403
+
+    return jsonify(metrics.snapshot())
+
+
+# 🔬 דגימת stack של thread המסחר לקובץ folded מקומי (רק עם PROFILING_ENABLED=1)
+@app.route("/admin/profile", methods=["POST"])
+def capture_profile():
+    if not session.get("user"):
+        return "", 403
+    if not profiler.enabled:
+        return jsonify({"error": "profiling is disabled (PROFILING_ENABLED=0)"}), 403
+
+    try:
+        seconds = float(request.form.get("seconds", request.args.get("seconds", 10)))
+    except (TypeError, ValueError):
+        return jsonify({"error": "seconds must be a number"}), 400
+    if not math.isfinite(seconds):
+        return jsonify({"error": "seconds must be finite"}), 400
+    seconds = min(max(seconds, 1.0), 60.0)
+    try:
+        path, samples = profiler.capture(seconds)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"path": path, "samples": samples, "seconds": seconds})
+
+
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,134 @@
+import os
+import sys
+import gc
+import time
+import argparse
+import tracemalloc
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.bingx_api import BingXAPI
+from services.records import ClientIdTable, ClientRecord, ClientPositionBook, PositionRecord
+
+SYMBOLS = [f"SYM{i}-USDT" for i in range(10)]
+
+
+class LegacyBingXAPI(BingXAPI):
+    """BingXAPI כמו לפני ה-__slots__: עם __dict__ לכל מופע ו-cache ריק שלא בשימוש"""
+
+    def __init__(self, api_key, secret_key, session=None):
+        super().__init__(api_key, secret_key, session=session)
+        self.cache = {}
+
+
+def measure(build):
+    """(תוצאה, בתים שהוקצו ונשארו חיים) לפי tracemalloc"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def legacy_clients(count):
+    return [
+        {"name": f"Client_{i}", "api": LegacyBingXAPI(f"key_{i}", f"secret_{i}"), "tier": None}
+        for i in range(count)
+    ]
+
+
+def record_clients(count):
+    ids = ClientIdTable()
+    return [ClientRecord(f"Client_{i}", BingXAPI(f"key_{i}", f"secret_{i}"), ids=ids) for i in range(count)]
+
+
+def legacy_positions(count, symbols):
+    positions = {}
+    for i in range(count):
+        for symbol in symbols:
+            positions.setdefault(f"client_{i}", {})[symbol] = 0.001 * (i + 1)
+    return positions
+
+
+def book_positions(count, symbols):
+    ids = ClientIdTable()
+    book = ClientPositionBook(ids)
+    for i in range(count):
+        for symbol in symbols:
+            book.setdefault(f"client_{i}", {})[symbol] = 0.001 * (i + 1)
+    return book
+
+
+def cycle_allocations(cycles, update_in_place):
+    """
+    בתים שהוקצו בסבב סנכרון ממוצע: בניית last_positions מחדש (dict לכל סימבול)
+    מול עדכון PositionRecord במקום. נמדד כשיא הזיכרון בסבב פחות הזיכרון בתחילתו.
+    """
+    last_positions = {}
+    fields = (1.0, "SELL", "LONG", 10, None, None, False, "0")
+    allocated = 0
+    gc.collect()
+    tracemalloc.start()
+    for _ in range(cycles):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        open_positions = {}
+        for symbol in SYMBOLS:
+            if update_in_place:
+                previous = last_positions.get(symbol)
+                open_positions[symbol] = previous.update(*fields) if previous is not None \
+                    else PositionRecord(symbol, *fields)
+            else:
+                qty, side, position_side, leverage, tp, sl, isolated, unrealized = fields
+                open_positions[symbol] = {
+                    "qty": qty, "side": side, "position_side": position_side, "leverage": leverage,
+                    "tp": tp, "sl": sl, "isolated": isolated, "unrealizedProfit": unrealized,
+                }
+        allocated += tracemalloc.get_traced_memory()[1] - base
+        last_positions = open_positions
+    tracemalloc.stop()
+    return allocated / cycles
+
+
+def lookup_cost(clients, get_key, rounds=20):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for client in clients:
+            get_key(client)
+    return (time.perf_counter() - started) / (rounds * len(clients)) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="זיכרון ללקוח והקצאות לסבב – dict מול רשומות slotted")
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--symbols", type=int, default=3, help="פוזיציות פתוחות לכל לקוח")
+    parser.add_argument("--cycles", type=int, default=1000)
+    args = parser.parse_args()
+    symbols = SYMBOLS[:args.symbols]
+
+    legacy, legacy_bytes = measure(lambda: legacy_clients(args.clients))
+    records, record_bytes = measure(lambda: record_clients(args.clients))
+    print(f"👤 {args.clients} לקוחות (כולל BingXAPI ומצב HMAC):")
+    print(f"   dict + BingXAPI עם __dict__: {legacy_bytes / args.clients:.0f} בתים ללקוח")
+    print(f"   ClientRecord + BingXAPI slotted: {record_bytes / args.clients:.0f} בתים ללקוח")
+
+    legacy_book, legacy_book_bytes = measure(lambda: legacy_positions(args.clients, symbols))
+    book, book_bytes = measure(lambda: book_positions(args.clients, symbols))
+    assert book.to_dict() == legacy_book
+    print(f"📚 client_positions ({args.symbols} סימבולים ללקוח):")
+    print(f"   dict של dicts: {legacy_book_bytes / args.clients:.0f} בתים ללקוח")
+    print(f"   ClientPositionBook (מערך לכל סימבול): {book_bytes / args.clients:.0f} בתים ללקוח")
+
+    print(f"🔁 last_positions ({len(SYMBOLS)} סימבולים, ממוצע על {args.cycles} סבבים):")
+    print(f"   dict חדש לכל סימבול: {cycle_allocations(args.cycles, False):.0f} בתים מוקצים לסבב")
+    print(f"   PositionRecord שמתעדכן במקום: {cycle_allocations(args.cycles, True):.0f} בתים מוקצים לסבב")
+
+    legacy_ns = lookup_cost(legacy, lambda client: client.get("name", "לא ידוע").lower())
+    record_ns = lookup_cost(records, lambda client: client.key)
+    print(f"🔤 מפתח לקוח: .lower() בכל גישה {legacy_ns:.0f}ns, key מוכן {record_ns:.0f}ns")
+
+
+if __name__ == "__main__":
+    main()
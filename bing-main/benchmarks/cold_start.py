@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# 🧪 רץ בתהליך נקי: bootstrap → TradeManager (מאסטר ולקוחות מדומים, מצב בזיכרון) → שליפת פוזיציות ראשונה
+CHILD = """
+import sys, json, asyncio
+sys.path.insert(0, {root!r})
+from core.bootstrap import startup
+
+async def main():
+    from services.trade_manager import TradeManager
+    from utils.bingx_api import BingXAPI
+    from utils.mock_exchange import MockExchange, MockBingXAPI
+    from replay_session import MemoryStateStore
+    startup.mark("imports")
+
+    class MasterStub(BingXAPI):
+        async def start_session(self):
+            pass
+
+        async def get_positions(self):
+            return {{"code": 0, "data": []}}
+
+        async def get_balance_details(self, asset="USDT"):
+            return {{"available": 1000.0}}
+
+        async def get_all_open_orders(self):
+            return []
+
+    exchange = MockExchange(latency=0)
+    config = {{"master": {{"api_key": "m", "secret_key": "m"}},
+              "clients": [{{"name": f"c{{i}}", "api_key": f"k{{i}}", "secret_key": f"s{{i}}"}} for i in range({clients})]}}
+    manager = TradeManager(
+        config=config, mongo_state=MemoryStateStore(), master_api=MasterStub("m", "m"),
+        api_factory=lambda k, s, session=None: MockBingXAPI(k, s, exchange, session=session),
+    )
+    startup.mark("trade_manager_built")
+    await manager.load_state()
+    startup.mark("state_loaded")
+
+    task = asyncio.create_task(manager.sync_trades())
+    await startup.wait_ready(30)
+    task.cancel()
+    await manager.connection_pool.close()
+    print(json.dumps(startup.phases))
+
+asyncio.run(main())
+"""
+
+
+def run_once(clients):
+    env = {**os.environ, "LOG_FILE": os.devnull, "TIME_SYNC_INTERVAL": "3600"}
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD.format(root=ROOT, clients=clients)],
+        capture_output=True, text=True, env=env, cwd=ROOT, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="בנצ'מרק cold start – מתחילת התהליך ועד שליפת הפוזיציות הראשונה")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--budget", type=float, default=float(os.getenv("STARTUP_BUDGET_SECONDS", "5")))
+    args = parser.parse_args()
+
+    runs = [run_once(args.clients) for _ in range(args.runs)]
+    print(f"🧪 {args.runs} הרצות, {args.clients} לקוחות (זמן מתחילת התהליך, חציון)")
+    for phase in runs[0]:
+        print(f"⏱️ {phase:22}: {statistics.median(run[phase] for run in runs):.3f}s")
+
+    first_poll = statistics.median(run["first_positions_poll"] for run in runs)
+    status = "✅ בתוך התקציב" if first_poll <= args.budget else "🐢 חריגה מהתקציב"
+    print(f"{status}: {first_poll:.3f}s (תקציב {args.budget}s)")
+    return 0 if first_poll <= args.budget else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import pstats
+import asyncio
+import argparse
+import cProfile
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import send_telegram_message
+from utils.bingx_api import BingXAPI
+from utils.mock_exchange import NullOrderSink
+from services.trade_operations import TradeOperations
+from services.execution_plans import ExecutionPlanCache
+from services.records import ClientRecord, ClientPositionBook
+
+
+async def run_fanout(client_count, prepared=False):
+    """
+    🧪 פתיחה, סגירה חלקית וסגירה מלאה של סימבול אחד ל-client_count לקוחות.
+    כל פקודה נבנית ונחתמת ב-BingXAPI האמיתי ונבלעת ב-NullOrderSink.
+    prepared – כאילו תוכניות הביצוע כבר הוכנו ברקע (מינוף ו-margin מוגדרים מראש).
+    """
+    send_telegram_message.disable_telegram()
+    sink = NullOrderSink()
+
+    clients = []
+    for i in range(client_count):
+        api = BingXAPI(f"key_{i}", f"secret_{i}")
+        api.order_sink = sink
+        clients.append(ClientRecord(f"client_{i}", api))
+
+    async def save_state():
+        pass
+
+    execution_plans = ExecutionPlanCache(None, lambda: clients)
+    if prepared:
+        for client in clients:
+            execution_plans.mark_leverage(client.key, "BTC-USDT", "LONG", 10)
+            execution_plans.mark_margin(client.key, "BTC-USDT", "CROSS")
+
+    operations = TradeOperations(None, clients, {}, ClientPositionBook(), {}, set(), save_state_func=save_state,
+                                 execution_plans=execution_plans)
+    operations.update_client_balances({c.key: {"available": 1000.0} for c in clients})
+
+    timings = {}
+    started = time.perf_counter()
+    await operations.copy_trade("BTC-USDT", "SELL", "LONG", 0.1, 60000.0, 10, None, None, False)
+    timings["copy_trade"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await operations.close_partial_trades("BTC-USDT", 0.5, "SELL", "LONG")
+    timings["close_partial_trades"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await operations.close_trades("BTC-USDT")
+    timings["close_trades"] = time.perf_counter() - started
+
+    for client in clients:
+        await client["api"].close_session()
+    return timings, sink.orders
+
+
+def main():
+    parser = argparse.ArgumentParser(description="בנצ'מרק פיזור dry-run עם פרופיילינג")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--top", type=int, default=25, help="כמה פונקציות להציג בפרופיל")
+    parser.add_argument("--prepared", action="store_true", help="תוכניות ביצוע מוכנות מראש")
+    args = parser.parse_args()
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    timings, orders = asyncio.run(run_fanout(args.clients, args.prepared))
+    profiler.disable()
+
+    print(f"🧪 {args.clients} לקוחות, {orders} בקשות נחתמו ונבלעו")
+    for name, seconds in timings.items():
+        print(f"⏱️ {name}: {seconds:.2f}s")
+    pstats.Stats(profiler).sort_stats("tottime").print_stats(args.top)
+
+
+if __name__ == "__main__":
+    main()
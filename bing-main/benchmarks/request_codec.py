@@ -0,0 +1,86 @@
+import os
+import sys
+import hmac
+import json
+import time
+import hashlib
+import argparse
+from urllib.parse import quote
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils import json_codec
+from utils.apiutils import APIUtils
+from utils.request_builder import RequestBuilder
+from utils.bingx_api import BingXAPI
+
+ORDER_PATH = "/openApi/swap/v2/trade/order"
+
+# תגובת פקודה טיפוסית של BingX
+RESPONSE_BODY = json.dumps({"code": 0, "msg": "", "data": {"order": {
+    "symbol": "BTC-USDT", "orderId": 1735950529123455000, "side": "BUY", "positionSide": "LONG",
+    "type": "MARKET", "clientOrderID": "", "workingType": "MARK_PRICE", "quantity": "0.0012",
+    "price": "0", "stopPrice": "0", "status": "FILLED", "avgPrice": "60012.5",
+}}}).encode("utf-8")
+
+
+def order_params(i):
+    return {"symbol": "BTC-USDT", "side": "BUY", "positionSide": "LONG", "type": "MARKET",
+            "quantity": f"0.00{i % 9 + 1}", "recvWindow": "5000"}
+
+
+def legacy_request(api_key, secret_key, params_map):
+    """הנתיב הקודם של _send_request: parse_param, hmac.new מהסוד, quote ו-json הסטנדרטי"""
+    params_map["timestamp"] = str(int(time.time() * 1000))
+    params_str = APIUtils.parse_param(params_map)
+    signature = hmac.new(secret_key.encode(), params_str.encode(), hashlib.sha256).hexdigest()
+    url = f"{BingXAPI.APIURL}{ORDER_PATH}?{quote(params_str, safe='=&')}&signature={signature}"
+    headers = {"X-BX-APIKEY": api_key}
+    return url, headers, json.loads(RESPONSE_BODY.decode("utf-8"))
+
+
+def optimized_request(builder, params_map):
+    url, _ = builder.build(ORDER_PATH, params_map)
+    return url, builder.headers, json_codec.loads(RESPONSE_BODY)
+
+
+def bench(func, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="בנצ'מרק חתימה + קידוד + פענוח לבקשה בפיזור ללקוחות")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20, help="כמה סבבי פיזור למדוד")
+    args = parser.parse_args()
+
+    keys = [(f"key_{i}", f"secret_{i:064d}") for i in range(args.clients)]
+    builders = [RequestBuilder(BingXAPI.APIURL, api_key, secret_key) for api_key, secret_key in keys]
+
+    def legacy_fanout():
+        for i, (api_key, secret_key) in enumerate(keys):
+            legacy_request(api_key, secret_key, order_params(i))
+
+    def optimized_fanout():
+        for i, builder in enumerate(builders):
+            optimized_request(builder, order_params(i))
+
+    # בדיקת שקילות – אותה חתימה לאותו timestamp
+    legacy = order_params(1)
+    legacy["timestamp"] = "1700000000000"
+    legacy_str = "&".join(f"{k}={legacy[k]}" for k in sorted(legacy))
+    expected = hmac.new(keys[0][1].encode(), legacy_str.encode(), hashlib.sha256).hexdigest()
+    url, _ = builders[0].build(ORDER_PATH, order_params(1), timestamp=1700000000000)
+    assert url.endswith(f"&signature={expected}"), "החתימה המהירה שונה מהחתימה הקודמת"
+
+    requests = args.clients * args.rounds
+    print(f"🧪 {args.clients} לקוחות × {args.rounds} סבבים, backend={json_codec.BACKEND}")
+    for label, func in (("legacy", legacy_fanout), ("optimized", optimized_fanout)):
+        seconds = bench(func, args.rounds)
+        print(f"⏱️ {label:9}: {seconds / requests * 1e6:6.2f}µs לבקשה, {seconds / args.rounds * 1000:7.2f}ms לסבב פיזור")
+
+
+if __name__ == "__main__":
+    main()
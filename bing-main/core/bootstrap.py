@@ -0,0 +1,70 @@
+import time
+import asyncio
+from core.logger import logger
+from core.metrics import metrics
+from core.config import STARTUP_BUDGET_SECONDS
+
+# נקודת הייחוס לזמן האתחול – core.bootstrap הוא ה-import הראשון של start_server
+PROCESS_STARTED = time.perf_counter()
+
+
+class StartupTimer:
+    """
+    ⏱️ מדידת שלבי אתחול מתחילת התהליך (import, טעינת מצב, שליפת פוזיציות ראשונה).
+    כל שלב נרשם פעם אחת, כמדד startup_<phase>_seconds; חריגה מהתקציב נרשמת ללוג.
+    """
+
+    def __init__(self, budget_seconds=None, started=PROCESS_STARTED):
+        self.budget_seconds = budget_seconds
+        self.started = started
+        self.phases = {}
+        self._ready = None
+
+    def mark(self, phase):
+        if phase in self.phases:
+            return self.phases[phase]
+
+        elapsed = time.perf_counter() - self.started
+        self.phases[phase] = elapsed
+        metrics.set_gauge(f"startup_{phase}_seconds", elapsed)
+
+        if phase == "first_positions_poll":
+            if self.budget_seconds and elapsed > self.budget_seconds:
+                logger.warning(f"🐢 אתחול חרג מהתקציב: {elapsed:.2f}s עד שליפת הפוזיציות הראשונה (תקציב {self.budget_seconds}s) – {self.summary()}")
+            else:
+                logger.info(f"⏱️ אתחול: {elapsed:.2f}s עד שליפת הפוזיציות הראשונה")
+            if self._ready is not None:
+                self._ready.set()
+        return elapsed
+
+    def summary(self):
+        return ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in self.phases.items())
+
+    async def wait_ready(self, timeout=None):
+        """ממתין לשליפת הפוזיציות הראשונה (True) או ל-timeout (False)"""
+        if "first_positions_poll" in self.phases:
+            return True
+        if self._ready is None:
+            self._ready = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+startup = StartupTimer(STARTUP_BUDGET_SECONDS)
+
+
+async def warm_up_after_startup(timeout=60):
+    """
+    🔥 טעינת ספריות כבדות (aiogram) ב-thread נפרד, רק אחרי שהמסחר כבר רץ –
+    כך ההודעה הראשונה לטלגרם לא חוסמת את הלולאה, והאתחול לא מחכה לה.
+    """
+    await startup.wait_ready(timeout)
+    try:
+        import send_telegram_message
+        await asyncio.to_thread(send_telegram_message.get_bot)
+        startup.mark("deferred_warm_up")
+    except Exception as e:
+        logger.warning(f"⚠️ טעינה מושהית של הבוט נכשלה: {e}")
@@ -1,17 +1,86 @@
 import os
 
-# MongoDB configuration
-MONGO_URI = os.getenv("MONGO_URI")
-DB_NAME = os.getenv("DB_NAME")
 
-if not MONGO_URI or not DB_NAME:
-    raise Exception("❌ Environment variables MONGO_URI or DB_NAME are missing!")
+# MongoDB configuration + encryption key – נקראים בעצלות (PEP 562): ה-import לא נכשל,
+# רק גישה בפועל ל-MONGO_URI / DB_NAME / SECRET_KEY בלי משתני סביבה
+def __getattr__(name):
+    if name in ("MONGO_URI", "DB_NAME"):
+        value = os.getenv(name)
+        if not value:
+            raise Exception("❌ Environment variables MONGO_URI or DB_NAME are missing!")
+        return value
 
-# Load encryption key directly from environment variable
-SECRET_KEY = os.getenv("SECRET_KEY")
+    if name == "SECRET_KEY":
+        value = os.getenv("SECRET_KEY")
+        if not value:
+            raise Exception("❌ SECRET_KEY environment variable is missing!")
+        return value.encode()  # כ-bytes (עבור Fernet)
 
-if not SECRET_KEY:
-    raise Exception("❌ SECRET_KEY environment variable is missing!")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# If needed as bytes (e.g., for Fernet)
-SECRET_KEY = SECRET_KEY.encode()
+# 🔀 Multi-process sharding: 0 = תהליך יחיד (ברירת מחדל), N = מאסטר אחד + N תהליכי worker
+TRADE_SHARDS = int(os.getenv("TRADE_SHARDS", "0"))
+SHARD_IPC_PORT = int(os.getenv("SHARD_IPC_PORT", "8765"))
+# כמה שניות המאסטר מחכה ל-ack של workers מחוברים על כל אירוע (shard שלא אישר / לא מחובר מקבל אותו מהיומן כשיתחבר)
+SHARD_ACK_TIMEOUT = float(os.getenv("SHARD_ACK_TIMEOUT", "30"))
+
+# 🗂️ Cluster mode: 0 = כבוי, N = מספר מחיצות לקוחות שמתחלקות בין ה-nodes באמצעות leases במונגו
+# CLUSTER_NODE_ID – חובה במצב cluster, וקבוע בין הפעלות של אותו node (מסמך המצב שלו נשמר לפיו)
+CLUSTER_PARTITIONS = int(os.getenv("CLUSTER_PARTITIONS", "0"))
+CLUSTER_NODE_ID = os.getenv("CLUSTER_NODE_ID")
+CLUSTER_LEASE_TTL = int(os.getenv("CLUSTER_LEASE_TTL", "15"))
+
+# 🧑‍✈️ כמה מאסטרים בתהליך אחד: כל מסמכי MASTER (עם name), לקוח עוקב לפי שדה masters שלו.
+# session, לקוחות, תקציבי הלקוחות ומטמונים משותפים. לא משולב עם TRADE_SHARDS / CLUSTER_PARTITIONS / HA_MODE
+MULTI_MASTER = os.getenv("MULTI_MASTER", "0") == "1"
+
+# 🔥 Hot standby: שני מופעים או יותר, רק מחזיק ה-lease סוחר, השאר משקפים מצב ומשתלטים תוך ~HA_LEASE_TTL שניות
+HA_MODE = os.getenv("HA_MODE", "0") == "1"
+HA_LEASE_TTL = int(os.getenv("HA_LEASE_TTL", "10"))
+
+# 🔌 מאגר חיבורים ל-BingX
+POOL_LIMIT = int(os.getenv("POOL_LIMIT", "200"))
+POOL_LIMIT_PER_HOST = int(os.getenv("POOL_LIMIT_PER_HOST", "100"))
+POOL_PREWARM_CONNECTIONS = int(os.getenv("POOL_PREWARM_CONNECTIONS", "10"))
+
+# 🕵️ ביקורת סטיות פוזיציות ברקע
+AUDIT_CLIENTS_PER_MINUTE = int(os.getenv("AUDIT_CLIENTS_PER_MINUTE", "60"))
+AUDIT_AUTO_CORRECT = os.getenv("AUDIT_AUTO_CORRECT", "0") == "1"
+
+# 📼 הקלטת תגובות המאסטר לקובץ (ריק = כבוי), להשמעה עם replay_session.py
+RECORD_SESSION_PATH = os.getenv("RECORD_SESSION_PATH")
+
+# 🧪 Dry-run / shadow: "" = מסחר אמיתי, "null" = פקודות נבלעות, "simulator" = MockExchange מקומי
+DRY_RUN = os.getenv("DRY_RUN", "").strip().lower()
+
+# 📦 חלון (שניות) לאיחוד פקודות של אותו לקוח לבקשת batch אחת; 0 = כבוי (ברירת מחדל – החלון מוסיף השהיה לכל פקודה)
+ORDER_COALESCE_WINDOW = float(os.getenv("ORDER_COALESCE_WINDOW", "0"))
+
+# 🚦 קריאות API של המאסטר: מקביליות ותקציב בקשות לשנייה
+MASTER_CONCURRENCY = int(os.getenv("MASTER_CONCURRENCY", "3"))
+MASTER_REQUESTS_PER_SECOND = float(os.getenv("MASTER_REQUESTS_PER_SECOND", "5"))
+
+# 🕰️ סנכרון שעון מול BingX: כל כמה שניות למדוד offset, ו-recvWindow אחיד (ms) לכל הבקשות החתומות
+TIME_SYNC_INTERVAL = int(os.getenv("TIME_SYNC_INTERVAL", "60"))
+RECV_WINDOW_MS = int(os.getenv("RECV_WINDOW_MS", "5000"))
+
+# ⏱️ תקציב זמן אתחול (שניות) מתחילת התהליך ועד שליפת הפוזיציות הראשונה של המאסטר
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "5"))
+
+# 📈 בקר AIMD לפיזור ללקוחות: מקביליות התחלתית, מינימלית ומקסימלית (לקוחות בו-זמנית)
+FANOUT_INITIAL_CONCURRENCY = int(os.getenv("FANOUT_INITIAL_CONCURRENCY", "10"))
+FANOUT_MIN_CONCURRENCY = int(os.getenv("FANOUT_MIN_CONCURRENCY", "2"))
+FANOUT_MAX_CONCURRENCY = int(os.getenv("FANOUT_MAX_CONCURRENCY", "100"))
+
+# 🗓️ סדר הלקוחות בפיזור: rotating / random / list / tier_balance / tier_subscription
+FANOUT_ORDERING = os.getenv("FANOUT_ORDERING", "rotating").strip().lower()
+
+# 🔬 פרופיילינג של לולאת המסחר (כבוי כברירת מחדל): lag של ה-event loop, callbacks איטיים,
+# זמני קטעים (סבב סנכרון / worker / פיזור) ודגימת stack לפי דרישה מ-/admin/profile
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILING_LAG_INTERVAL = float(os.getenv("PROFILING_LAG_INTERVAL", "0.5"))
+PROFILING_SLOW_CALLBACK = float(os.getenv("PROFILING_SLOW_CALLBACK", "0.1"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+
+# 🛑 כיבוי מסודר (SIGTERM / deploy): כמה שניות לנקז פתיחות בתור ופיזורים שבאמצע לפני checkpoint ויציאה
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "20"))
@@ -1,22 +1,184 @@
+import os
+import json
+import time
+import queue
+import atexit
 import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
 
-# יצירת פורמט אחיד
+# יצירת פורמט אחיד (למסך)
 log_format = "%(asctime)s - %(levelname)s - %(message)s"
 
+# ⚙️ הגדרות הלוג נקראות ישירות מהסביבה – הלוגר נטען לפני (ובלי תלות ב-) core.config
+LOG_FILE = os.getenv("LOG_FILE", "trades.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "")  # למשל "midnight" – רוטציה לפי זמן במקום גודל
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "20"))
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "10"))
+
+
+# 🏷️ הקשר לוג (event / symbol / client) – עובר אוטומטית ל-tasks שנוצרים מתוכו
+_log_context = contextvars.ContextVar("log_context", default={})
+
+
+@contextmanager
+def log_context(**fields):
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def bind_log_context(**fields):
+    """קשירה בלי reset – לשימוש בתחילת coroutine שרץ כ-task משלו (למשל בתוך gather)"""
+    _log_context.set({**_log_context.get(), **fields})
+
+
+def current_log_context():
+    return _log_context.get()
+
+
+def new_event_id(kind, symbol):
+    return f"{kind}-{symbol}-{int(time.time() * 1000)}"
+
+
+def log_event(kind):
+    """דקורטור לפעולת פיזור (symbol ראשון): נותן event id לכל הלוגים שלה, אלא אם כבר יש אחד בהקשר"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, symbol, *args, **kwargs):
+            if "event" in _log_context.get():
+                return await func(self, symbol, *args, **kwargs)
+            with log_context(event=new_event_id(kind, symbol), symbol=symbol):
+                return await func(self, symbol, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ContextFilter(logging.Filter):
+    """מצמיד לרשומה את הקשר הלוג הנוכחי – רץ ב-thread של הקורא, לפני שהרשומה יוצאת לתור"""
+
+    def filter(self, record):
+        for key, value in _log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    🎲 דגימת הודעות חוזרות: עד burst רשומות לכל נקודת קריאה (קובץ + שורה) בכל חלון.
+    השאר נזרקות ונספרות; הרשומה הראשונה בחלון הבא נושאת את מספר המדוכאות.
+    ERROR ומעלה לא נדגמות לעולם.
+    """
+
+    def __init__(self, burst=20, window=10):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._sites = {}  # {(pathname, lineno): [window_start, count, suppressed]}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR or self.burst <= 0:
+            return True
+
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                suppressed = site[2] if site is not None else 0
+                self._sites[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+
+            if site[1] < self.burst:
+                site[1] += 1
+                return True
+
+            site[2] += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """📄 רשומת JSON אחת לשורה – event / symbol / client כשדות נפרדים"""
+
+    FIELDS = ("event", "symbol", "client", "suppressed")
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+            "logger": record.name,
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _build_file_handler(path=LOG_FILE):
+    # delay – הקובץ נפתח רק ברשומה הראשונה, כך שתהליך worker שעובר לקובץ משלו לא נוגע ב-LOG_FILE
+    if LOG_ROTATE_WHEN:
+        handler = TimedRotatingFileHandler(path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT,
+                                           encoding="utf-8", delay=True)
+    else:
+        handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                      encoding="utf-8", delay=True)
+    handler.setFormatter(JsonFormatter())
+    handler.setLevel(logging.INFO)
+    return handler
+
+
 # יצירת הלוגר הראשי
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
+logger.propagate = False  # בלי כפילויות דרך ה-root logger
 
-# 🔹 Handler 1 – לוג לקובץ
-file_handler = logging.FileHandler("trades.log", encoding="utf-8")
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(logging.Formatter(log_format))
+# 🔹 Handler 1 – לוג לקובץ (JSON, עם רוטציה)
+file_handler = _build_file_handler()
 
-# # 🔹 Handler 2 – לוג למסך (Render)
+# 🔹 Handler 2 – לוג למסך (Render)
 stream_handler = logging.StreamHandler()
 stream_handler.setLevel(logging.INFO)
 stream_handler.setFormatter(logging.Formatter(log_format))
 
-# הוספה של שני ה־handlers ללוגר
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
+# 🚚 הלולאה האסינכרונית רק מכניסה לתור; thread נפרד כותב לדיסק ולמסך
+log_queue = queue.SimpleQueue()
+queue_handler = QueueHandler(log_queue)
+queue_handler.addFilter(ContextFilter())
+queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_BURST, LOG_SAMPLE_WINDOW))
+logger.addHandler(queue_handler)
+
+log_listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+
+def use_process_log_file(suffix):
+    """
+    📁 קובץ לוג נפרד לתהליך (למשל worker של shard): trades.log → trades.shard0.log.
+    כמה תהליכים שמסובבים את אותו קובץ דורסים זה את זה ברוטציה – לכל תהליך קובץ ורוטציה משלו.
+    לקרוא בתחילת התהליך, לפני הרשומה הראשונה.
+    """
+    global file_handler
+    if LOG_FILE == os.devnull:
+        return
+    root, ext = os.path.splitext(LOG_FILE)
+    log_listener.stop()  # מנקז את מה שכבר בתור לקובץ הקודם
+    file_handler.close()
+    file_handler = _build_file_handler(f"{root}.{suffix}{ext}")
+    log_listener.handlers = (file_handler, stream_handler)
+    log_listener.start()
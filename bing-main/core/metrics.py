@@ -0,0 +1,54 @@
+import time
+import threading
+
+
+class MetricsRegistry:
+    """
+    📈 רישום מדדים פשוט בזיכרון – thread-safe (נקרא מ-Flask ונכתב מלולאת המסחר).
+    - counters: ספירה מצטברת
+    - gauges: ערך אחרון
+    - timings: count / sum / min / max / last
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.timings = {}
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            stat = self.timings.get(name)
+            if stat is None:
+                self.timings[name] = {"count": 1, "sum": value, "min": value, "max": value, "last": value}
+                return
+            stat["count"] += 1
+            stat["sum"] += value
+            stat["min"] = min(stat["min"], value)
+            stat["max"] = max(stat["max"], value)
+            stat["last"] = value
+
+    def snapshot(self):
+        with self._lock:
+            timings = {
+                name: {**stat, "avg": stat["sum"] / stat["count"]}
+                for name, stat in self.timings.items()
+            }
+            return {
+                "timestamp": time.time(),
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "timings": timings
+            }
+
+
+# מופע משותף לכל התהליך
+metrics = MetricsRegistry()
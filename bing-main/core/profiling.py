@@ -0,0 +1,144 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+from collections import Counter
+from core.logger import logger
+from core.metrics import metrics
+from core.config import PROFILING_ENABLED, PROFILING_LAG_INTERVAL, PROFILING_SLOW_CALLBACK, PROFILING_DIR
+
+
+class _NullSection:
+    """קטע שלא נמדד – מופע אחד משותף, בלי הקצאות כשהפרופיילינג כבוי"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SECTION = _NullSection()
+
+
+class _TimedSection:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        metrics.observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class LoopProfiler:
+    """
+    🔬 פרופיילינג ללולאת המסחר. כבוי כברירת מחדל – section() מחזיר אז context ריק ו-attach() לא מתקין כלום.
+
+    כשהוא דולק:
+    - event_loop_lag_seconds: באיחור של sleep(interval) מעבר למתוכנן
+    - callbacks איטיים: כל callback של הלולאה שרץ מעל slow_callback שניות נרשם ללוג ול-slow_callbacks
+    - section(name): זמן קיר של קטע קוד (סבב סנכרון, עבודת worker, פיזור, לקוח בפיזור) כ-profile_<name>_seconds
+    - capture(): דגימת ה-stack של thread המסחר לקובץ folded (flamegraph.pl / speedscope)
+    """
+
+    def __init__(self, enabled=False, lag_interval=0.5, slow_callback=0.1, output_dir="profiles"):
+        self.enabled = enabled
+        self.lag_interval = lag_interval
+        self.slow_callback = slow_callback
+        self.output_dir = output_dir
+        self.thread_id = None  # ה-thread שמריץ את לולאת המסחר
+        self._capture_lock = threading.Lock()
+        self._callbacks_patched = False
+
+    def section(self, name):
+        if not self.enabled:
+            return _NULL_SECTION
+        return _TimedSection(f"profile_{name}_seconds")
+
+    def attach(self):
+        """נקרא מתוך thread המסחר (sync_trades) – ה-thread שנדגם ב-capture; מדידת ה-lag מורצת ע"י הקורא"""
+        self.thread_id = threading.get_ident()
+        if not self.enabled:
+            return
+        self._patch_callbacks()
+        logger.info(f"🔬 פרופיילינג פעיל: lag כל {self.lag_interval}s, callback איטי מעל {self.slow_callback}s")
+
+    async def monitor_lag(self):
+        while True:
+            expected = time.perf_counter() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            lag = max(time.perf_counter() - expected, 0.0)
+            metrics.observe("event_loop_lag_seconds", lag)
+            metrics.set_gauge("event_loop_lag_last_seconds", lag)
+
+    def _patch_callbacks(self):
+        # כמו loop.slow_callback_duration של debug mode, בלי שאר התקורה של debug mode
+        if self._callbacks_patched:
+            return
+        self._callbacks_patched = True
+        original_run = asyncio.events.Handle._run
+        profiler = self
+
+        def timed_run(handle):
+            started = time.perf_counter()
+            original_run(handle)
+            elapsed = time.perf_counter() - started
+            if elapsed >= profiler.slow_callback:
+                metrics.inc("slow_callbacks")
+                metrics.observe("slow_callback_seconds", elapsed)
+                logger.warning(f"🐢 callback איטי ({elapsed * 1000:.0f}ms) ב-{threading.current_thread().name}: {handle!r}")
+
+        asyncio.events.Handle._run = timed_run
+
+    def capture(self, seconds=10.0, interval=0.005, thread_id=None):
+        """
+        📸 דגימת ה-stack של thread המסחר כל interval שניות במשך seconds, מתוך ה-thread הקורא.
+        נכתב ל-<output_dir>/trade-loop-<time>.folded (שורה לכל stack: "root;...;leaf count"). מחזיר (נתיב, מספר דגימות).
+        """
+        thread_id = thread_id or self.thread_id
+        if thread_id is None:
+            raise RuntimeError("לולאת המסחר לא רצה בתהליך הזה")
+        if not self._capture_lock.acquire(blocking=False):
+            raise RuntimeError("דגימה אחרת כבר רצה")
+
+        try:
+            stacks = Counter()
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is None:
+                    break
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks[";".join(reversed(stack))] += 1
+                del frame
+                time.sleep(interval)
+
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"trade-loop-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+            samples = sum(stacks.values())
+            metrics.inc("profile_captures")
+            logger.info(f"📸 פרופיל נשמר ל-{path} ({samples} דגימות)")
+            return path, samples
+        finally:
+            self._capture_lock.release()
+
+
+# מופע משותף לתהליך
+profiler = LoopProfiler(PROFILING_ENABLED, PROFILING_LAG_INTERVAL, PROFILING_SLOW_CALLBACK, PROFILING_DIR)
@@ -13,3 +13,12 @@ def load_apis_from_db():
         "master": master,
         "clients": clients
     }
+
+
+def load_masters_from_db(manager=None):
+    """🧑‍✈️ כל המאסטרים וכל הלקוחות – החלוקה למנויים לפי שדה masters של הלקוח (ראו MasterGroup)"""
+    manager = manager or SecureAPIManager()
+    return {
+        "masters": manager.get_masters(),
+        "clients": manager.get_all_clients()
+    }
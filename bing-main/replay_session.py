@@ -0,0 +1,105 @@
+import asyncio
+import argparse
+import time
+import send_telegram_message
+from core.logger import logger
+from services.trade_manager import TradeManager
+from services.session_recorder import ReplayBingXAPI
+from utils.mock_exchange import MockExchange, MockBingXAPI
+
+
+class MemoryStateStore:
+    """מצב בזיכרון במקום מונגו – השמעה לא נוגעת במסד הנתונים"""
+
+    def __init__(self):
+        self.state_id = "replay"
+        self.doc = {}
+
+    async def load_state(self):
+        return dict(self.doc)
+
+    async def save_state(self, state: dict):
+        self.doc = state
+
+
+async def replay(path, speed=1.0, client_count=100, balance=1000.0, grace=15):
+    """
+    ▶️ משמיע סשן מאסטר מוקלט דרך TradeManager מול MockExchange
+    ומחזיר דוח תפוקה והשהיה (מהופעת פוזיציה אצל המאסטר ועד הפקודות ללקוחות).
+    """
+    send_telegram_message.disable_telegram()
+
+    exchange = MockExchange(default_balance=balance)
+    master_api = ReplayBingXAPI(path, speed=speed)
+    config = {
+        "master": {"api_key": "replay", "secret_key": "replay"},
+        "clients": [
+            {"name": f"client_{i}", "api_key": f"key_{i}", "secret_key": f"secret_{i}"}
+            for i in range(client_count)
+        ]
+    }
+
+    manager = TradeManager(
+        config=config,
+        mongo_state=MemoryStateStore(),
+        master_api=master_api,
+        api_factory=lambda api_key, secret_key, session=None: MockBingXAPI(api_key, secret_key, exchange, session=session)
+    )
+    manager.trade_operations.update_client_balances({
+        client["name"].lower(): {"available": balance} for client in config["clients"]
+    })
+
+    started = time.perf_counter()
+    master_api.start()
+    sync_task = asyncio.create_task(manager.sync_trades())
+
+    while not master_api.finished():
+        await asyncio.sleep(0.5)
+    await asyncio.sleep(grace)  # זמן לפיזורים שעדיין רצים
+
+    # כיבוי מסודר כמו ב-deploy: עצירת הזיהוי, ניקוז ושמירה
+    manager.request_stop()
+    await sync_task
+    await manager.close()
+    elapsed = time.perf_counter() - started
+
+    latencies = {
+        symbol: {
+            "first_order": exchange.first_order_at[symbol] - seen_at,
+            "last_order": exchange.last_order_at[symbol] - seen_at,
+        }
+        for symbol, seen_at in master_api.first_seen.items()
+        if symbol in exchange.first_order_at
+    }
+    return {
+        "recording_seconds": master_api.duration,
+        "wall_seconds": elapsed,
+        "orders": len(exchange.orders),
+        "orders_per_second": len(exchange.orders) / elapsed if elapsed else 0,
+        "latency_by_symbol": latencies,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="השמעת סשן מאסטר מוקלט מול הבורסה המדומה")
+    parser.add_argument("recording", help="קובץ .jsonl.gz שהוקלט עם RECORD_SESSION_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="מהירות השמעה (1 = זמן אמת)")
+    parser.add_argument("--clients", type=int, default=100, help="מספר לקוחות מדומים")
+    parser.add_argument("--balance", type=float, default=1000.0, help="יתרה זמינה לכל לקוח")
+    args = parser.parse_args()
+
+    report = asyncio.run(replay(args.recording, args.speed, args.clients, args.balance))
+
+    logger.info(
+        f"▶️ השמעה הסתיימה: {report['recording_seconds']:.1f}s מוקלטות ב-{report['wall_seconds']:.1f}s, "
+        f"{report['orders']} פקודות ({report['orders_per_second']:.1f}/s)"
+    )
+    for symbol, latency in report["latency_by_symbol"].items():
+        logger.info(
+            f"⏱️ {symbol}: פקודה ראשונה אחרי {latency['first_order']:.3f}s, "
+            f"אחרונה אחרי {latency['last_order']:.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
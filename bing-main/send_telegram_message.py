@@ -1,7 +1,4 @@
 import logging
-from aiogram import Bot
-from aiogram.types import Message
-from aiogram.dispatcher.router import Router
 import asyncio
 
 # ✅ טוקן מה-BotFather
@@ -13,19 +10,58 @@ CHAT_IDS = [
     1880599224      # משתמש נוסף
 ]
 
-# ✅ יצירת אובייקט הבוט
-bot = Bot(token=TELEGRAM_BOT_TOKEN)
-router = Router()  # aiogram 3.x
+# ✅ אובייקט הבוט – aiogram כבד לטעינה (שניות), ולכן נטען ונבנה רק כשצריך
+_bot = None
+
+
+def get_bot():
+    global _bot
+    if _bot is None:
+        from aiogram import Bot
+        _bot = Bot(token=TELEGRAM_BOT_TOKEN)
+    return _bot
+
+# 🔕 ניתן לכבות שליחה בפועל (השמעת סשן / בדיקות עומס) – ההודעות עדיין נבנות ונרשמות ללוג
+TELEGRAM_ENABLED = True
+MESSAGE_PREFIX = ""
+
+
+def disable_telegram():
+    global TELEGRAM_ENABLED
+    TELEGRAM_ENABLED = False
+
+
+def set_message_prefix(prefix):
+    """🏷️ קידומת לכל הודעה (למשל סימון dry-run)"""
+    global MESSAGE_PREFIX
+    MESSAGE_PREFIX = prefix
 
 async def send_telegram_message(message: str):
     """📌 שולח הודעה לטלגרם לכל המשתמשים ברשימה"""
+    if not TELEGRAM_ENABLED:
+        logging.debug(f"🔕 טלגרם כבוי – הודעה לא נשלחה: {message}")
+        return
+
     try:
+        bot = get_bot()
         for chat_id in CHAT_IDS:
-            await bot.send_message(chat_id, f"🔔 <b>עדכון מערכת:</b>\n{message}", parse_mode="HTML")
+            await bot.send_message(chat_id, f"{MESSAGE_PREFIX}🔔 <b>עדכון מערכת:</b>\n{message}", parse_mode="HTML")
         print("✅ הודעה נשלחה לכל המשתמשים בטלגרם")
     except Exception as e:
         logging.error(f"❌ שגיאה בשליחת הודעה לטלגרם: {e}")
 
+
+async def close_bot():
+    """🔌 סגירת ה-session של הבוט בכיבוי (אם נבנה בכלל)"""
+    global _bot
+    if _bot is None:
+        return
+    try:
+        await _bot.session.close()
+    except Exception as e:
+        logging.warning(f"⚠️ שגיאה בסגירת session של בוט הטלגרם: {e}")
+    _bot = None
+
 # ✅ בדיקה ידנית
 if __name__ == "__main__":
     asyncio.run(send_telegram_message("🚀 הודעת בדיקה – האם זה עובד?"))
@@ -1,161 +1,135 @@
 import asyncio
-import time
 from core.logger import logger
+from services.master_executor import get_master_executor
+from core.config import MASTER_CONCURRENCY, MASTER_REQUESTS_PER_SECOND
+from utils.async_cache import AsyncTTLCache, CacheError
 
 
-class BalanceManager:
-    def __init__(self):
-        self.balance_cache = {}  # {client_name: (balance_data, timestamp)}
-        self.open_orders_cache = {}  # {"symbol": (orders, timestamp)}
-        self.master_positions_cache = (None, 0)
-
-                # ✅ תור לקריאות API של המאסטר
-        self.master_api_queue = asyncio.Queue()
-        self.api_worker_started = False
-
-
-
-    async def get_cached_balance(self, client, asset="USDT", ttl=20):
-        name = client.get("name", "לא ידוע")
-        now = time.time()
-
-        # ודא שהמילון של ה-locks קיים
-        if not hasattr(self, "balance_locks"):
-            self.balance_locks = {}
-
-        # צור lock אם אין
-        if name not in self.balance_locks:
-            self.balance_locks[name] = asyncio.Lock()
+def _valid_balance(balance):
+    return isinstance(balance, dict) and "available" in balance
 
-        # שליפה מהקאש לפני כניסה ל-lock
-        cached = self.balance_cache.get(name)
-        if cached and now - cached[1] < ttl:
-            return cached[0]
 
-        async with self.balance_locks[name]:
-            # בדיקה חוזרת לאחר ההמתנה ל-lock
-            cached = self.balance_cache.get(name)
-            if cached and now - cached[1] < ttl:
-                return cached[0]
+def _valid_positions(positions):
+    return isinstance(positions, dict) and positions.get("code") == 0 and "data" in positions
 
-            try:
-                api = client.get("api")
-                if api is None:
-                    raise ValueError("🔐 אין API תקף ללקוח")
-
-                # תוסיף timeout למקרה של תקיעה ב־API
-                balance_data = await asyncio.wait_for(
-                    api.get_balance_details(asset),
-                    timeout=5
-                )
 
-                self.balance_cache[name] = (balance_data, time.time())
-                #logger.info(f"✅ balance עודכן ללקוח {name}")
-                return balance_data
+def new_balance_cache():
+    """מטמון יתרות הלקוחות – משותף לכל המאסטרים בתהליך (ראו SharedResources)"""
+    return AsyncTTLCache(
+        "balance", ttl=20, max_entries=10000, stale_ttl=40, negative_ttl=5, timeout=5, validate=_valid_balance
+    )
 
-            except asyncio.TimeoutError:
-                logger.warning(f"⏱️ Timeout בקבלת balance מלקוח {name}")
-                return {"available": 0}
 
-            except Exception as e:
-                logger.warning(f"⚠️ שגיאה בקבלת balance מלקוח {name}: {e}")
-                return {"available": 0}
+class BalanceManager:
+    """
+    💰 יתרות, open orders ופוזיציות של המאסטר – דרך AsyncTTLCache.
+    כישלון מוחזר כ-CacheError (falsy) ולא כיתרה 0 מזויפת, כך שהקוראים יכולים להבדיל ביניהם.
+
+    מטמוני המאסטר ומבצע הקריאות שלו שייכים למאסטר אחד; מטמון היתרות יכול להיות משותף (balance_cache),
+    ואז master_name מבדיל בין יתרות המאסטרים בתוכו.
+    """
+
+    def __init__(self, balance_cache=None, master_executor=None, master_name="master"):
+        self.balance_cache = balance_cache or new_balance_cache()
+        self.master_name = master_name
+        self.open_orders_cache = AsyncTTLCache(
+            "open_orders", ttl=12, max_entries=512, stale_ttl=30, negative_ttl=2, timeout=5
+        )
+        self.all_open_orders_cache = AsyncTTLCache(
+            "all_open_orders", ttl=12, max_entries=4, stale_ttl=30, negative_ttl=2, timeout=5,
+            validate=lambda orders: orders is not None
+        )
+        # stale_ttl – בזמן שה-prefetch ברקע מרענן, הקוראים מקבלים מיד את התמונה האחרונה שהושלמה
+        self.master_positions_cache = AsyncTTLCache(
+            "master_positions", ttl=0.8, max_entries=4, stale_ttl=5, negative_ttl=0.5, validate=_valid_positions
+        )
+
+        # ✅ מבצע משותף לקריאות API של המאסטר (מקבילי, בתקציב קצב, עם single-flight)
+        self.master_executor = master_executor or get_master_executor(MASTER_CONCURRENCY, MASTER_REQUESTS_PER_SECOND)
+
+    async def get_cached_balance(self, client, asset="USDT", ttl=20, via_master_executor=False):
+        """dict עם available / equity / used / balance, או CacheError בכישלון"""
+        name = client.get("name", "לא ידוע")
+        api = client.get("api")
+        if api is None:
+            return CacheError(ValueError(f"🔐 אין API תקף ללקוח {name}"))
 
+        if via_master_executor:
+            loader = lambda: self.enqueue_master_api_call(lambda: api.get_balance_details(asset), key=f"balance:{asset}")
+        else:
+            loader = lambda: api.get_balance_details(asset)
 
+        return await self.balance_cache.get((name, asset), loader, ttl=ttl)
 
     async def get_cached_open_orders(self, master_api, symbol, ttl=12):
-        now = time.time()
-
-        # ודא שהמילון של locks קיים
-        if not hasattr(self, "open_orders_locks"):
-            self.open_orders_locks = {}
+        """(leverage, tp, sl) של סימבול מה-open orders של המאסטר, או CacheError"""
+        loader = lambda: self.enqueue_master_api_call(
+            lambda: master_api.get_trade_parameters(symbol), key=f"open_orders:{symbol}"
+        )
+        return await self.open_orders_cache.get(symbol, loader, ttl=ttl)
 
-        # יצירת lock חדש אם לא קיים
-        if symbol not in self.open_orders_locks:
-            self.open_orders_locks[symbol] = asyncio.Lock()
-
-        # ניסיון ראשון לקרוא מהקאש לפני המתנה ל-lock
-        cached = self.open_orders_cache.get(symbol)
-        if cached and now - cached[1] < ttl:
-            return cached[0]
-
-        async with self.open_orders_locks[symbol]:
-            # בדיקה חוזרת לאחר ההמתנה ל-lock
-            cached = self.open_orders_cache.get(symbol)
-            if cached and now - cached[1] < ttl:
-                return cached[0]
-
-            try:
-                # הפעלת הקריאה עם timeout כדי למנוע תקיעות
-                orders = await asyncio.wait_for(
-                    self.enqueue_master_api_call(lambda: master_api.get_trade_parameters(symbol)),
-                    timeout=5
-                )
-                self.open_orders_cache[symbol] = (orders, time.time())
-                #logger.info(f"✅ openOrders עודכנו עבור {symbol}")
-                return orders
-
-            except asyncio.TimeoutError:
-                logger.warning(f"⏱️ Timeout בשליפת openOrders עבור {symbol}")
-                return []
-
-            except Exception as e:
-                logger.warning(f"⚠️ שגיאה בשליפת openOrders עבור {symbol}: {e}")
-                return []
+    async def get_cached_all_open_orders(self, master_api, ttl=12):
+        """כל ה-open orders של המאסטר בקריאה אחת, מאונדקסים לפי סימבול: {symbol: [orders]}, או CacheError"""
 
+        async def load():
+            orders = await self.enqueue_master_api_call(lambda: master_api.get_all_open_orders(), key="open_orders:all")
+            if orders is None:
+                return None
+            by_symbol = {}
+            for order in orders:
+                by_symbol.setdefault(order.get("symbol"), []).append(order)
+            return by_symbol
 
+        return await self.all_open_orders_cache.get("all", load, ttl=ttl)
 
+    def _master_positions_loader(self, master_api):
+        return lambda: self.enqueue_master_api_call(lambda: master_api.get_positions(), key="positions")
 
     async def get_cached_master_positions(self, master_api, ttl=0.8):
-        now = time.time()
-        positions, last_time = self.master_positions_cache
-
-        if positions and now - last_time < ttl:
-            return positions
-
-        try:
-            positions = await self.enqueue_master_api_call(lambda: master_api.get_positions())
-            self.master_positions_cache = (positions, now)
-            return positions
-
-        except Exception as e:
-            logger.warning(f"⚠️ שגיאה בעת שליפת פוזיציות מהמאסטר: {e}")
-            return []  # כדי לא לשבור את הזרימה
-
+        """תגובת positions של המאסטר (code == 0), או CacheError"""
+        positions, _ = await self.get_master_positions_snapshot(master_api, ttl)
+        return positions
+
+    async def get_master_positions_snapshot(self, master_api, ttl=0.8):
+        """
+        (positions, staleness_seconds) – התמונה האחרונה שהושלמה, בלי להמתין לרשת
+        (חוץ מהפעם הראשונה או אחרי כשל ממושך).
+        """
+        return await self.master_positions_cache.get_with_age("positions", self._master_positions_loader(master_api), ttl=ttl)
+
+    async def run_master_positions_prefetch(self, master_api, ttl=0.8, lead=0.2):
+        """🔄 רענון פוזיציות המאסטר ברקע lead שניות לפני שהתמונה פגה"""
+        loader = self._master_positions_loader(master_api)
+        refresh_at = max(ttl - lead, 0.05)
 
-
-
-    async def enqueue_master_api_call(self, coro_func):
-        """מכניס קריאה לתור ומחזיר את התוצאה"""
-        try:
-            fut = asyncio.get_event_loop().create_future()
-            await self.master_api_queue.put((coro_func, fut))
-
-            # הפעלת עובד התור רק פעם אחת
-            if not self.api_worker_started:
-                asyncio.create_task(self.api_worker())
-                self.api_worker_started = True
-
-            return await fut
-
-        except Exception as e:
-            logger.error(f"🚫 שגיאה בהכנסת קריאה לתור המאסטר: {e}")
-            raise e  # חשוב כדי שהשגיאה תמשיך למי שקרא לפונקציה
-
-    async def api_worker(self):
-        """עובד שמבצע קריאות מהתור אחת כל X זמן"""
         while True:
             try:
-                coro_func, fut = await self.master_api_queue.get()
-                try:
-                    result = await coro_func()
-                    fut.set_result(result)
-                except Exception as e:
-                    logger.warning(f"⚠️ שגיאה בביצוע קריאת API מהממתין בתור: {e}")
-                    fut.set_exception(e)
-                finally:
-                    await asyncio.sleep(0.3)  # ⚙️ שליטה על קצב הקריאות (5 בשנייה)
-                    self.master_api_queue.task_done()
-
+                entry = self.master_positions_cache.peek("positions")
+                age = entry[1] if entry is not None else None
+                if age is None or age >= refresh_at:
+                    result = await self.master_positions_cache.refresh("positions", loader)
+                    if isinstance(result, CacheError):
+                        await asyncio.sleep(self.master_positions_cache.negative_ttl)
+                    continue
+                await asyncio.sleep(refresh_at - age)
+
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                logger.error(f"🚫 שגיאה כללית בתור ה־API של המאסטר: {e}", exc_info=True)
+                logger.warning(f"⚠️ שגיאה ב-prefetch של פוזיציות המאסטר: {e}")
+                await asyncio.sleep(ttl)
+
+    async def get_cached_master_balance(self, master_api, asset="USDT", ttl=20):
+        """יתרת המאסטר – דרך מבצע המאסטר המשותף (ולא ישירות כמו ללקוחות)"""
+        master_client = {"name": self.master_name, "api": master_api}
+        return await self.get_cached_balance(master_client, asset, ttl=ttl, via_master_executor=True)
+
+    async def enqueue_master_api_call(self, coro_func, key=None):
+        """מריץ קריאת API של המאסטר דרך המבצע המשותף ומחזיר את התוצאה (key = איחוד קריאות זהות)"""
+        return await self.master_executor.call(coro_func, key=key)
+
+    def cache_stats(self):
+        return {
+            cache.name: cache.stats()
+            for cache in (self.balance_cache, self.open_orders_cache, self.all_open_orders_cache, self.master_positions_cache)
+        }
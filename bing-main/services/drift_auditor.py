@@ -0,0 +1,164 @@
+import time
+import asyncio
+from collections import deque
+from core.logger import logger
+from core.metrics import metrics
+from send_telegram_message import send_telegram_message
+
+
+class DriftAuditor:
+    """
+    🕵️ מבקר רקע שדוגם לקוחות בסבב מתגלגל ומשווה את הפוזיציה בפועל לפוזיציה הצפויה.
+
+    היחס הצפוי לפוזיציית המאסטר הוא client_positions / qty של המאסטר – סגירות חלקיות
+    מקטינות את שניהם באותו אחוז, כך שסטייה ביחס = כמות שלא בוצעה כמו שביקשנו.
+    ברירת המחדל היא התראה + עדכון המצב לכמות האמיתית; עם auto_correct נשלחות גם פקודות תיקון.
+
+    master_view – async callable שמעדכן את position_diff של ה-manager לפני כל ביקורת (כשאין sync_trades
+    באותו תהליך, למשל worker של shard); False = אין תמונת מאסטר עדכנית והלקוח לא נבדק בסבב הזה.
+    """
+
+    def __init__(self, manager, reconciler, clients_per_minute=60, tolerance_pct=0.02, auto_correct=False,
+                 master_view=None):
+        self.manager = manager
+        self.reconciler = reconciler
+        self.clients_per_minute = clients_per_minute
+        self.tolerance_pct = tolerance_pct
+        self.auto_correct = auto_correct
+        self.master_view = master_view
+
+        self.cursor = 0
+        self.audited_at = deque()  # חותמות זמן של ביקורות בדקה האחרונה
+
+    def _next_client(self):
+        clients = self.manager.clients
+        if not clients:
+            return None
+        self.cursor %= len(clients)
+        client = clients[self.cursor]
+        self.cursor += 1
+        return client
+
+    def _record_coverage(self):
+        now = time.time()
+        self.audited_at.append(now)
+        while self.audited_at and now - self.audited_at[0] > 60:
+            self.audited_at.popleft()
+        metrics.set_gauge("audit_clients_per_minute", len(self.audited_at))
+
+    async def audit_client(self, client):
+        client_name = client.key
+        if client_name in self.manager.shared_clients:
+            # עוקב גם אחרי מאסטר אחר – הכמות בבורסה היא סכום של כמה מאסטרים
+            metrics.inc("audit_skipped_shared_clients")
+            return
+        can_trade = self.manager.trade_operations.can_trade
+        if can_trade is not None and not can_trade(client_name):
+            # ה-lease על הלקוח פג – תיקון עכשיו עלול להתנגש בבעלים החדש
+            metrics.inc("audit_skipped_not_owned")
+            return
+        if self.master_view is not None and not await self.master_view():
+            metrics.inc("audit_skipped_no_master_view")
+            return
+        try:
+            actual = await self.reconciler.fetch_client_positions(client)
+        except Exception as e:
+            logger.warning(f"⚠️ שגיאה בביקורת פוזיציות ללקוח {client_name}: {e}")
+            actual = None
+
+        if actual is None:
+            metrics.inc("audit_failures")
+            return
+
+        self._record_coverage()
+        stored = self.manager.client_positions.get(client_name, {})
+        managed = set(stored) | set(self.manager.copied_trades)
+        changed = False
+
+        for symbol in managed:
+            expected_qty = float(stored.get(symbol, 0) or 0)
+            actual_qty = float(actual.get(symbol, 0) or 0)
+            if expected_qty == actual_qty == 0:
+                continue
+
+            if expected_qty == 0 and self._copied_master_position(symbol) is not None:
+                # לא נרשמה כמות צפויה (הלקוח דולג / מצב חסר) בזמן שהמאסטר מחזיק – אין ממה לגזור עודף:
+                # רק דיווח, בלי פקודה ובלי עדכון המצב
+                metrics.inc("audit_untracked_positions")
+                logger.warning(
+                    f"🕵️ ל-{client_name} יש {actual_qty} ב-{symbol} שהמאסטר מחזיק, אבל לא נרשמה כמות צפויה – "
+                    f"לא מתקנים, נדרשת בדיקה ידנית"
+                )
+                continue
+
+            drift_pct = abs(actual_qty - expected_qty) / expected_qty if expected_qty else 1.0
+            metrics.observe("audit_drift_pct", drift_pct)
+            if drift_pct <= self.tolerance_pct:
+                continue
+
+            metrics.inc("audit_drifts")
+            changed = True
+            await self._handle_drift(client, client_name, symbol, expected_qty, actual_qty, drift_pct)
+
+        if changed:
+            await self.manager.save_state()
+
+    async def _handle_drift(self, client, client_name, symbol, expected_qty, actual_qty, drift_pct):
+        master_qty = self.manager.position_diff.symbol_qty(symbol)
+        expected_ratio = expected_qty / master_qty if master_qty else 0
+        actual_ratio = actual_qty / master_qty if master_qty else 0
+
+        logger.warning(
+            f"🕵️ סטייה אצל {client_name} על {symbol}: צפוי {expected_qty} (יחס {expected_ratio:.6f}), "
+            f"בפועל {actual_qty} (יחס {actual_ratio:.6f}), סטייה {drift_pct * 100:.2f}%"
+        )
+
+        corrected = False
+        if self.auto_correct and actual_qty > 0:
+            master_position = self._copied_master_position(symbol)
+            if master_position is None:
+                # המאסטר כבר לא מחזיק את הסימבול – פוזיציה יתומה אצל הלקוח
+                response = await client.api.close_all_positions(symbol)
+                corrected = isinstance(response, dict) and response.get("code") == 0
+                if corrected:
+                    actual_qty = 0
+            elif expected_qty > 0 and actual_qty > expected_qty:
+                excess = actual_qty - expected_qty
+                response = await client.api.close_position_partially(
+                    symbol, excess, master_position.side, master_position.position_side
+                )
+                corrected = isinstance(response, dict) and response.get("code") == 0
+                if corrected:
+                    actual_qty = expected_qty
+
+        if corrected:
+            metrics.inc("audit_corrections")
+
+        # המצב תמיד משקף את מה שקיים בפועל, כדי שסגירות חלקיות יחושבו נכון
+        self.reconciler.repair(self.manager.client_positions, client_name, [(symbol, expected_qty, actual_qty)])
+
+        await send_telegram_message(
+            f"🕵️ <b>סטיית פוזיציה</b> אצל <b>{client_name}</b> על {symbol}\n"
+            f"📌 צפוי: {expected_qty}\n📌 בפועל: {actual_qty}\n"
+            f"{'🔧 בוצע תיקון אוטומטי' if corrected else 'ℹ️ המצב עודכן ללא פקודת תיקון'}"
+        )
+
+    def _copied_master_position(self, symbol):
+        """הפוזיציה של המאסטר בצד שהועתק ללקוחות (None אם המאסטר כבר לא מחזיק אותו)"""
+        copied = self.manager.copied_trades.get(symbol)
+        for (position_symbol, position_side), record in self.manager.position_diff.positions.items():
+            if position_symbol == symbol and (copied is True or copied == position_side):
+                return record
+        return None
+
+    async def run(self):
+        """🔁 ביקורת של לקוח אחד בכל פעם, בקצב clients_per_minute"""
+        interval = 60 / max(self.clients_per_minute, 1)
+        while True:
+            try:
+                client = self._next_client()
+                if client is not None:
+                    await self.audit_client(client)
+            except Exception as e:
+                logger.exception(f"❌ שגיאה בלולאת ביקורת הפוזיציות: {e}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,204 @@
+import time
+import asyncio
+from collections import OrderedDict
+from decimal import Decimal, ROUND_DOWN
+from core.logger import logger
+from core.metrics import metrics
+from utils.bingx_api import BingXAPI
+from utils.rate_limiter import RateLimiter
+
+POSITION_SIDES = ("LONG", "SHORT")
+
+# הודעות שגיאה מהבורסה שמרמזות שהמינוף / margin בפועל אצל הלקוח שונה ממה שסומן (למשל שונה ידנית באפליקציה)
+STALE_SETTINGS_HINTS = ("leverage", "margin")
+
+
+class ExecutionPlan:
+    """📋 תוכנית ביצוע ללקוח + סימבול: תבנית פקודה מוכנה, דיוק כמות, ומה כבר הוגדר אצל הלקוח"""
+
+    __slots__ = ("symbol", "order_templates", "quantity_precision", "leverage_ready", "margin_ready")
+
+    def __init__(self, symbol, order_templates, quantity_precision, leverage_ready, margin_ready):
+        self.symbol = symbol
+        self.order_templates = order_templates
+        self.quantity_precision = quantity_precision
+        self.leverage_ready = leverage_ready
+        self.margin_ready = margin_ready
+
+    def round_quantity(self, qty):
+        """עיגול כלפי מטה לדיוק של החוזה – לא לחרוג מהיתרה (ב-Decimal: floor על float מוריד 0.29 ל-0.28)"""
+        step = Decimal(1).scaleb(-self.quantity_precision)
+        return float(Decimal(str(qty)).quantize(step, rounding=ROUND_DOWN))
+
+
+class ExecutionPlanCache:
+    """
+    ⚡ תוכניות ביצוע מוכנות מראש לסימבולים שהמאסטר סחר בהם לאחרונה.
+
+    ברקע, לכל לקוח ולכל סימבול כזה: מינוף ו-margin mode מוגדרים מראש לפי ההגדרות האחרונות של המאסטר,
+    דיוק הכמות נטען ממפרט החוזים ותבניות הפקודה (LONG / SHORT) נבנות פעם אחת.
+    כשמגיע אירוע פתיחה שתואם לתוכנית – נשארים רק כמות ו-timestamp; אחרת חוזרים למסלול המלא.
+
+    הרענון ברקע שולח קריאות רק כשמשהו השתנה: המאסטר שינה מינוף / margin, או שסימון בוטל.
+    שגיאת פקודה שמזכירה leverage / margin מבטלת את מה שסומן ללקוח ולסימבול – הפתיחה הבאה עוברת
+    במסלול המלא והרענון מחיל מחדש פעם אחת. margin mode שהבורסה דחתה (למשל כשללקוח פוזיציה פתוחה)
+    לא נשלח שוב עד שהמאסטר משנה את ה-margin mode.
+
+    shared – cache של מאסטר אחר באותו תהליך: המינוף / margin שהוחלו אצל הלקוחות, מפרט החוזים,
+    התבניות ותקציב הקצב משותפים (מצב הלקוח בבורסה אחד), והסימבולים האחרונים והלקוחות – לכל מאסטר בנפרד.
+    """
+
+    def __init__(self, master_api, clients_getter, max_symbols=10, refresh_interval=30,
+                 contracts_ttl=3600, requests_per_second=50, concurrency=20, shared=None):
+        self.master_api = master_api
+        self.clients_getter = clients_getter
+        self.max_symbols = max_symbols
+        self.refresh_interval = refresh_interval
+        self.contracts_ttl = contracts_ttl
+        # הרענון ברקע לא אמור להתחרות במסחר – קצב כולל קבוע, ולכל לקוח הבקשות ברצף
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.concurrency = concurrency
+
+        self.recent_symbols = OrderedDict()  # {symbol: (leverage, margin_mode)} – LRU
+        self.order_templates = {}  # {symbol: {position_side: params}}
+        self.quantity_precision = {}  # {symbol: int}
+        self._contracts_loaded_at = 0
+        self._applied_leverage = {}  # {(client, symbol, position_side): leverage}
+        self._applied_margin = {}  # {(client, symbol): margin_mode}
+        self._margin_rejected = {}  # {(client, symbol): margin_mode} – נדחה בבורסה, לא לנסות שוב
+
+        if shared is not None:
+            self.rate_limiter = shared.rate_limiter
+            self.order_templates = shared.order_templates
+            self.quantity_precision = shared.quantity_precision
+            self._applied_leverage = shared._applied_leverage
+            self._applied_margin = shared._applied_margin
+            self._margin_rejected = shared._margin_rejected
+
+    # ---------- מצב שהוחל אצל הלקוח ----------
+
+    def leverage_ready(self, client_name, symbol, position_side, leverage):
+        return self._applied_leverage.get((client_name, symbol, position_side)) == leverage
+
+    def margin_ready(self, client_name, symbol, margin_mode):
+        """הוחל – או נדחה כבר באותו mode (אין טעם לשלוח שוב קריאה שידוע שנכשלת)"""
+        key = (client_name, symbol)
+        return self._applied_margin.get(key) == margin_mode or self._margin_rejected.get(key) == margin_mode
+
+    def mark_leverage(self, client_name, symbol, position_side, leverage):
+        self._applied_leverage[(client_name, symbol, position_side)] = leverage
+
+    def mark_margin(self, client_name, symbol, margin_mode):
+        self._applied_margin[(client_name, symbol)] = margin_mode
+        self._margin_rejected.pop((client_name, symbol), None)
+
+    def reject_margin(self, client_name, symbol, margin_mode):
+        """הבורסה דחתה את שינוי ה-margin mode – לא מנסים שוב עד שהמאסטר עובר ל-mode אחר"""
+        self._applied_margin.pop((client_name, symbol), None)
+        self._margin_rejected[(client_name, symbol)] = margin_mode
+        metrics.inc("execution_plan_margin_rejections")
+
+    def invalidate(self, client_name, symbol):
+        for position_side in POSITION_SIDES:
+            self._applied_leverage.pop((client_name, symbol, position_side), None)
+        self._applied_margin.pop((client_name, symbol), None)
+
+    def on_order_error(self, client_name, symbol, response):
+        """שגיאת בורסה שמזכירה leverage / margin – מה שסומן ללקוח על הסימבול כבר לא אמין"""
+        msg = str(response.get("msg", "") if isinstance(response, dict) else response).lower()
+        if any(hint in msg for hint in STALE_SETTINGS_HINTS):
+            self.invalidate(client_name, symbol)
+            metrics.inc("execution_plan_invalidations")
+
+    # ---------- תוכניות ----------
+
+    def note_symbol(self, symbol, leverage, margin_mode):
+        """נקרא מלולאת הסנכרון לכל פוזיציה פתוחה של המאסטר"""
+        self.recent_symbols[symbol] = (leverage, margin_mode)
+        self.recent_symbols.move_to_end(symbol)
+        while len(self.recent_symbols) > self.max_symbols:
+            self.recent_symbols.popitem(last=False)
+
+    def templates_for(self, symbol):
+        templates = self.order_templates.get(symbol)
+        if templates is None:
+            templates = self.order_templates[symbol] = {
+                side: BingXAPI.open_order_template(symbol, side) for side in POSITION_SIDES
+            }
+        return templates
+
+    def plan_for(self, client_name, symbol, position_side, leverage, margin_mode):
+        plan = ExecutionPlan(
+            symbol,
+            self.templates_for(symbol),
+            self.quantity_precision.get(symbol, 8),
+            self.leverage_ready(client_name, symbol, position_side, leverage),
+            self.margin_ready(client_name, symbol, margin_mode),
+        )
+        metrics.inc("execution_plan_hits" if plan.leverage_ready and plan.margin_ready else "execution_plan_misses")
+        return plan
+
+    # ---------- רענון ברקע ----------
+
+    async def refresh_contracts(self):
+        if time.time() - self._contracts_loaded_at < self.contracts_ttl:
+            return
+        await self.rate_limiter.acquire()
+        contracts = await self.master_api.get_contracts()
+        self._contracts_loaded_at = time.time()  # גם בכישלון – לא לנסות בכל סבב
+        if contracts:
+            self.quantity_precision.update(contracts)
+
+    async def _apply(self, client, symbol, leverage, margin_mode):
+        """קריאות רק למה שחסר – בסבב רגיל, בלי שינוי אצל המאסטר ובלי ביטולים, לא נשלח כלום"""
+        name = client.key
+        api = client.api
+
+        for position_side in POSITION_SIDES:
+            if self.leverage_ready(name, symbol, position_side, leverage):
+                continue
+            await self.rate_limiter.acquire()
+            response = await api.set_leverage(symbol, leverage, position_side)
+            metrics.inc("execution_plan_refresh_calls")
+            if isinstance(response, dict) and response.get("code") == 0:
+                self.mark_leverage(name, symbol, position_side, leverage)
+            else:
+                self.on_order_error(name, symbol, response)
+
+        if not self.margin_ready(name, symbol, margin_mode):
+            await self.rate_limiter.acquire()
+            response = await api.set_margin_mode(symbol, margin_mode)
+            metrics.inc("execution_plan_refresh_calls")
+            if isinstance(response, dict) and response.get("code") == 0:
+                self.mark_margin(name, symbol, margin_mode)
+            else:
+                self.reject_margin(name, symbol, margin_mode)
+
+    async def refresh(self):
+        await self.refresh_contracts()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def apply(client, symbol, leverage, margin_mode):
+            async with semaphore:
+                try:
+                    await self._apply(client, symbol, leverage, margin_mode)
+                except Exception as e:
+                    logger.warning(f"⚠️ שגיאה בהכנת תוכנית ביצוע ל-{client.key} על {symbol}: {e}")
+
+        for symbol, (leverage, margin_mode) in list(self.recent_symbols.items()):
+            self.templates_for(symbol)
+            if not leverage or leverage <= 0:
+                continue
+            await asyncio.gather(*[
+                apply(client, symbol, leverage, margin_mode) for client in list(self.clients_getter())
+            ])
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ שגיאה ברענון תוכניות ביצוע: {e}")
+            await asyncio.sleep(self.refresh_interval)
@@ -0,0 +1,129 @@
+import math
+import random
+from core.logger import logger
+from core.metrics import metrics
+
+
+class OrderingPolicy:
+    """סדר הלקוחות בפיזור – מי נכנס ראשון לבקר המקביליות (ומקבל את מחיר הכניסה הקרוב ביותר למאסטר)"""
+
+    name = "list"
+
+    def order(self, clients):
+        return list(clients)
+
+
+class RotatingPolicy(OrderingPolicy):
+    """🔄 כל פיזור מתחיל מנקודה אחרת ברשימה – כל לקוח עובר בכל המקומות לאורך זמן"""
+
+    name = "rotating"
+
+    def __init__(self, step=None):
+        self.step = step  # None = צעד "יחס הזהב" זר לגודל הרשימה – גם פיזורים סמוכים מתפזרים, וכל נקודה מבוקרת
+        self.offset = 0
+
+    @staticmethod
+    def _coprime_step(size):
+        step = max(int(size * 0.618), 1)
+        while math.gcd(step, size) != 1:
+            step += 1
+        return step
+
+    def order(self, clients):
+        clients = list(clients)
+        if not clients:
+            return clients
+        start = self.offset % len(clients)
+        self.offset = start + (self.step or self._coprime_step(len(clients)))
+        return clients[start:] + clients[:start]
+
+
+class RandomizedPolicy(OrderingPolicy):
+    """🎲 סדר אקראי בכל פיזור"""
+
+    name = "random"
+
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+
+    def order(self, clients):
+        clients = list(clients)
+        self.random.shuffle(clients)
+        return clients
+
+
+class PriorityTierPolicy(OrderingPolicy):
+    """
+    🏅 שכבות עדיפות: tier_of(client) → מספר (נמוך = קודם). בתוך כל שכבה הסדר מתחלף לפי inner,
+    כך שההוגנות נשמרת לפחות בין לקוחות מאותה שכבה.
+    """
+
+    name = "tiers"
+
+    def __init__(self, tier_of, inner=None):
+        self.tier_of = tier_of
+        self.inner = inner or RotatingPolicy()
+
+    def order(self, clients):
+        tiers = {}
+        for client in clients:
+            tiers.setdefault(self.tier_of(client), []).append(client)
+        ordered = []
+        for tier in sorted(tiers):
+            ordered.extend(self.inner.order(tiers[tier]))
+        return ordered
+
+
+def build_ordering_policy(name, balances_getter=None):
+    """
+    list / rotating / random / tier_balance (יתרה גדולה קודם, בשכבות לפי סדר גודל)
+    / tier_subscription (שדה "tier" של הלקוח, נמוך = קודם)
+    """
+    if name == "list":
+        return OrderingPolicy()
+    if name == "random":
+        return RandomizedPolicy()
+    if name == "tier_balance":
+        def balance_tier(client):
+            balances = balances_getter() if balances_getter else {}
+            available = float((balances.get(client.key) or {}).get("available", 0) or 0)
+            # 10,000+ → 0, 1,000+ → 1, 100+ → 2, אחרת 3
+            return 0 if available >= 10000 else 1 if available >= 1000 else 2 if available >= 100 else 3
+        return PriorityTierPolicy(balance_tier)
+    if name == "tier_subscription":
+        return PriorityTierPolicy(lambda client: client.tier if client.tier is not None else 100)
+    if name != "rotating":
+        logger.warning(f"⚠️ מדיניות סדר פיזור לא מוכרת '{name}' – משתמשים ב-rotating")
+    return RotatingPolicy()
+
+
+class FanoutScheduler:
+    """
+    🗓️ קובע את סדר הלקוחות בכל פיזור (לפי מדיניות) ומודד לכל לקוח את ה-slot latency –
+    הזמן מתחילת הפיזור ועד שהלקוח קיבל מקום. הממוצע ללקוח מראה איך ה-slippage מתחלק.
+    """
+
+    def __init__(self, policy=None):
+        self.policy = policy or RotatingPolicy()
+        self.slot_stats = {}  # {client_name: [count, total_seconds]}
+
+    def order(self, clients):
+        return self.policy.order(clients)
+
+    def record_slot(self, client_name, latency):
+        stats = self.slot_stats.setdefault(client_name, [0, 0.0])
+        stats[0] += 1
+        stats[1] += latency
+        metrics.observe("fanout_client_slot_seconds", latency)
+
+    def average_slot_latency(self):
+        return {name: total / count for name, (count, total) in self.slot_stats.items() if count}
+
+    def report(self):
+        """ממוצע slot latency לכל לקוח + פיזור (max - min) בין הלקוחות"""
+        averages = self.average_slot_latency()
+        if not averages:
+            return {"policy": self.policy.name, "clients": {}, "spread": 0.0}
+        spread = max(averages.values()) - min(averages.values())
+        metrics.set_gauge("fanout_slot_latency_spread_seconds", spread)
+        return {"policy": self.policy.name, "clients": averages, "spread": spread}
@@ -0,0 +1,228 @@
+import time
+import socket
+import asyncio
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorClient
+from core.logger import logger
+from core.metrics import metrics
+
+
+class LeaderLease:
+    """
+    👑 lease יחיד במונגו שקובע איזה מופע של TradeManager הוא ה-primary.
+
+    כל תפיסה חדשה של ה-lease מעלה את epoch – fencing token שמסמן את כתיבות המצב של ה-primary,
+    כך ש-primary ישן שלא יודע שאיבד את ה-lease לא יכול לדרוס את המצב של החדש.
+    ה-primary סוחר רק עד safety_margin שניות לפני הפקיעה של החידוש המוצלח האחרון.
+    """
+
+    def __init__(self, uri, db_name, node_id=None, name="trade_manager", ttl=10, safety_margin=2):
+        self.client = AsyncIOMotorClient(uri)
+        self.collection = self.client[db_name]["leader_leases"]
+        self.node_id = node_id or f"{socket.gethostname()}-{int(time.time())}"
+        self.name = name
+        self.ttl = ttl
+        self.safety_margin = safety_margin
+
+        self.epoch = None  # ה-epoch של ה-lease שבידינו (None = לא primary)
+        self.expires_at = 0
+
+    def valid(self):
+        """האם מותר לסחור עכשיו – lease בידינו ולפני מרווח הביטחון של הפקיעה"""
+        return self.epoch is not None and time.time() < self.expires_at - self.safety_margin
+
+    async def try_acquire(self):
+        """חידוש ה-lease שבידינו, או תפיסה של lease פנוי / שפג (עם epoch חדש). מחזיר True אם אנחנו ה-primary"""
+        now = time.time()
+        expires_at = now + self.ttl
+        doc = None
+        if self.epoch is not None:
+            doc = await self.collection.find_one_and_update(
+                {"_id": self.name, "owner": self.node_id, "epoch": self.epoch},
+                {"$set": {"expires_at": expires_at, "renewed_at": now}},
+                return_document=ReturnDocument.AFTER
+            )
+        if doc is None:
+            try:
+                doc = await self.collection.find_one_and_update(
+                    {"_id": self.name, "$or": [{"owner": None}, {"expires_at": {"$lt": now}}]},
+                    {"$set": {"owner": self.node_id, "expires_at": expires_at, "renewed_at": now}, "$inc": {"epoch": 1}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                # המסמך קיים ושייך למופע אחר שעדיין בתוקף
+                doc = None
+
+        if not doc or doc.get("owner") != self.node_id:
+            self.epoch = None
+            self.expires_at = 0
+            return False
+        self.epoch = doc.get("epoch")
+        self.expires_at = expires_at
+        return True
+
+    async def current(self):
+        return await self.collection.find_one({"_id": self.name})
+
+    async def release(self):
+        await self.collection.update_one(
+            {"_id": self.name, "owner": self.node_id, "epoch": self.epoch},
+            {"$set": {"owner": None, "expires_at": 0}}
+        )
+        self.epoch = None
+        self.expires_at = 0
+
+
+class HotStandby:
+    """
+    🔥 הרצת TradeManager במצב primary / hot-standby.
+
+    ה-standby מחזיק לקוחות מפוענחים, מאגר חיבורים חם ויתרות (דרך משימות הרקע של ה-manager),
+    משקף את מסמך המצב של ה-primary בזמן אמת, ומשתלט ברגע שה-lease פג.
+    זמן ה-failover (מה-heartbeat האחרון של ה-primary ועד ההשתלטות) נרשם כמדד.
+
+    בכיבוי (manager.stopping) ה-primary ממשיך לחדש את ה-lease עד סוף הניקוז ואז משחרר אותו,
+    כך שה-standby משתלט מיד ולא אחרי TTL.
+
+    primary שאיבד את ה-lease (או לא הצליח לחדש אותו עד מרווח הביטחון) עוצר מיד את כל פעולות המסחר,
+    וכתיבות המצב שלו נחסמות ב-fencing של ה-epoch.
+    """
+
+    def __init__(self, manager, lease, mirror_interval=1):
+        self.manager = manager
+        self.lease = lease
+        manager.attach_leader_lease(lease)
+        self.mirror_interval = mirror_interval
+        self.last_primary_renewal = None
+
+    async def run(self):
+        while not self.manager.stopping:
+            if await self.lease.try_acquire():
+                await self._run_primary()
+            else:
+                await self._run_standby()
+
+    async def _run_primary(self):
+        logger.info(f"👑 {self.lease.node_id} פועל כ-primary (epoch {self.lease.epoch})")
+        metrics.set_gauge("ha_is_primary", 1)
+        await self.manager.mongo_state.claim(self.lease.epoch)
+        sync_task = asyncio.create_task(self.manager.sync_trades())
+
+        lost = False
+        try:
+            while not sync_task.done():
+                await asyncio.wait([sync_task], timeout=self._renew_wait())
+                if sync_task.done():
+                    break
+                if not await self._renew():
+                    logger.critical(f"🚨 {self.lease.node_id} איבד את ה-lease – עוצר מסחר וחוזר ל-standby")
+                    metrics.inc("ha_lease_lost")
+                    lost = True
+                    break
+        finally:
+            if not sync_task.done():
+                sync_task.cancel()
+                await asyncio.gather(sync_task, return_exceptions=True)
+
+        if lost:
+            # פתיחות בתור ופיזורים שרצים לא ממשיכים לשלוח פקודות לצד ה-primary החדש
+            await self.manager.abort_trading()
+            metrics.set_gauge("ha_is_primary", 0)
+            return
+
+        if self.manager.stopping:
+            await self._hand_over()
+
+    def _renew_wait(self):
+        # חידוש כל ttl/3, ולא אחרי תחילת מרווח הביטחון
+        return max(min(self.lease.ttl / 3, self.lease.expires_at - self.lease.safety_margin - time.time()), 0)
+
+    async def _renew(self):
+        """
+        חידוש ה-lease. כשל רשת נסבל רק כל עוד ה-lease האחרון בתוקף (לפני מרווח הביטחון);
+        חידוש שלא חוזר עד מרווח הביטחון (מונגו תקוע – server selection של Motor הוא 30s) נחשב אובדן.
+        """
+        remaining = self.lease.expires_at - self.lease.safety_margin - time.time()
+        if remaining <= 0:
+            return False
+        try:
+            return await asyncio.wait_for(self.lease.try_acquire(), remaining)
+        except asyncio.TimeoutError:
+            logger.error(f"❌ חידוש ה-lease של {self.lease.node_id} לא הסתיים תוך {remaining:.1f}s")
+            return False
+        except Exception as e:
+            logger.error(f"❌ חידוש ה-lease של {self.lease.node_id} נכשל: {e}")
+            return self.lease.valid()
+
+    async def _hand_over(self):
+        """👋 ניקוז תחת lease בתוקף, ואז שחרור מיידי ל-standby"""
+        renew_task = asyncio.create_task(self._keep_lease())
+        try:
+            await self.manager.close()
+        finally:
+            renew_task.cancel()
+        await self.lease.release()
+        metrics.set_gauge("ha_is_primary", 0)
+        logger.info(f"👋 {self.lease.node_id} שחרר את ה-lease – ה-standby יכול להשתלט")
+
+    async def _keep_lease(self):
+        while True:
+            await asyncio.sleep(self.lease.ttl / 3)
+            await self._renew()
+
+    async def _run_standby(self):
+        logger.info(f"🧊 {self.lease.node_id} פועל כ-hot standby")
+        metrics.set_gauge("ha_is_primary", 0)
+        mirror_task = asyncio.create_task(self._mirror_state())
+
+        try:
+            while not self.manager.stopping:
+                doc = await self.lease.current()
+                if doc and doc.get("owner") and doc.get("owner") != self.lease.node_id:
+                    self.last_primary_renewal = doc.get("renewed_at")
+
+                if await self.lease.try_acquire():
+                    break
+
+                await asyncio.sleep(self.lease.ttl / 4)
+        finally:
+            mirror_task.cancel()
+
+        if self.manager.stopping:
+            return
+
+        # 🔒 סימון מסמך המצב ב-epoch החדש (primary ישן כבר לא יכול לכתוב), ואז טעינה סופית לפני תחילת המסחר
+        await self.manager.mongo_state.claim(self.lease.epoch)
+        await self.manager.load_state()
+
+        if self.last_primary_renewal:
+            failover_seconds = time.time() - self.last_primary_renewal
+            metrics.observe("ha_failover_seconds", failover_seconds)
+            logger.warning(f"⚡ השתלטות על ה-primary הושלמה תוך {failover_seconds:.2f} שניות")
+        metrics.inc("ha_failovers")
+
+    async def _mirror_state(self):
+        """🪞 שיקוף מסמך המצב של ה-primary – change stream, ואם אין replica set אז polling"""
+        collection = self.manager.mongo_state.collection
+        state_id = self.manager.mongo_state.state_id
+
+        try:
+            pipeline = [{"$match": {"documentKey._id": state_id}}]
+            async with collection.watch(pipeline, full_document="updateLookup") as stream:
+                async for change in stream:
+                    doc = change.get("fullDocument")
+                    if doc:
+                        self.manager.apply_state(doc)
+                        metrics.inc("ha_state_changes_mirrored")
+                        metrics.set_gauge("ha_last_mirror_at", time.time())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ change stream לא זמין ({e}) – עובר ל-polling כל {self.mirror_interval} שניות")
+
+        while True:
+            await self.manager.load_state()
+            metrics.set_gauge("ha_last_mirror_at", time.time())
+            await asyncio.sleep(self.mirror_interval)
@@ -0,0 +1,62 @@
+import time
+import asyncio
+from core.logger import logger
+from core.metrics import metrics
+from utils.rate_limiter import RateLimiter
+
+
+class MasterRequestExecutor:
+    """
+    🚦 מבצע קריאות API של המאסטר במקביל, בתוך תקציב הקצב של החשבון.
+
+    - עד concurrency קריאות בו-זמנית
+    - token bucket של requests_per_second (במקום sleep קבוע אחרי כל קריאה)
+    - single-flight: קריאות זהות (אותו key) שכבר בדרך חולקות תוצאה אחת
+    """
+
+    def __init__(self, concurrency=3, requests_per_second=5):
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rate_limiter = RateLimiter(requests_per_second, burst=concurrency)
+        self.inflight = {}  # {key: Task}
+
+    async def call(self, coro_func, key=None):
+        if key is not None:
+            task = self.inflight.get(key)
+            if task is not None:
+                metrics.inc("master_requests_deduplicated")
+                return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(self._run(coro_func))
+        if key is not None:
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+        # shield – ביטול של ממתין אחד לא מבטל את הקריאה המשותפת
+        return await asyncio.shield(task)
+
+    async def _run(self, coro_func):
+        queued_at = time.perf_counter()
+        async with self.semaphore:
+            await self.rate_limiter.acquire()
+            started = time.perf_counter()
+            metrics.observe("master_request_wait_seconds", started - queued_at)
+            try:
+                return await coro_func()
+            except Exception as e:
+                metrics.inc("master_request_errors")
+                logger.warning(f"⚠️ שגיאה בביצוע קריאת API של המאסטר: {e}")
+                raise
+            finally:
+                metrics.observe("master_request_seconds", time.perf_counter() - started)
+
+
+_shared_executor = None
+
+
+def get_master_executor(concurrency=3, requests_per_second=5):
+    """מופע יחיד לכל התהליך – כל מי שקורא למאסטר חולק את אותו תקציב"""
+    global _shared_executor
+    if _shared_executor is None:
+        _shared_executor = MasterRequestExecutor(concurrency, requests_per_second)
+    return _shared_executor
@@ -0,0 +1,43 @@
+import time
+import asyncio
+from utils.bingx_api import BingXAPI
+from utils.async_cache import CacheError
+
+
+class MasterSnapshot:
+    """
+    📸 תמונת מצב של המאסטר לסבב אחד של sync_trades:
+    פוזיציות, יתרה זמינה וכל ה-open orders מאונדקסים לפי סימבול.
+    כל סימבול בסבב נבדק מול אותה תמונה – בלי I/O נוסף.
+    """
+
+    def __init__(self, positions, balance, orders_by_symbol, fetched_at=None, positions_age=0.0):
+        self.positions = positions
+        self.positions_age = positions_age  # ⏱️ גיל תמונת הפוזיציות (staleness) בשניות
+        # ❌ כשל בשליפת היתרה נשמר בנפרד – יתרה לא ידועה איננה יתרה 0
+        self.balance_error = balance if isinstance(balance, CacheError) else None
+        self.balance = balance if isinstance(balance, dict) else {}
+        self.orders_by_symbol = orders_by_symbol or {}
+        self.fetched_at = fetched_at or time.time()
+
+    @property
+    def balance_ok(self):
+        return self.balance_error is None
+
+    @property
+    def available_balance(self):
+        return float(self.balance.get("available", 0) or 0)
+
+    def trade_parameters(self, symbol):
+        """(leverage, tp, sl) של הסימבול מתוך ה-open orders של התמונה"""
+        return BingXAPI.parse_trade_parameters(self.orders_by_symbol.get(symbol, []), symbol)
+
+
+async def fetch_master_snapshot(balance_manager, master_api):
+    """שליפה מקבילית של פוזיציות, יתרה ו-open orders של המאסטר"""
+    (positions, positions_age), balance, orders_by_symbol = await asyncio.gather(
+        balance_manager.get_master_positions_snapshot(master_api),
+        balance_manager.get_cached_master_balance(master_api, "USDT"),
+        balance_manager.get_cached_all_open_orders(master_api),
+    )
+    return MasterSnapshot(positions, balance, orders_by_symbol, positions_age=positions_age)
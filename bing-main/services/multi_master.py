@@ -0,0 +1,166 @@
+import asyncio
+from collections import Counter
+from core.logger import logger, log_context
+from core.metrics import metrics
+from services.trade_manager import TradeManager
+from services.shared_resources import SharedResources
+from services.secure_api_manager import SecureAPIManager
+from load_apis_from_db import load_masters_from_db
+from utils.time_sync import server_clock
+from core.config import TIME_SYNC_INTERVAL, RECV_WINDOW_MS
+
+
+def default_master_name(masters):
+    """המאסטר של לקוחות בלי שדה masters: המסמך בלי שם (הראשי), ואם אין כזה – הראשון"""
+    for master in masters:
+        if master.get("name") is None:
+            return None
+    return masters[0].get("name")
+
+
+def subscribers_of(master_name, clients, default_master):
+    """הלקוחות שעוקבים אחרי מאסטר: לפי שדה masters, ולקוח בלי השדה – אחרי המאסטר הראשי בלבד"""
+    subscribers = []
+    for client in clients:
+        masters = client.get("masters")
+        if masters:
+            if master_name in masters:
+                subscribers.append(client)
+        elif master_name == default_master:
+            subscribers.append(client)
+    return subscribers
+
+
+class MasterGroup:
+    """
+    🧑‍✈️ כמה חשבונות מאסטר בתהליך אחד.
+
+    לכל מאסטר TradeManager משלו: מסמך מצב, פוזיציות, רשימת מנויים ותקציב קריאות API למאסטר.
+    כולם יושבים על SharedResources אחד (session, לקוחות, AIMD, איחוד פקודות, מטמון יתרות, מונגו),
+    ומשימות הרקע של התהליך – pre-warm, שעון, טעינת לקוחות ויתרות – רצות פעם אחת לכל הקבוצה.
+    """
+
+    def __init__(self, config=None, resources=None, api_manager=None, manager_factory=TradeManager):
+        # config / resources / manager_factory ניתנים להזרקה (השמעת סשן מוקלט, בדיקות עומס)
+        self.api_manager = api_manager or SecureAPIManager()
+        config = config or load_masters_from_db(self.api_manager)
+        self.resources = resources or SharedResources()
+        self.masters = config["masters"]
+        self.default_master = default_master_name(self.masters)
+
+        self.managers = [
+            manager_factory(
+                config={"master": master, "clients": subscribers_of(master.get("name"), config["clients"], self.default_master)},
+                resources=self.resources,
+                master_name=master.get("name")
+            )
+            for master in self.masters
+        ]
+        self._retain_clients()
+        self._mark_shared_clients(warn=True)
+
+        self.client_balances = {}
+        self._background_tasks = []
+        logger.info(
+            f"🧑‍✈️ {len(self.managers)} מאסטרים בתהליך אחד: "
+            + ", ".join(f"{self.label(manager)} ({len(manager.clients)} לקוחות)" for manager in self.managers)
+        )
+
+    @staticmethod
+    def label(manager):
+        return manager.master_name or "default"
+
+    def _retain_clients(self):
+        keys = {client.key for manager in self.managers for client in manager.clients}
+        self.resources.retain_clients(keys)
+        metrics.set_gauge("multi_master_clients", len(keys))
+
+    def _mark_shared_clients(self, warn=False):
+        # בבורסה יש פוזיציה אחת לסימבול וצד – סגירה של מאסטר אחד סוגרת גם את מה שנפתח לפי מאסטר אחר,
+        # וביקורת הסטיות / reconcile של מאסטר אחד לא יכולים לייחס לו את הכמות
+        counts = Counter(client.key for manager in self.managers for client in manager.clients)
+        shared = frozenset(key for key, count in counts.items() if count > 1)
+        for manager in self.managers:
+            manager.shared_clients = shared
+        metrics.set_gauge("multi_master_shared_clients", len(shared))
+        if shared and warn:
+            examples = ", ".join(sorted(shared)[:5])
+            logger.warning(
+                f"⚠️ {len(shared)} לקוחות עוקבים אחרי יותר ממאסטר אחד (למשל {examples}) – "
+                f"פוזיציות על אותו סימבול משותפות אצלם בבורסה, והם לא נכללים בביקורת הסטיות"
+            )
+
+    # ---------- מחזור חיים ----------
+
+    def add_background_task(self, coro, loop=None):
+        task = (loop or asyncio.get_event_loop()).create_task(coro)
+        self._background_tasks.append(task)
+        return task
+
+    def start_background_tasks(self, loop=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+
+        self.add_background_task(self._refresh_clients_loop(), loop)
+        self.add_background_task(self._preload_balances_loop(), loop)
+        self.add_background_task(self.resources.connection_pool.run_prewarm_loop(), loop)
+
+        server_clock.interval = TIME_SYNC_INTERVAL
+        server_clock.recv_window = RECV_WINDOW_MS
+        self.add_background_task(server_clock.run(self.managers[0].master_api), loop)
+
+    async def load_state(self):
+        await asyncio.gather(*[manager.load_state() for manager in self.managers])
+
+    async def sync_trades(self):
+        await asyncio.gather(*[self._sync_master(manager) for manager in self.managers])
+
+    async def _sync_master(self, manager):
+        # master בהקשר הלוג – עובר לכל המשימות שהסנכרון של המאסטר יוצר
+        with log_context(master=self.label(manager)):
+            await manager.sync_trades()
+
+    def request_stop(self):
+        for manager in self.managers:
+            manager.request_stop()
+
+    async def close(self):
+        await asyncio.gather(*[manager.close() for manager in self.managers], return_exceptions=True)
+        for task in self._background_tasks:
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        await self.resources.close()
+
+    # ---------- משימות רקע משותפות ----------
+
+    async def _refresh_clients_loop(self):
+        while True:
+            await asyncio.sleep(2000)
+            try:
+                config = load_masters_from_db(self.api_manager)
+                for manager in self.managers:
+                    manager.update_client_configs(
+                        subscribers_of(manager.master_name, config["clients"], self.default_master)
+                    )
+                self._retain_clients()
+                self._mark_shared_clients()
+            except Exception as e:
+                logger.error(f"❌ שגיאה בטעינת לקוחות מחדש למאסטרים: {e}")
+
+    async def _preload_balances_loop(self):
+        """🔄 יתרות לכל הלקוחות של כל המאסטרים – פעם אחת ללקוח, גם אם הוא עוקב אחרי כמה מאסטרים"""
+        while True:
+            try:
+                clients = {client.key: client for manager in self.managers for client in manager.clients}
+                balances = await self.managers[0].preload_balances(list(clients.values()))
+                if balances:
+                    self.client_balances = balances
+                    for manager in self.managers:
+                        manager.client_balances = balances
+                        manager.trade_operations.update_client_balances(balances)
+                else:
+                    logger.warning("⚠️ לא התקבלו יתרות תקינות – לא עודכן")
+            except Exception as e:
+                logger.exception(f"❌ שגיאה כללית בלולאת טעינת יתרות ברקע: {e}")
+
+            await asyncio.sleep(600)
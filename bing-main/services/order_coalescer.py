@@ -0,0 +1,90 @@
+import asyncio
+from core.metrics import metrics
+
+# מגבלת BingX לבקשת batchOrders אחת
+MAX_BATCH_ORDERS = 5
+
+
+class OrderCoalescer:
+    """
+    📦 איחוד פקודות של אותו לקוח שמגיעות בחלון זמן קצר.
+
+    - פקודות (פתיחה / סגירה חלקית) → בקשת batchOrders אחת (עד 5 פקודות לבקשה)
+    - סגירות מלאות לא עוברות כאן: closeAllPositions ללא סימבול סוגר את כל החשבון,
+      כולל פוזיציות ידניות ושל מאסטרים אחרים – לכן הן נשלחות תמיד עם סימבול, ישירות
+
+    בקשה שהממתין שלה בוטל לפני סוף החלון (למשל פיזור שנקטע בכיבוי) לא נשלחת.
+    """
+
+    def __init__(self, window=0.1):
+        self.window = window
+        self.pending_orders = {}  # {api: [(params, future)]}
+
+    async def submit_order(self, api, params):
+        fut = asyncio.get_event_loop().create_future()
+        queue = self.pending_orders.setdefault(api, [])
+        queue.append((params, fut))
+        if len(queue) == 1:
+            asyncio.create_task(self._flush_orders(api))
+        return await fut
+
+    async def _flush_orders(self, api):
+        await asyncio.sleep(self.window)
+        queue = [(params, fut) for params, fut in self.pending_orders.pop(api, []) if not fut.cancelled()]
+        if not queue:
+            return
+
+        if len(queue) == 1:
+            params, fut = queue[0]
+            await self._resolve(fut, api._send_request("POST", "/openApi/swap/v2/trade/order", params))
+            return
+
+        metrics.inc("coalescer_batches")
+        metrics.inc("coalescer_requests_saved", len(queue) - (len(queue) + MAX_BATCH_ORDERS - 1) // MAX_BATCH_ORDERS)
+
+        for i in range(0, len(queue), MAX_BATCH_ORDERS):
+            chunk = queue[i:i + MAX_BATCH_ORDERS]
+            orders = [
+                {k: v for k, v in params.items() if k not in ("timestamp", "recvWindow")}
+                for params, _ in chunk
+            ]
+            try:
+                response = await api.place_batch_orders(orders)
+            except Exception as e:
+                for _, fut in chunk:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            # פיצול תגובת ה-batch לתגובה בפורמט של פקודה בודדת לכל ממתין
+            results = []
+            if isinstance(response, dict) and response.get("code") == 0:
+                results = (response.get("data") or {}).get("orders") or []
+            for index, (_, fut) in enumerate(chunk):
+                if fut.done():
+                    continue
+                if not isinstance(response, dict) or response.get("code") != 0:
+                    fut.set_result(response)
+                elif index < len(results):
+                    fut.set_result({"code": 0, "msg": "", "data": {"order": results[index]}})
+                else:
+                    fut.set_result({"code": -1, "msg": "הפקודה חסרה בתגובת batchOrders"})
+
+    @staticmethod
+    async def _capture(coro):
+        try:
+            return await coro
+        except Exception as e:
+            return e
+
+    @staticmethod
+    def _set(fut, result):
+        if fut.done():
+            return
+        if isinstance(result, Exception):
+            fut.set_exception(result)
+        else:
+            fut.set_result(result)
+
+    async def _resolve(self, fut, coro):
+        self._set(fut, await self._capture(coro))
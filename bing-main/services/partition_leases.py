@@ -0,0 +1,177 @@
+import math
+import time
+import asyncio
+from pymongo import ReturnDocument
+from motor.motor_asyncio import AsyncIOMotorClient
+from core.logger import logger
+
+
+class PartitionLeaseManager:
+    """
+    🗂️ בעלות על מחיצות לקוחות בין כמה שרתים (nodes) באמצעות lease מוגבל בזמן במונגו.
+
+    - כל node שולח heartbeat לאוסף cluster_nodes
+    - כל מחיצה (partition) היא מסמך ב-partition_leases עם owner ו-expires_at
+    - היעד לכל node הוא ceil(partitions / alive_nodes); עודף משוחרר, חוסר נתפס ממחיצות פנויות/שפג תוקפן
+    - מחיצה שמשתחררת עוברת למצב draining: on_change שומר אותה ומסיר את לקוחותיה מקומית, ובאותו סבב היא משוחררת במונגו
+    - כל תפיסה מעלה את epoch של המחיצה – fencing token לכתיבת הפוזיציות שלה
+    - owns() נשען על expires_at המקומי בלבד: כשהחידוש נכשל (מונגו לא זמין) הבעלות פוקעת מעצמה
+      safety_margin שניות לפני שמישהו אחר יכול לתפוס את המחיצה
+    """
+
+    def __init__(self, uri, db_name, node_id=None, partition_count=32, lease_ttl=15, heartbeat_interval=5,
+                 safety_margin=2):
+        self.client = AsyncIOMotorClient(uri)
+        self.db = self.client[db_name]
+        self.leases = self.db["partition_leases"]
+        self.nodes = self.db["cluster_nodes"]
+
+        # מזהה יציב בין הפעלות: מסמך המצב state_node_{id} נשמר לפיו, ומזהה חדש בכל הפעלה
+        # היה מציג את כל פוזיציות המאסטר כחדשות (פתיחות מאוחרות ללקוחות שדולגו, הצפת טלגרם)
+        if not node_id:
+            raise Exception("❌ מצב cluster דורש CLUSTER_NODE_ID קבוע לכל node")
+        self.node_id = node_id
+        self.partition_count = partition_count
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.safety_margin = safety_margin
+
+        self.owned = {}  # {partition: expires_at}
+        self.epochs = {}  # {partition: epoch של ה-lease שבידינו}
+        self.draining = set()
+        self._partitions_ready = False
+
+    def holds(self, partition):
+        """האם ה-lease על המחיצה עדיין בידינו (עם מרווח ביטחון לפני הפקיעה) – גם אם היא ב-draining"""
+        expires_at = self.owned.get(partition)
+        return expires_at is not None and time.time() < expires_at - self.safety_margin
+
+    def owns(self, partition):
+        """האם מותר לסחור בלקוחות המחיצה עכשיו (עם מרווח ביטחון לפני פקיעת ה-lease)"""
+        return partition not in self.draining and self.holds(partition)
+
+    def owned_partitions(self):
+        return {p for p in self.owned if self.owns(p)}
+
+    async def ensure_partitions(self):
+        if self._partitions_ready:
+            return
+        for partition in range(self.partition_count):
+            await self.leases.update_one(
+                {"_id": partition},
+                {"$setOnInsert": {"owner": None, "expires_at": 0, "epoch": 0}},
+                upsert=True
+            )
+        self._partitions_ready = True
+
+    async def heartbeat(self):
+        await self.nodes.update_one(
+            {"_id": self.node_id},
+            {"$set": {"last_seen": time.time()}},
+            upsert=True
+        )
+
+    async def alive_nodes(self):
+        cutoff = time.time() - self.lease_ttl
+        cursor = self.nodes.find({"last_seen": {"$gte": cutoff}}, {"_id": 1})
+        return sorted([doc["_id"] async for doc in cursor])
+
+    async def renew_and_rebalance(self):
+        """
+        סבב אחד: heartbeat, חידוש leases, שחרור עודף וניסיון לתפוס מחיצות.
+        מחזיר (acquired, released) – קבוצות מחיצות שהשתנו בסבב הזה.
+        """
+        await self.ensure_partitions()
+        await self.heartbeat()
+
+        now = time.time()
+        expires_at = now + self.lease_ttl
+        acquired, released = set(), set()
+
+        # 1. מחיצות ב-draining שלא שוחררו (on_change נכשל בסבב הקודם) מחודשות ומדווחות שוב
+        released.update(self.draining)
+
+        # 2. חידוש כל ה-leases שעדיין בבעלותנו
+        renewed = {}
+        for partition in list(self.owned):
+            doc = await self.leases.find_one_and_update(
+                {"_id": partition, "owner": self.node_id},
+                {"$set": {"expires_at": expires_at}},
+                return_document=ReturnDocument.AFTER
+            )
+            if doc:
+                renewed[partition] = expires_at
+            else:
+                logger.warning(f"⚠️ node {self.node_id} איבד את מחיצה {partition}")
+                released.add(partition)
+                self.draining.discard(partition)
+                self.epochs.pop(partition, None)
+        self.owned = renewed
+
+        # 3. איזון לפי מספר ה-nodes החיים
+        alive = await self.alive_nodes()
+        target = math.ceil(self.partition_count / max(len(alive), 1))
+
+        if len(self.owned) - len(self.draining) > target:
+            extra = sorted(set(self.owned) - self.draining)[target:]
+            self.draining.update(extra)
+            released.update(extra)
+            logger.info(f"🔄 node {self.node_id} מוותר על {len(extra)} מחיצות (יעד {target}, nodes={len(alive)})")
+
+        elif len(self.owned) - len(self.draining) < target:
+            # פנויות / שפגו, וגם מחיצות שעדיין רשומות על המזהה שלנו מלפני הפעלה מחדש
+            claimable = [{"owner": None}, {"owner": self.node_id}, {"expires_at": {"$lt": now}}]
+            cursor = self.leases.find({"$or": claimable}, {"_id": 1})
+            candidates = sorted([doc["_id"] async for doc in cursor])
+            for partition in candidates:
+                if len(self.owned) >= target:
+                    break
+                doc = await self.leases.find_one_and_update(
+                    {"_id": partition, "$or": claimable},
+                    {"$set": {"owner": self.node_id, "expires_at": expires_at}, "$inc": {"epoch": 1}},
+                    return_document=ReturnDocument.AFTER
+                )
+                if doc and doc.get("owner") == self.node_id:
+                    self.owned[partition] = expires_at
+                    self.epochs[partition] = doc.get("epoch")
+                    acquired.add(partition)
+
+            if acquired:
+                logger.info(f"✅ node {self.node_id} קיבל מחיצות {sorted(acquired)} (יעד {target}, nodes={len(alive)})")
+
+        return acquired, released
+
+    async def release_draining(self):
+        """👋 שחרור במונגו של מחיצות ה-draining (אחרי ש-on_change שמר אותן) – node אחר תופס אותן בסבב הבא שלו"""
+        for partition in list(self.draining):
+            await self.leases.update_one(
+                {"_id": partition, "owner": self.node_id, "epoch": self.epochs.get(partition)},
+                {"$set": {"owner": None, "expires_at": 0}}
+            )
+            self.owned.pop(partition, None)
+            self.epochs.pop(partition, None)
+            self.draining.discard(partition)
+
+    async def run(self, on_change=None):
+        """🔁 לולאת heartbeat – קוראת ל-on_change(acquired, released) כשהבעלות משתנה"""
+        while True:
+            try:
+                acquired, released = await self.renew_and_rebalance()
+                if on_change and (acquired or released):
+                    await on_change(acquired, released)
+                # שחרור רק אחרי שמירה מוצלחת; אם on_change נכשל – המחיצות מחודשות ומדווחות שוב בסבב הבא
+                await self.release_draining()
+            except Exception as e:
+                logger.exception(f"❌ שגיאה בלולאת ה-leases של node {self.node_id}: {e}")
+
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def release_all(self):
+        await self.leases.update_many(
+            {"owner": self.node_id},
+            {"$set": {"owner": None, "expires_at": 0}}
+        )
+        await self.nodes.delete_one({"_id": self.node_id})
+        self.owned.clear()
+        self.epochs.clear()
+        self.draining.clear()
@@ -0,0 +1,134 @@
+from core.metrics import metrics
+from services.records import PositionRecord
+
+OPEN = "open"
+INCREASE = "increase"
+DECREASE = "decrease"
+CLOSE = "close"
+LEVERAGE = "leverage"
+
+
+class PositionDelta:
+    """
+    🔀 שינוי אחד בפוזיציות המאסטר.
+    position – הרשומה אחרי השינוי (ב-close: הרשומה האחרונה לפני שהוסרה);
+    raw – הפוזיציה הגולמית מהבורסה בסבב הנוכחי (None ב-close).
+    """
+
+    __slots__ = ("kind", "position", "previous_qty", "previous_leverage", "raw")
+
+    def __init__(self, kind, position, previous_qty=0.0, previous_leverage=0, raw=None):
+        self.kind = kind
+        self.position = position
+        self.previous_qty = previous_qty
+        self.previous_leverage = previous_leverage
+        self.raw = raw
+
+    @property
+    def symbol(self):
+        return self.position.symbol
+
+    @property
+    def position_side(self):
+        return self.position.position_side
+
+    @property
+    def closed_pct(self):
+        """החלק שנסגר מהכמות הקודמת (decrease / close)"""
+        if self.kind == CLOSE:
+            return 1.0
+        if self.kind != DECREASE or not self.previous_qty:
+            return 0.0
+        return (self.previous_qty - self.position.qty) / self.previous_qty
+
+    def __repr__(self):
+        if self.kind == LEVERAGE:
+            change = f"x{self.previous_leverage} → x{self.position.leverage}"
+        else:
+            change = f"{self.previous_qty} → {self.position.qty}"
+        return f"PositionDelta({self.kind}, {self.symbol}/{self.position_side}, {change})"
+
+
+class PositionDiffEngine:
+    """
+    🧮 מצב פוזיציות המאסטר לפי (symbol, positionSide) ועדכון אינקרמנטלי מכל תשובת positions.
+    LONG ו-SHORT על אותו סימבול (hedge mode) הם שני מפתחות נפרדים.
+
+    רשומה קיימת מתעדכנת במקום; אובייקט חדש נוצר רק ל-delta או לפוזיציה חדשה.
+    סגירות מזוהות בלי לסרוק את המצב: אם כל המפתחות הוכרו בסבב – אין סגירות;
+    רק כשחסרים מפתחות נסרקת רשימת המפתחות שלא סומנו בסבב הנוכחי.
+    """
+
+    def __init__(self, tolerance=1e-12):
+        self.tolerance = tolerance
+        self.positions = {}  # {(symbol, position_side): PositionRecord}
+        self._seen = {}  # {key: הסבב האחרון שבו הופיע}
+        self.generation = 0
+
+    def load(self, positions):
+        """טעינת מצב שמור ({key: PositionRecord}) – הסבב הראשון אחרי הטעינה יפיק close למה שנסגר בינתיים"""
+        self.positions.clear()
+        self.positions.update(positions)
+        self._seen = {key: self.generation for key in self.positions}
+
+    def update(self, raw_positions):
+        """מחזיר רשימת PositionDelta לפי הסדר: פתיחות / שינויים (לפי סדר התשובה) ואז סגירות"""
+        self.generation += 1
+        generation = self.generation
+        tolerance = self.tolerance
+        positions = self.positions
+        seen_marks = self._seen
+        deltas = []
+        seen = 0
+
+        for raw in raw_positions:
+            qty = abs(float(raw.get("positionAmt", 0) or 0))
+            if qty == 0:
+                continue
+
+            symbol = raw["symbol"]
+            position_side = raw.get("positionSide") or "BOTH"
+            key = (symbol, position_side)
+            if seen_marks.get(key) == generation:
+                continue  # אותו מפתח פעמיים באותה תשובה
+            seen_marks[key] = generation
+            seen += 1
+
+            leverage = int(raw.get("leverage", 0) or 0)
+            record = positions.get(key)
+            if record is None:
+                side = "BUY" if position_side.upper() == "SHORT" else "SELL"
+                record = positions[key] = PositionRecord(
+                    symbol, qty, side, position_side, leverage,
+                    isolated=raw.get("isolated", False), unrealized_profit=raw.get("unrealizedProfit")
+                )
+                deltas.append(PositionDelta(OPEN, record, raw=raw))
+                continue
+
+            record.unrealized_profit = raw.get("unrealizedProfit")
+            record.isolated = raw.get("isolated", record.isolated)
+
+            previous_qty = record.qty
+            if abs(qty - previous_qty) > tolerance:
+                record.qty = qty
+                deltas.append(PositionDelta(INCREASE if qty > previous_qty else DECREASE, record, previous_qty, record.leverage, raw))
+
+            if leverage != record.leverage:
+                previous_leverage = record.leverage
+                record.leverage = leverage
+                deltas.append(PositionDelta(LEVERAGE, record, qty, previous_leverage, raw))
+
+        if seen < len(positions):
+            for key in [key for key, mark in seen_marks.items() if mark != generation]:
+                del seen_marks[key]
+                record = positions.pop(key, None)
+                if record is not None:
+                    deltas.append(PositionDelta(CLOSE, record, record.qty, record.leverage))
+
+        if deltas:
+            metrics.inc("master_position_deltas", len(deltas))
+        return deltas
+
+    def symbol_qty(self, symbol):
+        """כמות המאסטר על סימבול (סכום הצדדים)"""
+        return sum(record.qty for (position_symbol, _), record in self.positions.items() if position_symbol == symbol)
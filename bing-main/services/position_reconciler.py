@@ -0,0 +1,131 @@
+import time
+import asyncio
+from core.logger import logger
+from core.metrics import metrics
+from utils.rate_limiter import RateLimiter
+
+
+class PositionReconciler:
+    """
+    🔍 השוואת client_positions השמור מול הפוזיציות האמיתיות בבורסה.
+
+    השליפה מכל הלקוחות רצה במקביל (עד concurrency בו-זמנית) ובתוך תקציב הקצב,
+    והתיקון נוגע רק בסימבולים שהבוט מנהל (שמורים ללקוח או מועתקים מהמאסטר).
+    """
+
+    def __init__(self, concurrency=10, requests_per_second=8):
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(requests_per_second)
+
+    async def fetch_client_positions(self, client):
+        """מחזיר {symbol: qty} של הלקוח, או None אם השליפה נכשלה"""
+        await self.rate_limiter.acquire()
+        response = await client.api.get_positions()
+
+        if not isinstance(response, dict) or response.get("code") != 0:
+            return None
+
+        positions = {}
+        for position in response.get("data") or []:
+            qty = abs(float(position.get("positionAmt", 0) or 0))
+            if qty > 0:
+                symbol = position["symbol"]
+                positions[symbol] = positions.get(symbol, 0) + qty
+        return positions
+
+    @staticmethod
+    def diff(stored, actual, managed_symbols, tolerance=1e-8):
+        """
+        מחזיר רשימת סטיות (symbol, stored_qty, actual_qty) עבור הסימבולים המנוהלים.
+        stored_qty = 0 → פוזיציה לא צפויה, actual_qty = 0 → פוזיציה שכבר לא קיימת.
+        """
+        drifts = []
+        for symbol in managed_symbols:
+            stored_qty = float(stored.get(symbol, 0) or 0)
+            actual_qty = float(actual.get(symbol, 0) or 0)
+            if abs(stored_qty - actual_qty) > tolerance:
+                drifts.append((symbol, stored_qty, actual_qty))
+        return drifts
+
+    @staticmethod
+    def repair(client_positions, client_name, drifts):
+        """מעדכן את client_positions למצב האמיתי עבור הסטיות שנמצאו"""
+        for symbol, _, actual_qty in drifts:
+            if actual_qty > 0:
+                client_positions.setdefault(client_name, {})[symbol] = actual_qty
+            else:
+                # לקוח שהתרוקן יוצא מה-ClientPositionBook לבד
+                client_positions.get(client_name, {}).pop(symbol, None)
+
+    async def reconcile(self, clients, client_positions, copied_trades):
+        """🔄 שליפה מקבילית, השוואה ותיקון. מחזיר דוח עם זמן ריצה וכמות סטיות"""
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        report = {
+            "clients_checked": 0,
+            "clients_failed": 0,
+            "drifted_positions": 0,
+            "missing_positions": 0,
+            "unexpected_positions": 0,
+            "qty_drift_total": 0.0,
+        }
+
+        async def check(client):
+            client_name = client.key
+            async with semaphore:
+                try:
+                    actual = await self.fetch_client_positions(client)
+                except Exception as e:
+                    logger.warning(f"⚠️ שגיאה בשליפת פוזיציות ללקוח {client_name} בזמן reconciliation: {e}")
+                    actual = None
+
+            if actual is None:
+                report["clients_failed"] += 1
+                return
+
+            report["clients_checked"] += 1
+            stored = client_positions.get(client_name, {})
+            managed = set(stored) | set(copied_trades)
+            drifts = self.diff(stored, actual, managed)
+            if not drifts:
+                return
+
+            for symbol, stored_qty, actual_qty in drifts:
+                report["drifted_positions"] += 1
+                report["qty_drift_total"] += abs(stored_qty - actual_qty)
+                if actual_qty == 0:
+                    report["missing_positions"] += 1
+                elif stored_qty == 0:
+                    report["unexpected_positions"] += 1
+                logger.warning(
+                    f"🔧 סטייה אצל {client_name} על {symbol}: שמור {stored_qty}, בפועל {actual_qty}"
+                )
+
+            self.repair(client_positions, client_name, drifts)
+
+        await asyncio.gather(*[check(client) for client in clients], return_exceptions=True)
+
+        report["duration_seconds"] = time.perf_counter() - started
+        return report
+
+
+async def reconcile_on_startup(manager, reconciler=None):
+    """📦 שלב אתחול – מתקן את המצב השמור לפני ש-sync_trades מתחיל"""
+    reconciler = reconciler or manager.position_reconciler
+    clients = [client for client in manager.clients if client.key not in manager.shared_clients]
+    report = await reconciler.reconcile(clients, manager.client_positions, manager.copied_trades)
+
+    metrics.observe("reconcile_duration_seconds", report["duration_seconds"])
+    metrics.set_gauge("reconcile_drifted_positions", report["drifted_positions"])
+    metrics.set_gauge("reconcile_clients_failed", report["clients_failed"])
+
+    logger.info(
+        f"✅ reconciliation הסתיים תוך {report['duration_seconds']:.2f} שניות: "
+        f"{report['clients_checked']} לקוחות נבדקו, {report['clients_failed']} נכשלו, "
+        f"{report['drifted_positions']} סטיות ({report['missing_positions']} חסרות, "
+        f"{report['unexpected_positions']} לא צפויות)"
+    )
+
+    if report["drifted_positions"]:
+        await manager.save_state()
+    return report
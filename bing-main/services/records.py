@@ -0,0 +1,293 @@
+import sys
+from array import array
+from itertools import repeat
+from collections.abc import MutableMapping
+
+_ABSENT = float("nan")  # תא ריק במערך כמויות – אין פוזיציה
+
+
+class ClientIdTable:
+    """
+    🔢 מזהה מספרי קבוע לכל לקוח. השם עובר lowercase ו-intern פעם אחת, בהרשמה –
+    ומשם כל הקוד משתמש ב-key המוכן. המזהה הוא האינדקס במערכי הכמויות של ClientPositionBook.
+    """
+
+    __slots__ = ("ids", "names")
+
+    def __init__(self):
+        self.ids = {}  # {key: id}
+        self.names = []  # id → key
+
+    def intern(self, name):
+        client_id = self.ids.get(name)
+        if client_id is None:
+            key = name.lower()
+            client_id = self.ids.get(key)
+            if client_id is None:
+                key = sys.intern(key)
+                client_id = self.ids[key] = len(self.names)
+                self.names.append(key)
+        return client_id
+
+    def get(self, key):
+        return self.ids.get(key)
+
+    def key_of(self, client_id):
+        return self.names[client_id]
+
+    def __len__(self):
+        return len(self.names)
+
+
+# טבלה אחת לתהליך – המזהים יציבים גם כשרשימת הלקוחות נבנית מחדש
+client_ids = ClientIdTable()
+
+
+class ClientRecord:
+    """
+    👤 לקוח: id (מהטבלה), name המקורי, key (lowercase, interned), api ו-tier.
+    get / [] נשארו לתאימות עם קוד שניגש ללקוח כמו ל-dict.
+    """
+
+    __slots__ = ("id", "name", "key", "api", "tier")
+
+    def __init__(self, name, api, tier=None, ids=client_ids):
+        self.id = ids.intern(name)
+        self.key = ids.key_of(self.id)
+        self.name = name
+        self.api = api
+        self.tier = tier
+
+    def get(self, field, default=None):
+        return getattr(self, field) if field in ClientRecord.__slots__ else default
+
+    def __getitem__(self, field):
+        if field not in ClientRecord.__slots__:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __repr__(self):
+        return f"ClientRecord({self.name!r}, id={self.id})"
+
+
+class PositionRecord:
+    """📍 פוזיציית מאסטר פתוחה. מתעדכנת במקום בכל סבב במקום dict חדש; to_dict לשמירה במונגו"""
+
+    __slots__ = ("symbol", "qty", "side", "position_side", "leverage", "tp", "sl", "isolated", "unrealized_profit")
+
+    # שמות השדות במסמך המצב (כפי שה-Web וגרסאות קודמות קוראים אותם)
+    FIELDS = {
+        "qty": "qty", "side": "side", "position_side": "position_side", "leverage": "leverage",
+        "tp": "tp", "sl": "sl", "isolated": "isolated", "unrealized_profit": "unrealizedProfit",
+    }
+
+    def __init__(self, symbol, qty=0.0, side=None, position_side=None, leverage=0, tp=None, sl=None,
+                 isolated=False, unrealized_profit=None):
+        self.symbol = symbol
+        self.update(qty, side, position_side, leverage, tp, sl, isolated, unrealized_profit)
+
+    def update(self, qty, side, position_side, leverage, tp, sl, isolated, unrealized_profit):
+        self.qty = qty
+        self.side = side
+        self.position_side = position_side
+        self.leverage = leverage
+        self.tp = tp
+        self.sl = sl
+        self.isolated = isolated
+        self.unrealized_profit = unrealized_profit
+        return self
+
+    def get(self, field, default=None):
+        attr = _POSITION_ATTRS.get(field)
+        return getattr(self, attr) if attr is not None else default
+
+    def to_dict(self):
+        return {name: getattr(self, attr) for attr, name in self.FIELDS.items()}
+
+    @classmethod
+    def from_dict(cls, symbol, data):
+        if isinstance(data, cls):
+            return data
+        return cls(symbol, **{attr: data[name] for attr, name in cls.FIELDS.items() if name in data})
+
+
+_POSITION_ATTRS = {name: attr for attr, name in PositionRecord.FIELDS.items()}
+
+
+def positions_from_dict(data):
+    """
+    last_positions ממסמך המצב → {(symbol, position_side): PositionRecord}.
+    מסמכים ישנים ממופתחים לפי symbol בלבד; חדשים לפי "symbol:side" עם שדה symbol.
+    """
+    positions = {}
+    for key, position in (data or {}).items():
+        record = PositionRecord.from_dict(position.get("symbol") or key, position)
+        record.position_side = record.position_side or "BOTH"
+        positions[(record.symbol, record.position_side)] = record
+    return positions
+
+
+def positions_to_dict(positions):
+    """{(symbol, position_side): PositionRecord} → מסמך (מפתחות מחרוזת, למונגו)"""
+    return {
+        f"{symbol}:{position_side}": {"symbol": symbol, **position.to_dict()}
+        for (symbol, position_side), position in positions.items()
+    }
+
+
+class ClientPositions(MutableMapping):
+    """📒 {symbol: qty} של לקוח אחד – view מעל מערכי הכמויות של ClientPositionBook"""
+
+    __slots__ = ("book", "client_id")
+
+    def __init__(self, book, client_id):
+        self.book = book
+        self.client_id = client_id
+
+    def __getitem__(self, symbol):
+        column = self.book.columns.get(symbol)
+        if column is None or self.client_id >= len(column):
+            raise KeyError(symbol)
+        qty = column[self.client_id]
+        if qty != qty:  # NaN
+            raise KeyError(symbol)
+        return qty
+
+    def __setitem__(self, symbol, qty):
+        self.book.set(self.client_id, symbol, qty)
+
+    def __delitem__(self, symbol):
+        if not self.book.discard(self.client_id, symbol):
+            raise KeyError(symbol)
+
+    def __iter__(self):
+        client_id = self.client_id
+        for symbol, column in list(self.book.columns.items()):
+            if client_id < len(column) and column[client_id] == column[client_id]:
+                yield symbol
+
+    def __len__(self):
+        counts = self.book.counts
+        return counts[self.client_id] if self.client_id < len(counts) else 0
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class ClientPositionBook(MutableMapping):
+    """
+    📚 client_positions ({client_key: {symbol: qty}}) מעל מערך float אחד לכל סימבול,
+    באינדקס id הלקוח מ-ClientIdTable (NaN = אין פוזיציה). לקוח ללא פוזיציות לא "קיים" במיפוי –
+    כמו ב-dict המקורי, שמחק לקוח שהתרוקן.
+    """
+
+    def __init__(self, ids=client_ids):
+        self.ids = ids
+        self.columns = {}  # {symbol: array("d")}
+        self.holders = {}  # {symbol: מספר לקוחות עם פוזיציה}
+        self.counts = array("l")  # id → מספר סימבולים פתוחים
+        self.active = 0  # לקוחות עם פוזיציה אחת לפחות
+
+    # ---------- פעולות לפי id ----------
+
+    def set(self, client_id, symbol, qty):
+        column = self.columns.get(symbol)
+        if column is None:
+            column = self.columns[symbol] = array("d")
+            self.holders[symbol] = 0
+        if client_id >= len(column):
+            column.extend(repeat(_ABSENT, max(len(self.ids), client_id + 1) - len(column)))
+
+        previous = column[client_id]
+        column[client_id] = qty
+        if previous != previous:
+            self.holders[symbol] += 1
+            self._count(client_id, 1)
+
+    def discard(self, client_id, symbol):
+        column = self.columns.get(symbol)
+        if column is None or client_id >= len(column) or column[client_id] != column[client_id]:
+            return False
+        column[client_id] = _ABSENT
+        self._count(client_id, -1)
+        self.holders[symbol] -= 1
+        if not self.holders[symbol]:
+            # אף לקוח לא מחזיק – המערך משתחרר
+            del self.columns[symbol]
+            del self.holders[symbol]
+        return True
+
+    def _count(self, client_id, delta):
+        counts = self.counts
+        if client_id >= len(counts):
+            counts.extend(repeat(0, max(len(self.ids), client_id + 1) - len(counts)))
+        before = counts[client_id]
+        counts[client_id] = before + delta
+        if before == 0:
+            self.active += 1
+        elif counts[client_id] == 0:
+            self.active -= 1
+
+    def quantities(self, symbol):
+        """מערך הכמויות הגולמי של סימבול (או None) – לסריקות לפי id בלי views"""
+        return self.columns.get(symbol)
+
+    # ---------- ממשק המיפוי ----------
+
+    def _id_with_positions(self, key):
+        client_id = self.ids.get(key)
+        if client_id is None or client_id >= len(self.counts) or not self.counts[client_id]:
+            return None
+        return client_id
+
+    def __getitem__(self, key):
+        client_id = self._id_with_positions(key)
+        if client_id is None:
+            raise KeyError(key)
+        return ClientPositions(self, client_id)
+
+    def __setitem__(self, key, positions):
+        client_id = self.ids.intern(key)
+        positions = dict(positions)  # ייתכן שזה view של אותו לקוח
+        self._clear(client_id)
+        for symbol, qty in positions.items():
+            self.set(client_id, symbol, float(qty))
+
+    def __delitem__(self, key):
+        client_id = self._id_with_positions(key)
+        if client_id is None:
+            raise KeyError(key)
+        self._clear(client_id)
+
+    def _clear(self, client_id):
+        for symbol in list(ClientPositions(self, client_id)):
+            self.discard(client_id, symbol)
+
+    def __contains__(self, key):
+        return self._id_with_positions(key) is not None
+
+    def __iter__(self):
+        names = self.ids.names
+        for client_id, count in enumerate(self.counts):
+            if count:
+                yield names[client_id]
+
+    def __len__(self):
+        return self.active
+
+    def setdefault(self, key, default=None):
+        """כמו dict.setdefault(key, {}) – מחזיר view שאפשר לכתוב אליו (default מתעלמים ממנו)"""
+        return ClientPositions(self, self.ids.intern(key))
+
+    def to_dict(self):
+        return {key: dict(positions) for key, positions in self.items()}
+
+    @classmethod
+    def from_dict(cls, data, ids=client_ids):
+        book = cls(ids)
+        for key, positions in (data or {}).items():
+            book[key] = positions
+        return book
+
+    def __repr__(self):
+        return f"ClientPositionBook({self.active} לקוחות, {len(self.columns)} סימבולים)"
@@ -1,21 +1,41 @@
 import bcrypt
-from pymongo import MongoClient
-from cryptography.fernet import Fernet
-from core.config import MONGO_URI, DB_NAME, SECRET_KEY
+from core import config
 from core.logger import logger
 
-# יצירת אובייקט Fernet להצפנה/פענוח
-fernet = Fernet(SECRET_KEY)
+_fernet = None
+
+
+def get_fernet():
+    """🔐 אובייקט Fernet להצפנה/פענוח – נבנה בשימוש הראשון (ולא ב-import)"""
+    global _fernet
+    if _fernet is None:
+        from cryptography.fernet import Fernet
+        _fernet = Fernet(config.SECRET_KEY)
+    return _fernet
+
 
 class SecureAPIManager:
-    def __init__(self, uri=MONGO_URI, db_name=DB_NAME):
-        try:
-            self.client = MongoClient(uri)
-            self.db = self.client[db_name]
-          #  logger.info("✅ חיבור למסד הנתונים הצליח.")
-        except Exception as e:
-            logger.error(f"❌ שגיאה בחיבור ל־MongoDB: {e}")
-            raise e
+    def __init__(self, uri=None, db_name=None):
+        # החיבור נפתח רק בגישה הראשונה ל-db – יצירת המופע זולה ולא נוגעת ברשת
+        self.uri = uri
+        self.db_name = db_name
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            try:
+                from pymongo import MongoClient
+                self._client = MongoClient(self.uri or config.MONGO_URI)
+              #  logger.info("✅ חיבור למסד הנתונים הצליח.")
+            except Exception as e:
+                logger.error(f"❌ שגיאה בחיבור ל־MongoDB: {e}")
+                raise e
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.db_name or config.DB_NAME]
 
 
     def encrypt(self, value):
@@ -24,7 +44,7 @@ class SecureAPIManager:
                 logger.warning("⚠️ ערך להצפנה אינו מחרוזת – מומר אוטומטית")
                 value = str(value)
 
-            encrypted = fernet.encrypt(value.encode()).decode()
+            encrypted = get_fernet().encrypt(value.encode()).decode()
             return encrypted
 
         except Exception as e:
@@ -39,7 +59,7 @@ class SecureAPIManager:
                 logger.warning("⚠️ ערך לפענוח אינו מחרוזת – מומר אוטומטית")
                 value = str(value)
 
-            decrypted = fernet.decrypt(value.encode()).decode()
+            decrypted = get_fernet().decrypt(value.encode()).decode()
             return decrypted
 
         except Exception as e:
@@ -96,7 +116,9 @@ class SecureAPIManager:
                     "api_key": self.decrypt(doc.get("api_key", "")),
                     "secret_key": self.decrypt(doc.get("secret_key", "")),
                     "subscription_start": doc.get("subscription_start", ""),
-                    "subscription_end": doc.get("subscription_end", "")
+                    "subscription_end": doc.get("subscription_end", ""),
+                    "tier": doc.get("tier"),
+                    "masters": doc.get("masters")  # שמות המאסטרים שהלקוח עוקב אחריהם (None = המאסטר הראשי)
                 })
             except Exception as e:
                 logger.warning(f"❌ שגיאה בפענוח לקוח {doc.get('name', 'לא ידוע')}: {e}")
@@ -125,6 +147,21 @@ class SecureAPIManager:
             raise
 
 
+    def get_masters(self):
+        """🧑‍✈️ כל מסמכי MASTER (מצב כמה מאסטרים). name=None – המסמך הראשי, כמו ב-get_master"""
+        masters = []
+        for doc in self.db.MASTER.find({}):
+            masters.append({
+                "name": doc.get("name"),
+                "api_key": self.decrypt(doc.get("api_key", "")),
+                "secret_key": self.decrypt(doc.get("secret_key", ""))
+            })
+        if not masters:
+            logger.error("🔴 לא נמצא MASTER במסד הנתונים")
+            raise Exception("🔴 לא נמצא MASTER במסד הנתונים")
+        return masters
+
+
     def validate_user(self, username, password):
         try:
             for user in self.db.users.find({}):
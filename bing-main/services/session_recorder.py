@@ -0,0 +1,114 @@
+import gzip
+import json
+import time
+import bisect
+from core.logger import logger
+from utils.bingx_api import BingXAPI
+
+
+# נתיבי המאסטר שמוקלטים: פוזיציות, פקודות פתוחות ויתרה
+RECORDED_PATHS = {
+    "/openApi/swap/v2/user/positions": "positions",
+    "/openApi/swap/v2/trade/openOrders": "open_orders",
+    "/openApi/swap/v3/user/balance": "balance",
+}
+
+
+class SessionRecorder:
+    """
+    📼 הקלטת תגובות גולמיות של המאסטר לקובץ JSONL דחוס (gzip).
+    כל שורה: {"t": שניות מתחילת ההקלטה, "kind", "symbol", "response"}
+    """
+
+    def __init__(self, path, flush_every=50):
+        self.path = path
+        self.flush_every = flush_every
+        self.started_at = time.time()
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._pending = 0
+        self._file.write(json.dumps({"t": 0, "kind": "header", "started_at": self.started_at}) + "\n")
+        logger.info(f"📼 הקלטת סשן מאסטר אל {path}")
+
+    def record(self, path, params, response):
+        kind = RECORDED_PATHS.get(path)
+        if kind is None:
+            return
+
+        line = {
+            "t": round(time.time() - self.started_at, 4),
+            "kind": kind,
+            "symbol": params.get("symbol"),
+            "response": response,
+        }
+        try:
+            self._file.write(json.dumps(line, separators=(",", ":")) + "\n")
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._file.flush()
+                self._pending = 0
+        except Exception as e:
+            logger.error(f"❌ שגיאה בכתיבת הקלטת סשן: {e}")
+
+    def close(self):
+        self._file.close()
+
+
+def load_recording(path):
+    """טוען הקלטה ומחזיר {(kind, symbol): ([t...], [response...])} ממוין לפי זמן"""
+    tracks = {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for raw in f:
+            entry = json.loads(raw)
+            if entry.get("kind") == "header":
+                continue
+            times, responses = tracks.setdefault((entry["kind"], entry.get("symbol")), ([], []))
+            times.append(entry["t"])
+            responses.append(entry["response"])
+    return tracks
+
+
+class ReplayBingXAPI(BingXAPI):
+    """
+    ▶️ מאסטר מדומה שמחזיר את התגובה המוקלטת האחרונה שזמנה <= שעון ההשמעה.
+    שעון ההשמעה = זמן אמיתי מאז start() כפול speed (1x או מואץ).
+    """
+
+    def __init__(self, recording_path, speed=1.0):
+        super().__init__("replay", "replay")
+        self.tracks = load_recording(recording_path)
+        self.speed = speed
+        self.duration = max((times[-1] for times, _ in self.tracks.values()), default=0)
+        self.started_at = None
+        self.first_seen = {}  # {symbol: perf_counter} – מתי סימבול הופיע לראשונה בפוזיציות שהוגשו
+
+    def start(self):
+        self.started_at = time.perf_counter()
+
+    def replay_time(self):
+        if self.started_at is None:
+            self.start()
+        return (time.perf_counter() - self.started_at) * self.speed
+
+    def finished(self):
+        return self.replay_time() > self.duration
+
+    async def start_session(self):
+        pass
+
+    async def _send_request(self, method, path, params_map, max_retries=5):
+        kind = RECORDED_PATHS.get(path)
+        track = self.tracks.get((kind, params_map.get("symbol")))
+        if kind is None or track is None:
+            return {"code": -1, "msg": f"replay: אין הקלטה עבור {path}"}
+
+        times, responses = track
+        index = max(bisect.bisect_right(times, self.replay_time()) - 1, 0)
+        response = responses[index]
+
+        if kind == "positions":
+            now = time.perf_counter()
+            for position in response.get("data") or []:
+                if float(position.get("positionAmt", 0) or 0) != 0:
+                    self.first_seen.setdefault(position["symbol"], now)
+
+        return response
@@ -0,0 +1,284 @@
+import signal
+import asyncio
+import json
+import time
+import zlib
+import multiprocessing
+from collections import deque
+from core.logger import logger, use_process_log_file
+from core.metrics import metrics
+from core.config import SHARD_ACK_TIMEOUT
+
+
+def shard_for(client_name, shard_count):
+    """🔀 מחזיר את מספר ה-shard של לקוח לפי hash יציב של השם (זהה בין תהליכים והרצות)"""
+    if shard_count <= 1:
+        return 0
+    key = str(client_name).strip().lower().encode("utf-8")
+    return zlib.crc32(key) % shard_count
+
+
+class MasterEventBroadcaster:
+    """
+    📡 שרת IPC מקומי בתהליך המאסטר.
+    כל worker מתחבר ב-TCP ל-127.0.0.1, מזדהה בשורת hello עם הסמן (epoch, seq) של האירוע האחרון שביצע,
+    ומקבל את אירועי המסחר כשורות JSON. על כל אירוע שביצע הוא מחזיר {"ack": seq}.
+
+    כל אירוע מקבל מספר רץ ונשמר ביומן עד שכל ה-shards אישרו אותו – worker שעלה באיחור או התחבר מחדש
+    מקבל קודם את כל מה שפספס, כך ש-copied_trades של המאסטר לא מסמן עסקה שלא הגיעה ללקוחות.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, shard_count=1, ack_timeout=SHARD_ACK_TIMEOUT, max_log=10000):
+        self.host = host
+        self.port = port
+        self.shard_count = shard_count
+        self.ack_timeout = ack_timeout
+        self.max_log = max_log
+        self.server = None
+        self.epoch = str(int(time.time() * 1000))  # מזהה הרצה של המאסטר – סמן מהרצה קודמת לא תקף ביומן הנוכחי
+        self.seq = 0
+        self.log = deque()  # [(seq, line)] – אירועים שלא כל ה-shards אישרו
+        self.writers = {}  # {shard_index: writer}
+        self.acked = {}  # {shard_index: seq אחרון שבוצע}
+        self._ack_event = asyncio.Event()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._on_connect, self.host, self.port)
+        logger.info(f"📡 שרת אירועי מאסטר מאזין על {self.host}:{self.port} ({self.shard_count} shards)")
+
+    async def _on_connect(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        shard = None
+        try:
+            hello = json.loads(await asyncio.wait_for(reader.readline(), 10))
+            shard = int(hello["hello"])
+            last_seq = int(hello.get("seq") or 0) if hello.get("epoch") == self.epoch else 0
+            self._on_ack(shard, last_seq, replace=True)
+
+            # השלמת מה שפוספס ורישום ה-writer בלי await ביניהם – אירוע חדש לא נכנס באמצע ולא נשלח פעמיים
+            missed = [line for seq, line in self.log if seq > last_seq]
+            if self.log and self.log[0][0] > last_seq + 1:
+                logger.error(f"🚨 shard #{shard} פספס אירועים שכבר נמחקו מהיומן (מ-#{last_seq + 1} עד #{self.log[0][0] - 1})")
+            previous = self.writers.get(shard)
+            if previous is not None:
+                previous.close()
+            self.writers[shard] = writer
+            for line in missed:
+                writer.write(line)
+            logger.info(f"🔌 shard #{shard} התחבר לשרת האירועים ({peer}) – {len(missed)} אירועים הושלמו מהיומן")
+            await writer.drain()
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self._on_ack(shard, int(json.loads(line)["ack"]))
+        except (ValueError, KeyError, TypeError, asyncio.TimeoutError) as e:
+            logger.error(f"❌ הודעה לא תקינה מ-worker {peer}: {e}")
+        except ConnectionError:
+            pass
+        finally:
+            if shard is not None and self.writers.get(shard) is writer:
+                del self.writers[shard]
+            writer.close()
+
+    def _on_ack(self, shard, seq, replace=False):
+        # ב-hello ה-worker הוא מקור האמת (למשל אחרי הפעלה מחדש); ack רגיל רק מתקדם
+        self.acked[shard] = seq if replace else max(self.acked.get(shard, 0), seq)
+        self._ack_event.set()
+        self._trim_log()
+
+    def _trim_log(self):
+        done = min(self.acked.get(i, 0) for i in range(self.shard_count))
+        while self.log and self.log[0][0] <= done:
+            self.log.popleft()
+        while len(self.log) > self.max_log:
+            seq, _ = self.log.popleft()
+            metrics.inc("shard_events_dropped")
+            logger.error(f"🚨 יומן האירועים מלא – אירוע #{seq} נמחק לפני שכל ה-shards אישרו אותו")
+        metrics.set_gauge("shard_event_log_size", len(self.log))
+
+    async def publish(self, event):
+        """
+        שולח אירוע לכל ה-workers המחוברים ומחכה (עד ack_timeout) ל-ack מכולם.
+        shard לא מחובר או שלא אישר בזמן מקבל את האירוע מהיומן כשיתחבר. מחזיר True אם כל ה-shards אישרו.
+        """
+        self.seq += 1
+        seq = self.seq
+        line = (json.dumps({**event, "epoch": self.epoch, "seq": seq}) + "\n").encode("utf-8")
+        self.log.append((seq, line))
+        self._trim_log()
+
+        # write לכולם לפני ה-drain – שני פרסומים במקביל לא מחליפים סדר אצל אף worker
+        connected = list(self.writers.items())
+        for shard, writer in connected:
+            try:
+                writer.write(line)
+            except Exception as e:
+                logger.error(f"❌ שגיאה בשליחת אירוע ל-shard #{shard}: {e}")
+        results = await asyncio.gather(*[writer.drain() for _, writer in connected], return_exceptions=True)
+        for (shard, _), result in zip(connected, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ שגיאה בשליחת אירוע ל-shard #{shard}: {result}")
+
+        await self._wait_for_acks(seq, [shard for shard, _ in connected])
+
+        missing = [i for i in range(self.shard_count) if self.acked.get(i, 0) < seq]
+        if missing:
+            metrics.inc("shard_events_pending")
+            logger.warning(
+                f"⚠️ אירוע #{seq} ({event.get('type')} {event.get('symbol')}) טרם אושר ע\"י shards {missing} – "
+                f"נשמר ביומן ויישלח כשיתחברו"
+            )
+        return not missing
+
+    async def _wait_for_acks(self, seq, shards):
+        # מחכים רק ל-shards שהיו מחוברים – shard מנותק יקבל את האירוע ב-hello הבא שלו
+        deadline = time.monotonic() + self.ack_timeout
+        while any(self.acked.get(shard, 0) < seq and shard in self.writers for shard in shards):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._ack_event.clear()
+            try:
+                await asyncio.wait_for(self._ack_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    async def close(self):
+        if self.log:
+            logger.warning(f"⚠️ שרת האירועים נסגר עם {len(self.log)} אירועים שלא כל ה-shards אישרו")
+        for writer in list(self.writers.values()):
+            writer.close()
+        self.writers.clear()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+class ShardWorker:
+    """👷 צרכן אירועים בתהליך worker – מפעיל את TradeManager של ה-shard על כל אירוע"""
+
+    def __init__(self, manager, host="127.0.0.1", port=8765, reconnect_delay=1):
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self.reconnect_delay = reconnect_delay
+        self.stopping = False
+        self._waiting = None  # ההמתנה הנוכחית לאירוע / חיבור – מבוטלת ב-stop()
+
+    def stop(self):
+        """🛑 הפסקת קבלת אירועים: אירוע שבביצוע מסתיים, המתנה לאירוע הבא מבוטלת"""
+        self.stopping = True
+        self.manager.request_stop()
+        if self._waiting is not None:
+            self._waiting.cancel()
+
+    async def _wait(self, awaitable):
+        self._waiting = asyncio.ensure_future(awaitable)
+        try:
+            return await self._waiting
+        finally:
+            self._waiting = None
+
+    @staticmethod
+    def _line(message):
+        return (json.dumps(message) + "\n").encode("utf-8")
+
+    async def _apply(self, event):
+        """ביצוע אירוע פעם אחת: אירוע שכבר בוצע (השלמה מהיומן אחרי ניתוק) רק מאושר שוב"""
+        cursor = self.manager.event_cursor or {}
+        seq = event.get("seq")
+        if seq is not None and event.get("epoch") == cursor.get("epoch") and seq <= cursor.get("seq", 0):
+            return
+        await self.manager.handle_event(event)
+        if seq is not None:
+            self.manager.event_cursor = {"epoch": event.get("epoch"), "seq": seq}
+            await self.manager.save_state()
+
+    async def run(self):
+        while not self.stopping:
+            try:
+                reader, writer = await self._wait(asyncio.open_connection(self.host, self.port))
+            except OSError:
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            except asyncio.CancelledError:
+                if self.stopping:
+                    return
+                raise
+
+            logger.info(f"✅ shard #{self.manager.shard_index} מחובר לשרת האירועים")
+            try:
+                # hello: הסמן של האירוע האחרון שבוצע – המאסטר משלים מהיומן את כל מה שאחריו
+                cursor = self.manager.event_cursor or {}
+                writer.write(self._line({"hello": self.manager.shard_index, "epoch": cursor.get("epoch"), "seq": cursor.get("seq", 0)}))
+                await writer.drain()
+
+                while not self.stopping:
+                    try:
+                        line = await self._wait(reader.readline())
+                    except asyncio.CancelledError:
+                        if self.stopping:
+                            break
+                        raise
+                    if not line:
+                        break
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        logger.error(f"❌ אירוע לא תקין התקבל: {line!r}")
+                        continue
+                    await self._apply(event)
+                    if event.get("seq") is not None:
+                        writer.write(self._line({"ack": event["seq"]}))
+                        await writer.drain()
+            except Exception as e:
+                logger.exception(f"❌ שגיאה בקריאת אירועים ב-shard #{self.manager.shard_index}: {e}")
+            finally:
+                writer.close()
+
+            if self.stopping:
+                return
+            logger.warning(f"⚠️ shard #{self.manager.shard_index} התנתק – מתחבר מחדש")
+            await asyncio.sleep(self.reconnect_delay)
+
+
+async def _run_shard_worker(shard_index, shard_count, host, port):
+    from services.trade_manager import TradeManager
+    from services.position_reconciler import reconcile_on_startup
+
+    manager = TradeManager(shard_index=shard_index, shard_count=shard_count)
+    loop = asyncio.get_event_loop()
+    manager.start_background_tasks(loop)
+    await manager.load_state()
+    await reconcile_on_startup(manager)
+    manager.add_background_task(manager.drift_auditor.run(), loop)
+
+    worker = ShardWorker(manager, host, port)
+    # 🛑 SIGTERM מהתהליך הראשי (אחרי שה-master watcher כבר נסגר); Ctrl+C מגיע לכל הקבוצה – מתעלמים
+    loop.add_signal_handler(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        await worker.run()
+    finally:
+        await manager.close()
+
+
+def run_shard_worker(shard_index, shard_count, host="127.0.0.1", port=8765):
+    """נקודת כניסה לתהליך worker – לולאת asyncio נפרדת, session וקובץ לוג משלו"""
+    use_process_log_file(f"shard{shard_index}")
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(_run_shard_worker(shard_index, shard_count, host, port))
+
+
+def start_shard_workers(shard_count, host="127.0.0.1", port=8765):
+    """🚀 מפעיל N תהליכי worker (spawn – בטוח גם כשיש threads בתהליך הראשי)"""
+    ctx = multiprocessing.get_context("spawn")
+    processes = []
+    for i in range(shard_count):
+        p = ctx.Process(target=run_shard_worker, args=(i, shard_count, host, port), daemon=True, name=f"shard-{i}")
+        p.start()
+        processes.append(p)
+    return processes
@@ -0,0 +1,80 @@
+from utils.bingx_api import BingXAPI
+from utils.connection_pool import ConnectionPoolManager
+from utils.adaptive_concurrency import AIMDConcurrencyController
+from utils.mock_exchange import MockExchange, NullOrderSink
+from services.order_coalescer import OrderCoalescer
+from services.balance_manager import new_balance_cache
+from services.records import ClientRecord
+from services.trade_state_mongo import TradeStateMongoManager
+from send_telegram_message import close_bot
+from core.config import (
+    POOL_LIMIT, POOL_LIMIT_PER_HOST, POOL_PREWARM_CONNECTIONS, ORDER_COALESCE_WINDOW, DRY_RUN,
+    FANOUT_INITIAL_CONCURRENCY, FANOUT_MIN_CONCURRENCY, FANOUT_MAX_CONCURRENCY
+)
+
+
+class SharedResources:
+    """
+    🔗 משאבים ברמת התהליך, משותפים לכל ה-TradeManager-ים (מאסטר אחד או כמה):
+    - session ומאגר חיבורים אחד ל-BingX
+    - בקר AIMD ו-OrderCoalescer אחד – פקודות של אותו לקוח משני מאסטרים נכנסות לאותו חלון ולאותו תקציב
+    - ClientRecord / BingXAPI אחד לכל לקוח (מצב HMAC ו-backoff של 429 משותפים)
+    - מטמון יתרות הלקוחות, מצב המינוף / margin שהוחל אצל כל לקוח, ו-client אחד של מונגו
+    """
+
+    def __init__(self, api_factory=BingXAPI):
+        self.api_factory = api_factory
+
+        # 🧪 dry-run: יעד אחד לכל הפקודות בתהליך
+        self.order_sink = None
+        if DRY_RUN == "null":
+            self.order_sink = NullOrderSink()
+        elif DRY_RUN == "simulator":
+            self.order_sink = MockExchange()
+
+        self.order_coalescer = OrderCoalescer(ORDER_COALESCE_WINDOW) if ORDER_COALESCE_WINDOW > 0 else None
+        self.concurrency_controller = AIMDConcurrencyController(
+            initial=FANOUT_INITIAL_CONCURRENCY,
+            min_limit=FANOUT_MIN_CONCURRENCY,
+            max_limit=FANOUT_MAX_CONCURRENCY
+        )
+        self.connection_pool = ConnectionPoolManager(
+            limit=POOL_LIMIT,
+            limit_per_host=POOL_LIMIT_PER_HOST,
+            prewarm_connections=POOL_PREWARM_CONNECTIONS
+        )
+        self.session = self.connection_pool.create_session()
+
+        self.balance_cache = new_balance_cache()
+        self.execution_plans = None  # ה-ExecutionPlanCache הראשון – האחרים חולקים איתו את המצב שהוחל
+        self._state_root = None  # מנהל המצב הראשון – מחזיק את ה-client של מונגו
+        self._clients = {}  # {key: ClientRecord}
+
+    def client_record(self, config):
+        """ClientRecord ללקוח – אותו מופע לכל המאסטרים; BingXAPI חדש רק ללקוח חדש או למפתחות שהוחלפו"""
+        client = self._clients.get(config["name"].lower())
+        if client is None or client.api.api_key != config["api_key"] or client.api.secret_key != config["secret_key"]:
+            client = ClientRecord(config["name"], self.api_factory(config["api_key"], config["secret_key"], session=self.session))
+            client.api.order_sink = self.order_sink
+            client.api.coalescer = self.order_coalescer
+            client.api.concurrency_controller = self.concurrency_controller
+            self._clients[client.key] = client
+        client.tier = config.get("tier")  # 🏅 שכבת מנוי (אופציונלי) – ל-FANOUT_ORDERING=tier_subscription
+        return client
+
+    def retain_clients(self, keys):
+        """שחרור רשומות של לקוחות שאף מאסטר כבר לא מחזיק"""
+        for key in [key for key in self._clients if key not in keys]:
+            del self._clients[key]
+
+    def state_store(self, state_id):
+        store = TradeStateMongoManager(state_id=state_id, shared=self._state_root)
+        if self._state_root is None:
+            self._state_root = store
+        return store
+
+    async def close(self):
+        await close_bot()
+        await self.connection_pool.close()
+        if self._state_root is not None:
+            self._state_root.close()
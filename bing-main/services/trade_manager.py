@@ -2,49 +2,147 @@ import time
 import asyncio
 from utils.bingx_api import BingXAPI
 from services.trade_operations import TradeOperations  # ✅ מייבא את המחלקה החדשה
-from services.trade_state_mongo import TradeStateMongoManager  # ✅ שימוש במונגו
-import aiohttp
+from services.trade_state_mongo import FencedWriteError
 from load_apis_from_db import load_apis_from_db  # נניח ששמרת את הפונקציה בקובץ בשם זה
-from core.logger import logger
+from core.logger import logger, log_context, new_event_id
+from core.metrics import metrics
 from services.trade_math_utils import calculate_master_pct_by_available_margin
 from services.balance_manager import BalanceManager
+from services.sharding import shard_for
+from services.position_reconciler import PositionReconciler
+from services.drift_auditor import DriftAuditor
+from services.session_recorder import SessionRecorder
+from send_telegram_message import set_message_prefix, send_telegram_message
+from services.master_executor import MasterRequestExecutor
+from services.shared_resources import SharedResources
+from services.fanout_scheduler import FanoutScheduler, build_ordering_policy
+from services.master_snapshot import fetch_master_snapshot
+from services.execution_plans import ExecutionPlanCache
+from services.records import ClientPositionBook, positions_from_dict, positions_to_dict
+from services.position_diff import PositionDiffEngine, OPEN, INCREASE, DECREASE, LEVERAGE, CLOSE
+from utils.time_sync import server_clock
+from core.bootstrap import startup
+from core.profiling import profiler
+from core.config import (
+    AUDIT_CLIENTS_PER_MINUTE, AUDIT_AUTO_CORRECT, RECORD_SESSION_PATH, DRY_RUN,
+    TIME_SYNC_INTERVAL, RECV_WINDOW_MS, FANOUT_ORDERING, SHUTDOWN_DRAIN_SECONDS,
+    MASTER_CONCURRENCY, MASTER_REQUESTS_PER_SECOND
+)
 
 
 
 
 class TradeManager:
 
-    def __init__(self):
+    STATE_REFRESH_INTERVAL = 5  # שניות – שמירת מצב גם בלי שינויים (PNL עדכני לדשבורד)
+
+    def __init__(self, shard_index=None, shard_count=1, event_sink=None, partition_leases=None,
+                 config=None, mongo_state=None, master_api=None, api_factory=BingXAPI,
+                 resources=None, master_name=None):
         #logger.info("📌 TradeManager הופעל!")
-        self.balance_manager = BalanceManager()
 
-        config = load_apis_from_db()
+        # 🔗 session, לקוחות, בקר AIMD, איחוד פקודות ומטמון יתרות – משותפים כשכמה מאסטרים רצים בתהליך אחד
+        # (MasterGroup מעביר resources); אחרת ה-manager מחזיק אותם לבד וסוגר אותם ב-close()
+        self._owns_resources = resources is None
+        self.resources = resources or SharedResources(api_factory)
+        self.master_name = master_name  # None = המאסטר הראשי (מסמך MASTER בלי שם)
+        # לקוחות שעוקבים גם אחרי מאסטר אחר בתהליך – הפוזיציה בבורסה לא שייכת רק לנו (לא בביקורת / reconcile)
+        self.shared_clients = frozenset()
+
+        if self._owns_resources:
+            self.balance_manager = BalanceManager()
+        else:
+            # לכל מאסטר תקציב קריאות משלו (חשבון BingX נפרד), מטמון יתרות הלקוחות משותף
+            self.balance_manager = BalanceManager(
+                balance_cache=self.resources.balance_cache,
+                master_executor=MasterRequestExecutor(MASTER_CONCURRENCY, MASTER_REQUESTS_PER_SECOND),
+                master_name=f"master:{master_name or 'default'}"
+            )
+
+        # 🔀 מצב sharding: ל-worker יש רק את הלקוחות של ה-shard שלו,
+        # ולתהליך המאסטר (event_sink) אין לקוחות בכלל – הוא רק משדר אירועים
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.event_sink = event_sink
+
+        # 🗂️ מצב cluster: לקוחות נסחרים רק אם המחיצה שלהם ב-lease של ה-node הזה
+        self.partition_leases = partition_leases
+        self._saved_partition_positions = {}
+
+        # 🔥 hot standby: ה-lease של ה-primary (None = לא במצב HA); נקבע ב-attach_leader_lease
+        self.leader_lease = None
+
+        # config / mongo_state / master_api / api_factory ניתנים להזרקה (למשל בהשמעת סשן מוקלט)
+        config = config or load_apis_from_db()
+
+        # 🧪 dry-run: כל פקודות הלקוחות נבנות ונחתמות, אבל נשלחות לסינק ריק ("null") או לסימולטור ("simulator")
+        self.dry_run = DRY_RUN
+        self.order_sink = self.resources.order_sink
+        if self.order_sink is not None:
+            set_message_prefix("🧪 [DRY-RUN] ")
+            logger.warning(f"🧪 TradeManager רץ במצב dry-run ({DRY_RUN}) – שום פקודה לא תגיע ל-BingX")
         self.clients = []
         self.last_clients_refresh_time = 0
         self.clients_refresh_interval = 10  # שניות
 
 
 
-        # 🔵 יצירת session משותף
-        self.shared_session = aiohttp.ClientSession()
+        # 📦 איחוד פקודות של אותו לקוח בחלון קצר לבקשות batch (0 = כבוי)
+        self.order_coalescer = self.resources.order_coalescer
 
-        # 🧠 אתחול המאסטר והלקוחות עם אותו session
-        self.master_api = BingXAPI(config["master"]["api_key"], config["master"]["secret_key"], session=self.shared_session)
-        self.clients = [
-            {"name": client["name"], "api": BingXAPI(client["api_key"], client["secret_key"], session=self.shared_session)}
-            for client in config["clients"]
-        ]
+        # 📈 בקר מקביליות AIMD אחד לכל מסלולי הפיזור – מגיב להשהיות ול-429 של הבורסה
+        self.concurrency_controller = self.resources.concurrency_controller
+
+        # 🔵 session משותף מעל מאגר חיבורים מנוהל ל-BingX
+        self.connection_pool = self.resources.connection_pool
+        self.shared_session = self.resources.session
 
-        self.last_positions = {}
+        # 🧠 אתחול המאסטר והלקוחות עם אותו session
+        self.master_api = master_api or BingXAPI(config["master"]["api_key"], config["master"]["secret_key"], session=self.shared_session)
+        if RECORD_SESSION_PATH and master_api is None and master_name is None:
+            # 📼 הקלטת כל תגובות המאסטר הגולמיות לניתוח והשמעה offline (רק המאסטר הראשי – קובץ אחד)
+            self.master_api.recorder = SessionRecorder(RECORD_SESSION_PATH)
+        self.client_configs = config["clients"]
+        self.clients = self._build_clients(self.client_configs)
+
+        # 🧮 מצב פוזיציות המאסטר לפי (symbol, positionSide); last_positions הוא אותו dict
+        self.position_diff = PositionDiffEngine()
+        self.last_positions = self.position_diff.positions
+        self._pending_opens = set()  # מפתחות שנפתחו אצל המאסטר וטרם נשלחו ללקוחות
+        self._pending_closes = set()  # סימבולים שסגירתם נקטעה בכיבוי – ממשיכים בסבב הראשון
+        self._last_state_save = 0.0
+        self.event_cursor = None  # worker של shard: {"epoch", "seq"} של האירוע האחרון שבוצע
         self.copied_trades = {}
         self.queue = asyncio.Queue()
-        self.client_positions = {}
+        self.client_positions = ClientPositionBook()
         self.closed_trades = set()
         self.client_balances = {}  # ⬅️ זיכרון מקומי ליתרות הלקוחות
 
-
-        # ✅ מחובר למונגו
-        self.mongo_state = TradeStateMongoManager()
+        # 🛑 כיבוי מסודר: stopping עוצר את הזיהוי, close() מנקז ומשחרר משאבים
+        self.stopping = False
+        self._closed = False
+        self._background_tasks = []
+        self._queue_workers = set()
+
+
+        # ✅ מחובר למונגו (לכל shard מסמך מצב משלו כדי שלא ידרסו זה את זה)
+        if partition_leases is not None:
+            state_id = f"state_node_{partition_leases.node_id}"
+        elif shard_index is not None:
+            state_id = f"state_shard_{shard_index}"
+        else:
+            state_id = "state"
+        if master_name is not None:
+            state_id = f"{state_id}_{master_name}"  # מצב נפרד לכל מאסטר נוסף
+        if self.order_sink is not None:
+            state_id = f"{state_id}_dry_run"  # לא לגעת במצב האמיתי
+        self.mongo_state = mongo_state or self.resources.state_store(state_id)
+
+        # ⚡ מינוף / margin / תבניות פקודה מוכנים מראש לסימבולים שהמאסטר סחר בהם לאחרונה
+        # (מה שכבר הוחל אצל כל לקוח משותף לכל המאסטרים)
+        self.execution_plans = ExecutionPlanCache(self.master_api, lambda: self.clients, shared=self.resources.execution_plans)
+        if self.resources.execution_plans is None:
+            self.resources.execution_plans = self.execution_plans
 
         self.trade_operations = TradeOperations(
             self.master_api,
@@ -53,17 +151,69 @@ class TradeManager:
             self.client_positions,
             self.copied_trades,
             self.closed_trades,
-            save_state_func=self.save_state
+            save_state_func=self.save_state,
+            balance_manager=self.balance_manager,
+            concurrency_controller=self.concurrency_controller,
+            scheduler=FanoutScheduler(build_ordering_policy(FANOUT_ORDERING, lambda: self.client_balances)),
+            execution_plans=self.execution_plans,
+            can_trade=self._owns_client if partition_leases is not None else None
         )
 
+        # 🔍 השוואת פוזיציות מול הבורסה (באתחול) וביקורת סטיות מתגלגלת (בזמן מסחר)
+        self.position_reconciler = PositionReconciler()
+        self.drift_auditor = DriftAuditor(
+            self,
+            self.position_reconciler,
+            clients_per_minute=AUDIT_CLIENTS_PER_MINUTE,
+            auto_correct=AUDIT_AUTO_CORRECT,
+            # worker של shard לא מריץ sync_trades – את תמונת המאסטר הוא מושך לבד לפני כל ביקורת
+            master_view=self.refresh_master_view if shard_index is not None else None
+        )
 
 
+
+    def _build_clients(self, client_configs):
+        if self.event_sink is not None:
+            return []
+
+        records = {}
+        for config in client_configs:
+            if not self._owns_client(config["name"]):
+                continue
+            # שימוש חוזר ב-ClientRecord / BingXAPI (ומצב HMAC) – חדש רק ללקוח חדש או למפתחות שהוחלפו
+            client = self.resources.client_record(config)
+            records[client.key] = client
+        if self._owns_resources:
+            self.resources.retain_clients(records)
+        return list(records.values())
+
+    def _owns_client(self, name):
+        if self.partition_leases is not None:
+            return self.partition_leases.owns(shard_for(name, self.partition_leases.partition_count))
+        return self.shard_index is None or shard_for(name, self.shard_count) == self.shard_index
+
+    def attach_leader_lease(self, lease):
+        """🔥 מצב HA: מסחר וכתיבת מצב רק תחת lease בתוקף – נבדק לפני כל קריאה לבורסה בפיזור"""
+        self.leader_lease = lease
+        self.mongo_state.require_fencing = True
+        self.trade_operations.can_trade = self._may_dispatch
+
+    def is_primary(self):
+        return self.leader_lease is None or self.leader_lease.valid()
+
+    def _may_dispatch(self, name):
+        return self.is_primary() and self._owns_client(name)
+
     def load_clients(self):
         config = load_apis_from_db()
-        return [
-            {"name": client["name"], "api": BingXAPI(client["api_key"], client["secret_key"], session=self.shared_session)}
-            for client in config["clients"]
-        ]
+        self.client_configs = config["clients"]
+        return self._build_clients(self.client_configs)
+
+    def update_client_configs(self, client_configs):
+        """רשימת מנויים חדשה מבחוץ (MasterGroup טוען את כל הלקוחות פעם אחת ומחלק לפי מאסטר)"""
+        self.client_configs = client_configs
+        self.clients = self._build_clients(client_configs)
+        self.trade_operations.update_clients(self.clients)
 
 
     def refresh_clients_if_needed(self):
@@ -78,47 +228,137 @@ class TradeManager:
     async def save_state(self):
         try:
             state_data = {
-                "last_positions": self.last_positions,
+                "last_positions": positions_to_dict(self.last_positions),
                 "copied_trades": self.copied_trades,
-                "client_positions": self.trade_operations.client_positions,
-                "closed_trades": list(self.closed_trades)
+                "client_positions": self.trade_operations.client_positions.to_dict(),
+                "closed_trades": list(self.closed_trades),
+                "pending_closes": list(self._pending_closes),
+                "event_cursor": self.event_cursor
             }
 
+            if self.partition_leases is not None:
+                # במצב cluster הפוזיציות נשמרות לפי מחיצה ולא במסמך של ה-node
+                state_data["client_positions"] = {}
+                await self._save_partition_positions()
+
             await self.mongo_state.save_state(state_data)
             #logger.info("📂 מצב נשמר למונגו בהצלחה")
+        except FencedWriteError as e:
+            metrics.inc("ha_fenced_writes")
+            logger.critical(f"🚨 {e}")
         except Exception as e:
             logger.error(f"❌ שגיאה בשמירת מצב למונגו: {e}")
 
     async def load_state(self):
         try:
             data = await self.mongo_state.load_state()
-            self.last_positions = data.get("last_positions", {})
-            self.copied_trades = data.get("copied_trades", {})
-            self.client_positions = data.get("client_positions", {})
-            self.closed_trades = set(data.get("closed_trades", []))
+            self.apply_state(data)
 
-            # ✅ מסנכרן גם את TradeOperations
-            self.trade_operations.last_positions = self.last_positions
-            self.trade_operations.client_positions = self.client_positions
-            self.trade_operations.copied_trades = self.copied_trades
-            self.trade_operations.closed_trades = self.closed_trades
+            if self.partition_leases is not None:
+                await self._load_partition_positions(self.partition_leases.owned_partitions())
 
             #logger.info(f"📦 מצב נטען: {len(self.client_positions)} לקוחות עם פוזיציות")
 
         except Exception as e:
             logger.error(f"❌ שגיאה בטעינת מצב ממונגו: {e}")
-            self.last_positions = {}
+            self.position_diff.load({})
+            self.last_positions = self.position_diff.positions
             self.copied_trades = {}
-            self.client_positions = {}
+            self.client_positions = ClientPositionBook()
             self.closed_trades = set()
 
 
+    def apply_state(self, data):
+        """📦 החלת מסמך מצב על הזיכרון (בטעינה וגם בשיקוף מצב ב-hot standby)"""
+        self.position_diff.load(positions_from_dict(data.get("last_positions")))
+        self.last_positions = self.position_diff.positions
+        self.copied_trades = data.get("copied_trades", {})
+        self.client_positions = ClientPositionBook.from_dict(data.get("client_positions"))
+        self.closed_trades = set(data.get("closed_trades", []))
+
+        # פוזיציות מאסטר שטרם הועתקו (נדחו, או שפתיחתן נקטעה בכיבוי) – ננסה שוב; וסגירות שנקטעו
+        self._pending_opens = {key for key in self.last_positions if key[0] not in self.copied_trades}
+        self._pending_closes = set(data.get("pending_closes", []))
+        self.event_cursor = data.get("event_cursor")
+
+        # ✅ מסנכרן גם את TradeOperations
+        self.trade_operations.last_positions = self.last_positions
+        self.trade_operations.client_positions = self.client_positions
+        self.trade_operations.copied_trades = self.copied_trades
+        self.trade_operations.closed_trades = self.closed_trades
+
+
+    def _group_positions_by_partition(self):
+        count = self.partition_leases.partition_count
+        grouped = {}
+        for name, positions in self.client_positions.items():
+            grouped.setdefault(shard_for(name, count), {})[name] = dict(positions)
+        return grouped
+
+    async def _save_partition_positions(self, partitions=None):
+        """💾 שומר רק מחיצות בבעלותנו שהשתנו מאז השמירה האחרונה"""
+        grouped = self._group_positions_by_partition()
+        if partitions is None:
+            partitions = self.partition_leases.owned_partitions()
+
+        for partition in partitions:
+            positions = grouped.get(partition, {})
+            if self._saved_partition_positions.get(partition) == positions:
+                continue
+            if not self.partition_leases.holds(partition):
+                continue  # ה-lease פג – node אחר אולי כבר מחזיק את המחיצה
+            try:
+                await self.mongo_state.save_partition_positions(
+                    partition, positions, self.partition_leases.epochs.get(partition)
+                )
+            except FencedWriteError as e:
+                metrics.inc("partition_fenced_writes")
+                logger.critical(f"🚨 {e}")
+                continue
+            self._saved_partition_positions[partition] = {name: dict(p) for name, p in positions.items()}
+
+    async def _load_partition_positions(self, partitions):
+        for partition in partitions:
+            positions = await self.mongo_state.load_partition_positions(partition)
+            self.client_positions.update(positions)
+            self._saved_partition_positions[partition] = {name: dict(p) for name, p in positions.items()}
+
+    async def on_partitions_changed(self, acquired, released):
+        """🔄 עדכון לקוחות ופוזיציות אחרי שינוי בעלות על מחיצות"""
+        if released:
+            # שמירה אחרונה (רק למחיצות ב-draining שעדיין בבעלותנו), ואז ניקוי מקומי
+            await self._save_partition_positions(released & set(self.partition_leases.owned))
+            count = self.partition_leases.partition_count
+            for name in [n for n in self.client_positions if shard_for(n, count) in released]:
+                del self.client_positions[name]
+            for partition in released:
+                self._saved_partition_positions.pop(partition, None)
+
+        if acquired:
+            for partition in list(acquired):
+                try:
+                    await self.mongo_state.claim_partition(partition, self.partition_leases.epochs.get(partition))
+                except FencedWriteError as e:
+                    # node אחר כבר תפס את המחיצה ב-epoch חדש יותר – לא סוחרים בה
+                    logger.critical(f"🚨 {e}")
+                    self.partition_leases.owned.pop(partition, None)
+                    acquired.discard(partition)
+            await self._load_partition_positions(acquired)
+
+        self.clients = self._build_clients(self.client_configs)
+        self.trade_operations.update_clients(self.clients)
+        logger.info(f"🗂️ node מחזיק כעת {len(self.clients)} לקוחות ב-{len(self.partition_leases.owned_partitions())} מחיצות")
+
+
     async def process_trade_queue(self):
         #logger.info("📌 התחלת תהליך עיבוד עסקאות בתור")
 
         try:
             # יצירת מספר תהליכי עיבוד במקביל
             workers = [asyncio.create_task(self.trade_worker(i)) for i in range(5)]
+            for worker in workers:
+                self._queue_workers.add(worker)
+                worker.add_done_callback(self._queue_workers.discard)
             await self.queue.join()  # מחכה לסיום כל המשימות בתור
 
             for worker in workers:
@@ -140,12 +380,33 @@ class TradeManager:
         2. עדכון מינוף ומצב Margin אם זה חדש.
         3. סגירה חלקית אם הכמות ירדה משמעותית.
         4. סגירה מלאה ללקוחות אם עסקה נסגרה במאסטר.
+
+        מבקר הסטיות וה-prefetch של פוזיציות המאסטר רצים רק כל עוד הסנכרון פעיל (למשל לא ב-hot standby).
         """
+        background = [asyncio.create_task(self.balance_manager.run_master_positions_prefetch(self.master_api))]
+        if self.dry_run != "null":
+            # ב-null sink הפוזיציות האמיתיות ריקות – ביקורת הייתה "מתקנת" את מצב ה-dry-run
+            background.append(asyncio.create_task(self.drift_auditor.run()))
+        if self.event_sink is None:
+            # לתהליך המאסטר אין לקוחות – אין מה להכין מראש
+            background.append(asyncio.create_task(self.execution_plans.run()))
+        # 🔬 רישום ה-thread לדגימה מ-/admin/profile; lag ו-callbacks איטיים רק עם PROFILING_ENABLED=1
+        profiler.attach()
+        if profiler.enabled:
+            background.append(asyncio.create_task(profiler.monitor_lag()))
+        try:
+            await self._sync_trades_loop()
+        finally:
+            for task in background:
+                task.cancel()
 
-        while True:
+    async def _sync_trades_loop(self):
+        while not self.stopping:
             try:
-                # שליפת פוזיציות נוכחיות של המאסטר מה-API (כולל cache)
-                positions = await self.balance_manager.get_cached_master_positions(self.master_api)
+                # 📸 תמונת מצב אחת לסבב: פוזיציות, יתרה וכל ה-open orders (במקביל, כולל cache)
+                snapshot = await fetch_master_snapshot(self.balance_manager, self.master_api)
+                positions = snapshot.positions
+                metrics.observe("master_positions_staleness_seconds", snapshot.positions_age)
             except Exception as e:
                 logger.error(f"❌ שגיאה בשליפת פוזיציות מהמאסטר: {e}")
                 await asyncio.sleep(1)
@@ -156,91 +417,212 @@ class TradeManager:
                 logger.warning(f"⚠️ נתוני פוזיציות לא תקינים או ריקים: {positions}")
                 await asyncio.sleep(1)
                 continue
+            startup.mark("first_positions_poll")
+
+            with profiler.section("sync_cycle"):
+                try:
+                    # 🧮 רק השינויים מהסבב הקודם – לפי (symbol, positionSide)
+                    deltas = self.position_diff.update(positions["data"])
+                    closed = []
+                    for delta in deltas:
+                        try:
+                            if delta.kind == CLOSE:
+                                closed.append(delta)
+                            else:
+                                await self._apply_delta(delta)
+                        except Exception as e:
+                            logger.warning(f"⚠️ שגיאה בעיבוד שינוי בפוזיציית מאסטר {delta}: {e}")
+
+                    # פתיחות חדשות ופתיחות שנדחו בסבבים קודמים (יתרה לא זמינה / מינוף לא ידוע)
+                    if self._pending_opens:
+                        await self._process_pending_opens(positions["data"], snapshot)
+
+                    # התחלת תהליך פתיחת עסקאות (אם קיימות בתור)
+                    if not self.queue.empty():
+                        asyncio.create_task(self.process_trade_queue())
+
+                    # עסקאות שנסגרו אצל המאסטר – סגירה אצל הלקוחות (רק הצד שהועתק)
+                    to_close = []
+                    for delta in closed:
+                        key = (delta.symbol, delta.position_side)
+                        self._pending_opens.discard(key)
+                        if self._is_copied_side(delta.symbol, delta.position_side):
+                            to_close.append(delta.symbol)
+                    if self._pending_closes:
+                        # סגירות שנקטעו בכיבוי הקודם – אם המאסטר לא פתח מחדש את הצד שהועתק
+                        for symbol in self._pending_closes:
+                            if symbol in self.copied_trades and symbol not in to_close and not self._master_holds_copied_side(symbol):
+                                to_close.append(symbol)
+                        self._pending_closes.clear()
+                    if to_close:
+                        # סגירה במקביל של כל הסימבולים, כך שסגירות של אותו לקוח נכנסות לאותו חלון איחוד
+                        await asyncio.gather(*[self.dispatch_close(symbol) for symbol in to_close])
+                        for symbol in to_close:
+                            self.copied_trades.pop(symbol, None)
+
+                    # שמירה כשמשהו השתנה, ואחרת לכל היותר פעם ב-STATE_REFRESH_INTERVAL (PNL לדשבורד)
+                    now = time.monotonic()
+                    if deltas or now - self._last_state_save >= self.STATE_REFRESH_INTERVAL:
+                        self._last_state_save = now
+                        await self.save_state()
+
+                except Exception as e:
+                    logger.exception(f"❌ שגיאה כללית במהלך sync_trades: {e}")
+
+            # השהייה קטנה עד הסיבוב הבא
+            await asyncio.sleep(0.1)
 
+    def _is_copied_side(self, symbol, position_side):
+        copied = self.copied_trades.get(symbol)
+        # True = מצב שנשמר לפני מפתוח לפי צד – מתאים לכל צד
+        return copied is True or copied == position_side
+
+    async def refresh_master_view(self, max_age=10):
+        """
+        👁️ עדכון position_diff מפוזיציות המאסטר (מה-cache) – ב-worker של shard, לפני ביקורת סטיות.
+        False = אין תמונה תקינה ועדכנית; הביקורת מדלגת במקום לראות מאסטר "שטוח" ולסגור פוזיציות
+        """
+        positions, age = await self.balance_manager.get_master_positions_snapshot(self.master_api, ttl=2)
+        if not isinstance(positions, dict) or positions.get("code") != 0 or "data" not in positions or age > max_age:
+            return False
+        self.position_diff.update(positions["data"])
+        return True
+
+    def _master_holds_copied_side(self, symbol):
+        copied = self.copied_trades.get(symbol)
+        if copied is True:
+            return self.position_diff.symbol_qty(symbol) > 0
+        return (symbol, copied) in self.position_diff.positions
+
+    async def _apply_delta(self, delta):
+        position = delta.position
+        symbol, position_side = position.symbol, position.position_side
+
+        if delta.kind == OPEN:
+            self._pending_opens.add((symbol, position_side))
+            if position.leverage > 0:
+                self.execution_plans.note_symbol(symbol, position.leverage, "ISOLATED" if position.isolated else "CROSS")
+
+        elif delta.kind == DECREASE:
+            if self._is_copied_side(symbol, position_side):
+                await self.dispatch_partial_close(symbol, delta.closed_pct, position.side, position_side)
+
+        elif delta.kind == INCREASE:
+            # הגדלת פוזיציה אצל המאסטר – מזוהה ומדווחת; העתקת scale-in ללקוחות עדיין לא נתמכת
+            metrics.inc("master_scale_ins")
+            logger.info(f"📈 המאסטר הגדיל {symbol} ({position_side}): {delta.previous_qty} → {position.qty}")
+
+        elif delta.kind == LEVERAGE:
+            logger.info(f"🔧 מינוף המאסטר ב-{symbol} ({position_side}) השתנה: {delta.previous_leverage} → {position.leverage}")
+            if position.leverage > 0:
+                self.execution_plans.note_symbol(symbol, position.leverage, "ISOLATED" if position.isolated else "CROSS")
+
+    async def _process_pending_opens(self, raw_positions, snapshot):
+        """📤 פתיחה ללקוחות לכל פוזיציה שממתינה (נסרקות רק התשובות של המפתחות הממתינים)"""
+        pending = self._pending_opens
+        for raw in raw_positions:
+            key = (raw.get("symbol"), raw.get("positionSide") or "BOTH")
+            if key not in pending:
+                continue
+            position = self.position_diff.positions.get(key)
+            if position is None:
+                pending.discard(key)
+                continue
             try:
-                open_positions = {}  # מצב נוכחי של פוזיציות פתוחות
-
-                for position in positions["data"]:
-                    try:
-                        qty = float(position.get("positionAmt", 0))
-                        if qty == 0:
-                            continue  # התעלמות מפוזיציות סגורות
-
-                        # שליפה וניתוח נתוני הפוזיציה
-                        symbol = position["symbol"]
-                        position_side = position["positionSide"]
-                        side = "BUY" if position_side.upper() == "SHORT" else "SELL"
-                        leverage = int(position.get("leverage", 0))
-                        isolated = position.get("isolated", False)
-                        unrePNL = position.get("unrealizedProfit")
-                        price = float(position["markPrice"])
-                        Leverage, tp, sl = await self.balance_manager.get_cached_open_orders(self.master_api, symbol)
-                        position_value = float(position["positionValue"])
-
-                        # שליפת יתרת מאסטר
-                        master_client = {"name": "master", "api": self.master_api}
-                        master_balances = await self.balance_manager.get_cached_balance(master_client, "USDT")
-                        master_balance = float(master_balances.get("available", 0))
-
-                        # חישוב אחוז ההשקעה של המאסטר
-                        master_pct = calculate_master_pct_by_available_margin(position_value, leverage, master_balance)
-
-                        if leverage <= 0:
-                            continue
-
-                        # בדיקת סגירה חלקית
-                        if symbol in self.last_positions:
-                            prev_qty = self.last_positions[symbol].get("qty", 0)
-                            if prev_qty > 0 and qty < prev_qty * 0.9:
-                                master_closed_pct = (prev_qty - qty) / prev_qty
-                                await self.trade_operations.close_partial_trades(symbol, master_closed_pct, side, position_side)
-
-                        # שמירת הפוזיציה החדשה
-                        open_positions[symbol] = {
-                            "qty": qty,
-                            "side": side,
-                            "position_side": position_side,
-                            "leverage": leverage,
-                            "tp": tp,
-                            "sl": sl,
-                            "isolated": isolated,
-                            "unrealizedProfit": unrePNL
-                        }
-
-                        # פתיחת עסקה חדשה אם טרם שוכפלה
-                        if symbol not in self.copied_trades:
-                            await self.queue.put((symbol, side, position_side, master_pct, price, leverage, tp, sl , isolated))
-                            self.copied_trades[symbol] = True
-                            await self.save_state()
-
-                    except Exception as e:
-                        logger.warning(f"⚠️ שגיאה בעיבוד סימבול: {e}")
-
-                # התחלת תהליך פתיחת עסקאות (אם קיימות בתור)
-                if not self.queue.empty():
-                    asyncio.create_task(self.process_trade_queue())
-
-                # איתור עסקאות שנסגרו אצל המאסטר, וסגירתן אצל הלקוחות
-                closed_positions = {
-                    sym: pos for sym, pos in self.last_positions.items()
-                    if sym not in open_positions
-                }
-                if closed_positions:
-                    for symbol in closed_positions:
-                        await self.trade_operations.close_trades(symbol)
-                        self.copied_trades.pop(symbol, None)
-                    await self.save_state()
-
-
-                # עדכון מצב אחרון
-                self.last_positions = open_positions
+                if await self._try_open(position, raw, snapshot):
+                    pending.discard(key)
+            except Exception as e:
+                logger.warning(f"⚠️ שגיאה בפתיחת {key[0]}: {e}")
+
+    async def _try_open(self, position, raw, snapshot):
+        """True = טופל (נשלח או כבר הועתק); False = לנסות שוב בסבב הבא"""
+        symbol = position.symbol
+        if symbol in self.copied_trades:
+            # כבר הועתק – או צד שני (hedge) של סימבול שהלקוחות כבר מחזיקים
+            return True
+        if position.leverage <= 0:
+            return False
+        if not snapshot.balance_ok:
+            # יתרת המאסטר לא ידועה – אחוז ההשקעה לא אמין, ננסה שוב בסבב הבא
+            logger.warning(f"⏳ דחיית פתיחת {symbol}: יתרת המאסטר לא זמינה ({snapshot.balance_error})")
+            return False
+
+        price = float(raw["markPrice"])
+        position_value = float(raw["positionValue"])
+        _, position.tp, position.sl = snapshot.trade_parameters(symbol)
+
+        # חישוב אחוז ההשקעה של המאסטר מתוך יתרת תמונת הסבב
+        master_pct = calculate_master_pct_by_available_margin(position_value, position.leverage, snapshot.available_balance)
+
+        await self.dispatch_open(
+            symbol, position.side, position.position_side, master_pct, price,
+            position.leverage, position.tp, position.sl, position.isolated
+        )
+        self.copied_trades[symbol] = position.position_side
+        await self.save_state()
+        return True
+
+
+    async def dispatch_open(self, symbol, side, position_side, master_pct, price, leverage, tp, sl, isolated):
+        """📤 פתיחה: לתור המקומי, או שידור ל-workers במצב sharding"""
+        if self.event_sink is not None:
+            await self.event_sink.publish({
+                "type": "open", "event_id": new_event_id("open", symbol), "symbol": symbol, "side": side, "position_side": position_side,
+                "master_pct": master_pct, "price": price, "leverage": leverage,
+                "tp": tp, "sl": sl, "isolated": isolated
+            })
+            return
+        await self.queue.put((symbol, side, position_side, master_pct, price, leverage, tp, sl, isolated))
+
+    async def dispatch_partial_close(self, symbol, master_closed_pct, side, position_side):
+        if self.event_sink is not None:
+            await self.event_sink.publish({
+                "type": "partial_close", "event_id": new_event_id("partial_close", symbol), "symbol": symbol, "master_closed_pct": master_closed_pct,
+                "side": side, "position_side": position_side
+            })
+            return
+        await self.trade_operations.close_partial_trades(symbol, master_closed_pct, side, position_side)
+
+    async def dispatch_close(self, symbol):
+        if self.event_sink is not None:
+            await self.event_sink.publish({"type": "close", "event_id": new_event_id("close", symbol), "symbol": symbol})
+            return
+        await self.trade_operations.close_trades(symbol)
+
+    async def handle_event(self, event):
+        """📥 ביצוע אירוע מאסטר שהתקבל ב-worker של shard"""
+        event_type = event.get("type")
+        symbol = event.get("symbol")
+
+        # event id של המאסטר – אותו מזהה בלוגים של כל ה-workers
+        with log_context(event=event.get("event_id") or new_event_id(event_type, symbol), symbol=symbol):
+            await self._handle_event(event_type, symbol, event)
+
+    async def _handle_event(self, event_type, symbol, event):
+        try:
+            if event_type == "open":
+                await self.queue.put((
+                    symbol, event["side"], event["position_side"], event["master_pct"], event["price"],
+                    event["leverage"], event.get("tp"), event.get("sl"), event.get("isolated", False)
+                ))
+                self.copied_trades[symbol] = event["position_side"]
+                asyncio.create_task(self.process_trade_queue())
+
+            elif event_type == "partial_close":
+                await self.trade_operations.close_partial_trades(
+                    symbol, event["master_closed_pct"], event["side"], event["position_side"]
+                )
+
+            elif event_type == "close":
+                await self.trade_operations.close_trades(symbol)
+                self.copied_trades.pop(symbol, None)
                 await self.save_state()
 
-            except Exception as e:
-                logger.exception(f"❌ שגיאה כללית במהלך sync_trades: {e}")
+            else:
+                logger.warning(f"⚠️ סוג אירוע לא מוכר: {event}")
 
-            # השהייה קטנה עד הסיבוב הבא
-            await asyncio.sleep(0.1)
+        except Exception as e:
+            logger.exception(f"❌ שגיאה בביצוע אירוע {event_type} עבור {symbol}: {e}")
 
 
     async def trade_worker(self, worker_id):
@@ -248,7 +630,8 @@ class TradeManager:
             try:
                 symbol, side, position_side, master_pct, price, leverage , tp, sl , isolated = await self.queue.get()
                 #logger.info(f"👷‍♂️ עובד #{worker_id} מבצע עסקה: {symbol} ({side}), כמות: {qty}")
-                await self.trade_operations.copy_trade(symbol, side, position_side, master_pct,price,leverage,tp, sl , isolated)
+                with profiler.section("trade_worker"):
+                    await self.trade_operations.copy_trade(symbol, side, position_side, master_pct,price,leverage,tp, sl , isolated)
                 self.queue.task_done()
 
             except Exception as e:
@@ -261,20 +644,21 @@ class TradeManager:
         balances = {}
 
         for client in clients:
-            name = client.get("name", "לא ידוע")
+            name = client.key
             try:
                 balance_data = await self.balance_manager.get_cached_balance(client, asset)
 
                 if isinstance(balance_data, dict) and "available" in balance_data:
-                    balances[name.lower()] = balance_data
+                    balances[name] = balance_data
                     #logger.info(f"✅ יתרה ללקוח {name}: {balance_data.get('available')} USDT")
                 else:
+                    # כשל (CacheError) – שומרים את היתרה הידועה האחרונה במקום לאפס אותה
                     logger.warning(f"⚠️ תגובת יתרה לא תקינה ללקוח {name}: {balance_data}")
-                    balances[name.lower()] = {"available": 0}
+                    balances[name] = self.client_balances.get(name, {"available": 0})
 
             except Exception as e:
                 logger.warning(f"⚠️ שגיאה בטעינת יתרה מראש ללקוח {name}: {e}")
-                balances[name.lower()] = {"available": 0}
+                balances[name] = {"available": 0}
 
             await asyncio.sleep(1.5)  # ⏱️ השהייה קלה למניעת עומס
 
@@ -283,12 +667,26 @@ class TradeManager:
 
 
 
+    def add_background_task(self, coro, loop=None):
+        """משימת רקע שנעצרת ב-close()"""
+        task = (loop or asyncio.get_event_loop()).create_task(coro)
+        self._background_tasks.append(task)
+        return task
+
     def start_background_tasks(self, loop=None):
         if loop is None:
             loop = asyncio.get_event_loop()
 
-        loop.create_task(self._refresh_clients_loop())  # ✅ לולאת טעינת לקוחות
-        loop.create_task(self._preload_balances_loop())  # ✅ אם אתה גם טוען יתרות ברקע
+        self.add_background_task(self._refresh_clients_loop(), loop)  # ✅ לולאת טעינת לקוחות
+        if self.partition_leases is not None:
+            self.add_background_task(self.partition_leases.run(self.on_partitions_changed), loop)  # 🗂️ heartbeat ו-rebalance
+        self.add_background_task(self._preload_balances_loop(), loop)  # ✅ אם אתה גם טוען יתרות ברקע
+        self.add_background_task(self.connection_pool.run_prewarm_loop(), loop)  # 🔥 חיבורי TLS חמים ל-BingX
+
+        # 🕰️ תיאום שעון מול BingX – כל ה-timestamps החתומים מתוקנים לפי ה-offset
+        server_clock.interval = TIME_SYNC_INTERVAL
+        server_clock.recv_window = RECV_WINDOW_MS
+        self.add_background_task(server_clock.run(self.master_api), loop)
 
     async def _preload_balances_loop(self):
         """🔄 לולאת רקע לטעינת יתרות כל 3 דקות – יציבה ועמידה לשגיאות"""
@@ -321,3 +719,122 @@ class TradeManager:
                 logger.error(f"❌ שגיאה בטעינת לקוחות מחדש: {e}")
             
             await asyncio.sleep(2000)  # ⏱️ כל 5 דקות
+
+
+    def request_stop(self):
+        """🛑 עצירת זיהוי שינויים אצל המאסטר (הסבב הנוכחי מסתיים). בטוח לקריאה מ-call_soon_threadsafe"""
+        if not self.stopping:
+            self.stopping = True
+            logger.warning("🛑 התקבלה בקשת כיבוי – הזיהוי נעצר בסוף הסבב הנוכחי")
+
+    async def close(self, drain_seconds=SHUTDOWN_DRAIN_SECONDS):
+        """
+        🛑 כיבוי מסודר (קריאה שנייה לא עושה כלום):
+        1. עצירת הזיהוי
+        2. ניקוז פתיחות שבתור ופיזורים שרצים – עד drain_seconds
+        3. checkpoint למה שלא הסתיים: פתיחה יוצאת מ-copied_trades ותיפתח שוב בהפעלה הבאה
+           (לקוחות שכבר נפתחו מדולגים), סגירה נשמרת ב-pending_closes וממשיכה בסבב הראשון
+        4. עצירת משימות רקע, שמירת מצב, הודעה אחרונה לטלגרם וסגירת החיבורים
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.request_stop()
+        started = time.monotonic()
+        current = asyncio.current_task()
+
+        if not self.queue.empty() and not self._queue_workers:
+            asyncio.create_task(self.process_trade_queue())
+        pending = self.queue.qsize() + len(self.trade_operations.in_flight)
+
+        interrupted = []
+        try:
+            await asyncio.wait_for(self._drain(current), drain_seconds)
+        except asyncio.TimeoutError:
+            interrupted = await self._checkpoint_unfinished(current)
+
+        tasks = self._background_tasks + list(self._queue_workers)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        if not self.is_primary():
+            # standby (או primary שאיבד את ה-lease) – המצב וההודעות שייכים ל-primary הפעיל
+            logger.info("🧊 TradeManager במצב standby נסגר בלי שמירת מצב")
+            await self._close_connections()
+            return
+
+        await self.save_state()
+
+        elapsed = time.monotonic() - started
+        metrics.observe("shutdown_drain_seconds", elapsed)
+        metrics.inc("shutdown_interrupted_operations", len(interrupted))
+        summary = f"{max(pending - len(interrupted), 0)} פעולות נוקזו"
+        if interrupted:
+            summary += f", {len(interrupted)} נקטעו: " + ", ".join(f"{kind} {symbol}" for kind, symbol in interrupted)
+        label = f" ({self.master_name})" if self.master_name else ""
+        logger.warning(f"🛑 TradeManager{label} נסגר תוך {elapsed:.2f}s – {summary}")
+        await send_telegram_message(f"🛑 <b>הבוט נכבה</b> (הפעלה מחדש / deploy)\n{summary}")
+        await self._close_connections()
+
+    async def _close_connections(self):
+        if self.master_api.recorder is not None:
+            self.master_api.recorder.close()
+        await self.master_api.close_session()
+        if self._owns_resources:
+            await self.resources.close()
+
+    async def abort_trading(self):
+        """
+        ⛔ עצירה מיידית של כל פעולות המסחר, בלי ניקוז ובלי שמירת מצב (primary שאיבד את ה-lease):
+        פתיחות בתור נזרקות ופיזורים שרצים מבוטלים – המצב הקובע הוא של ה-primary החדש
+        """
+        dropped = []
+        while not self.queue.empty():
+            dropped.append(self.queue.get_nowait()[0])
+            self.queue.task_done()
+
+        current = asyncio.current_task()
+        running = [op for op in self.trade_operations.in_flight.values() if op[2] is not current]
+        tasks = list(self._queue_workers) + [task for _, _, task in running]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        metrics.inc("ha_aborted_operations", len(dropped) + len(running))
+        logger.critical(
+            f"⛔ המסחר נעצר: {len(dropped)} פתיחות בתור נזרקו, {len(running)} פיזורים בוטלו"
+            + (": " + ", ".join(f"{kind} {symbol}" for kind, symbol, _ in running) if running else "")
+        )
+
+    async def _drain(self, current):
+        await self.queue.join()
+        while True:
+            tasks = [task for _, _, task in self.trade_operations.in_flight.values() if task is not current and not task.done()]
+            if not tasks:
+                return
+            await asyncio.wait(tasks)
+
+    async def _checkpoint_unfinished(self, current):
+        """מה שלא הסתיים עד הדדליין: פתיחות חוזרות ל-pending, סגירות ל-pending_closes, ואז ביטול"""
+        interrupted = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            self.queue.task_done()
+            interrupted.append(("open", item[0]))
+
+        running = [op for op in self.trade_operations.in_flight.values() if op[2] is not current]
+        for kind, symbol, task in running:
+            interrupted.append((kind, symbol))
+            task.cancel()
+        await asyncio.gather(*[task for _, _, task in running], return_exceptions=True)
+
+        for kind, symbol in interrupted:
+            if kind == "open":
+                self.copied_trades.pop(symbol, None)
+            elif kind == "close":
+                self._pending_closes.add(symbol)
+            else:
+                # אחוז הסגירה שכבר בוצע לכל לקוח לא ידוע – מבקר הסטיות יתקן מול הבורסה
+                logger.critical(f"🚨 סגירה חלקית של {symbol} נקטעה בכיבוי – לא תמשיך אוטומטית")
+        return interrupted
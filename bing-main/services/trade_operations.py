@@ -1,16 +1,43 @@
+import time
 import asyncio
+import functools
+from contextlib import asynccontextmanager
 from send_telegram_message import send_telegram_message
-from core.logger import logger
+from core.logger import logger, log_event, bind_log_context
 from services.trade_math_utils import calculate_quantity_from_pct
 from services.balance_manager import BalanceManager
+from utils.adaptive_concurrency import AIMDConcurrencyController
+from services.fanout_scheduler import FanoutScheduler
+from core.profiling import profiler
+from core.metrics import metrics
 import math
 
 
+class DispatchRefused(Exception):
+    """הלקוח כבר לא בבעלותנו (lease של מחיצה / primary פג) – לא שולחים אותו לבורסה"""
+
+
+def in_flight(kind):
+    """רישום פעולת פיזור כ-in-flight עד שהיא מסתיימת – כדי שכיבוי יוכל לנקז אותה או לתעד שנקטעה"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, symbol, *args, **kwargs):
+            token = object()
+            self.in_flight[token] = (kind, symbol, asyncio.current_task())
+            try:
+                return await func(self, symbol, *args, **kwargs)
+            finally:
+                del self.in_flight[token]
+        return wrapper
+    return decorator
+
+
 
 
 class TradeOperations:
     
-    def __init__(self, master_api, clients, last_positions, client_positions, copied_trades, closed_trades,save_state_func):
+    def __init__(self, master_api, clients, last_positions, client_positions, copied_trades, closed_trades,save_state_func, balance_manager=None,
+                 concurrency_controller=None, scheduler=None, execution_plans=None, can_trade=None):
         self.master_api = master_api
         self.clients = clients
         self.last_positions = last_positions
@@ -18,8 +45,18 @@ class TradeOperations:
         self.copied_trades = copied_trades
         self.closed_trades = closed_trades
         self.save_state = save_state_func
-        self.balance_manager = BalanceManager()
+        self.balance_manager = balance_manager or BalanceManager()  # משותף עם TradeManager
         self.client_balances = {} 
+        # 📈 בקר מקביליות משותף לכל מסלולי הפיזור (במקום batch קבוע + sleep)
+        self.concurrency_controller = concurrency_controller or AIMDConcurrencyController()
+        # 🗓️ סדר הלקוחות בכל פיזור (ברירת מחדל: מתחלף) ומדידת slot latency לכל לקוח
+        self.scheduler = scheduler or FanoutScheduler()
+        # ⚡ תוכניות ביצוע מוכנות מראש (None = תמיד המסלול המלא)
+        self.execution_plans = execution_plans
+        # 🛑 פעולות פיזור שרצות כרגע: {token: (kind, symbol, task)}
+        self.in_flight = {}
+        # 🔒 can_trade(client_name) – נבדק לפני כל קריאה לבורסה בפיזור (None = תמיד מותר)
+        self.can_trade = can_trade
 
 
 
@@ -27,8 +64,52 @@ class TradeOperations:
     def update_clients(self, new_clients):
         self.clients = new_clients
 
-
-
+    async def _fan_out(self, clients, handler):
+        """
+        🚀 מריץ handler(client, exchange) לכל לקוח, בסדר שקובע ה-scheduler.
+        exchange() הוא slot של בקר ה-AIMD – ה-handler עוטף בו רק קריאה לבורסה, כך שכמה שבו-זמנית
+        ומדידת ההשהיה של הבקר נוגעות ב-BingX בלבד (לא בטלגרם / שמירת מצב).
+        לקוח ש-can_trade דוחה לא מגיע ל-handler; אם הבעלות פגה באמצע, exchange() זורק DispatchRefused.
+        מחזיר תוצאות (כולל חריגות) לפי סדר clients.
+        """
+        started = time.perf_counter()
+        ordered = self.scheduler.order(clients)
+
+        def exchange_slot(client):
+            waiting = [True]
+
+            @asynccontextmanager
+            async def exchange():
+                async with self.concurrency_controller.slot():
+                    if self.can_trade is not None and not self.can_trade(client.key):
+                        metrics.inc("fanout_dispatch_refused")
+                        raise DispatchRefused(client.key)
+                    if waiting:
+                        # זמן עד הקריאה הראשונה של הלקוח לבורסה – מדד ההוגנות של ה-scheduler
+                        waiting.clear()
+                        self.scheduler.record_slot(client.key, time.perf_counter() - started)
+                    yield
+
+            return exchange
+
+        async def run(client):
+            if self.can_trade is not None and not self.can_trade(client.key):
+                metrics.inc("fanout_dispatch_refused")
+                return None
+            with profiler.section("fanout_client"):
+                return await handler(client, exchange_slot(client))
+
+        with profiler.section("fanout"):
+            results = await asyncio.gather(*[run(client) for client in ordered], return_exceptions=True)
+        self.scheduler.report()
+
+        by_client = {id(client): result for client, result in zip(ordered, results)}
+        return [by_client[id(client)] for client in clients]
+
+
+
+    @log_event("open")
+    @in_flight("open")
     async def copy_trade(self, symbol, side, position_side, master_pct, price, leverage, tp, sl , isolated):
         #print(self.client_balances)
         try:
@@ -37,36 +118,9 @@ class TradeOperations:
                 f"🔹 <b>Leverage:</b> {leverage or 'לא ידוע'}x\n🎯 <b>TP:</b> {tp or 'לא נקבע'}\n🛑 <b>SL:</b> {sl or 'לא נקבע'}"
             )
 
-            batch_size = 10
-            tasks = []
-
-            for i in range(0, len(self.clients), batch_size):
-                batch = self.clients[i:i + batch_size]
-                client_names = [client["name"] for client in batch]
-                #logger.info(f"📦 שולח קבוצה בגודל {len(batch)}: {client_names}")
+            await self.execute_full_flow_for_batch(self.clients, symbol, side, position_side, master_pct, price, leverage, isolated)
 
-                try:
-                    task = asyncio.create_task(
-                        self.execute_full_flow_for_batch(batch, symbol, side, position_side, master_pct, price, leverage, isolated)
-                    )
-                    tasks.append(task)
-                    await asyncio.sleep(1.5)
-                except Exception as e:
-                    logger.error(f"❌ שגיאה בהכנת batch של לקוחות {client_names}: {e}")
-                    await send_telegram_message(
-                        f"❌ <b>שגיאה בעת הכנת קבוצה</b> של לקוחות {client_names}:\n{e}"
-                    )
-
-            # 🧠 איסוף כל המשימות, גם אם יש חריגות
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            # ניתוח שגיאות
-            for i, res in enumerate(results):
-                if isinstance(res, Exception):
-                    logger.error(f"❌ שגיאה ב־batch #{i+1}: {res}")
-                    await send_telegram_message(f"❌ <b>שגיאה בביצוע קבוצה #{i+1}</b>: {res}")
-
-            self.copied_trades[symbol] = True
+            self.copied_trades[symbol] = position_side  # הצד שהועתק (hedge mode)
             await self.save_state()
 
         except Exception as e:
@@ -74,6 +128,8 @@ class TradeOperations:
             await send_telegram_message(f"🚨 <b>שגיאה קריטית</b> בפתיחת עסקה עבור {symbol}:\n{e}")
 
 
+    @log_event("close")
+    @in_flight("close")
     async def close_trades(self, symbol):
         """✅ סגירת כל העסקאות לכל הלקוחות - בבת אחת, בקבוצות, בלי תורים"""
 
@@ -82,34 +138,25 @@ class TradeOperations:
 
         await send_telegram_message(f"🔴 <b>מתבצעת סגירה של העסקה על:</b> {symbol}")
 
-        async def process_client_close(client):
-            client_name = client.get("name", "לא ידוע").lower()
-            api = client["api"]
+        async def process_client_close(client, exchange):
+            client_name = client.key
+            bind_log_context(client=client_name)
+            api = client.api
 
             try:
-                if symbol not in self.client_positions.get(client_name, {}):
-                    await send_telegram_message(
-                        f"ℹ️ <b>אין עסקה פתוחה</b> על {symbol} אצל <b>{client_name}</b>"
-                    )
-                    return
-
-                response = await api.close_all_positions(symbol)
+                async with exchange():
+                    response = await api.close_all_positions(symbol)
 
                 if isinstance(response, dict) and response.get("code") == 0:
                     await send_telegram_message(
                         f"✅ <b>העסקה על {symbol} נסגרה בהצלחה</b> עבור הלקוח {client_name}"
                     )
 
-                    if client_name in self.client_positions and symbol in self.client_positions[client_name]:
-                        del self.client_positions[client_name][symbol]
-                        if not self.client_positions[client_name]:
-                            del self.client_positions[client_name]
+                    # לקוח שהתרוקן יוצא מה-ClientPositionBook לבד
+                    self.client_positions.get(client_name, {}).pop(symbol, None)
 
                     await self.save_state()
 
-                    if symbol in self.last_positions:
-                        del self.last_positions[symbol]
-
                 else:
                     msg = response.get("msg", "שגיאה לא ידועה") if isinstance(response, dict) else str(response)
                     code = response.get("code", "לא ידוע") if isinstance(response, dict) else "לא ידוע"
@@ -119,22 +166,29 @@ class TradeOperations:
                         f"🔹 <b>סיבה:</b> {msg}\n🔹 <b>קוד:</b> {code}"
                     )
 
+            except DispatchRefused:
+                return
             except Exception as e:
                 logger.exception(f"❌ חריגה לא צפויה בסגירת עסקה ל-{client_name}: {e}")
                 await send_telegram_message(f"❌ <b>שגיאה כללית</b> בסגירת עסקה ללקוח {client_name}: {e}")
 
-        # 🧠 Batching – חלוקה לקבוצות של 10 לקוחות עם השהייה
-        batch_size = 7
-        for i in range(0, len(self.clients), batch_size):
-            batch = self.clients[i:i + batch_size]
-            await asyncio.gather(*[process_client_close(client) for client in batch], return_exceptions=True)
-            await asyncio.sleep(1)  # מנוחה של שנייה בין קבוצות
+        # רק לקוחות שמחזיקים בסימבול תופסים מקום בפיזור; השאר מקבלים הודעה אחריו
+        holders, idle = [], []
+        for client in self.clients:
+            (holders if symbol in self.client_positions.get(client.key, {}) else idle).append(client)
+        await self._fan_out(holders, process_client_close)
+        await asyncio.gather(*[
+            send_telegram_message(f"ℹ️ <b>אין עסקה פתוחה</b> על {symbol} אצל <b>{client.key}</b>")
+            for client in idle
+        ])
 
         self.closed_trades.discard(symbol)
         await self.save_state()
 
 
 
+    @log_event("partial_close")
+    @in_flight("partial_close")
     async def close_partial_trades(self, symbol, master_closed_pct, side, position_side):
         """🔻 סוגר חלק מהעסקה לכל הלקוחות בקבוצות, במקביל, בלי תורים"""
         try:
@@ -142,53 +196,46 @@ class TradeOperations:
                 f"🔴 <b>סגירה חלקית של עסקה:</b> {symbol}\n📉 אחוז סגירה: {master_closed_pct * 100:.2f}%"
             )
 
-            batch_size = 7
-            for i in range(0, len(self.clients), batch_size):
-                batch = self.clients[i:i + batch_size]
-                tasks = []
-
-                for client in batch:
-                    try:
-                        client_name = client.get("name", "לא ידוע").lower()
-                        client_qty = float(self.client_positions.get(client_name, {}).get(symbol, 0))
-                        close_amount = client_qty * master_closed_pct
-
-                        if close_amount < 0.000001:
-                            continue
-
-                        async def close_client(c=client, name=client_name, amount=close_amount):
-                            try:
-                                response = await c["api"].close_position_partially(symbol, amount, side, position_side)
-
-                                if response.get("code") == 0:
-                                    self.client_positions.setdefault(name, {})[symbol] -= amount
-                                    if self.client_positions[name][symbol] <= 0:
-                                        del self.client_positions[name][symbol]
-                                        if not self.client_positions[name]:
-                                            del self.client_positions[name]
-                                    await self.save_state()
-
-                                    remaining_pct = math.ceil((1 - master_closed_pct) * 100)
-                                    await send_telegram_message(
-                                        f"✅ <b>סגירה חלקית הושלמה</b> ללקוח <b>{name}</b>\n"
-                                        f"📉 <b>אחוז נותר:</b> {remaining_pct}%"
-                                    )
-                                else:
-                                    msg = response.get("msg", "לא ידועה")
-                                    logger.warning(f"⚠️ שגיאה לוגית בסגירה חלקית ל-{name}: {msg}")
-                                    await send_telegram_message(f"⚠️ <b>שגיאה לוגית</b> בסגירה חלקית ללקוח {name}: {msg}")
-                            except Exception as e:
-                                logger.exception(f"❌ חריגה בסגירה חלקית ל-{name}: {e}")
-                                await send_telegram_message(f"❌ <b>שגיאה כללית</b> בסגירה חלקית ללקוח {name}: {e}")
-
-                        tasks.append(close_client())
-
-                    except Exception as e:
-                        logger.error(f"❌ שגיאה בהכנת סגירה ללקוח {client.get('name', 'לא ידוע')}: {e}")
-                        await send_telegram_message(f"❌ <b>שגיאה בהכנה</b> ללקוח {client.get('name', 'לא ידוע')}: {e}")
-
-                await asyncio.gather(*tasks, return_exceptions=True)
-                await asyncio.sleep(1)  # 📉 מנוחה בין קבוצות
+            async def close_client(client, exchange):
+                name = client.key
+                bind_log_context(client=name)
+                try:
+                    client_qty = float(self.client_positions.get(name, {}).get(symbol, 0))
+                    amount = client_qty * master_closed_pct
+                    if amount < 0.000001:
+                        return
+
+                    async with exchange():
+                        response = await client.api.close_position_partially(symbol, amount, side, position_side)
+
+                    if response.get("code") == 0:
+                        positions = self.client_positions.setdefault(name, {})
+                        positions[symbol] -= amount
+                        if positions[symbol] <= 0:
+                            del positions[symbol]
+                        await self.save_state()
+
+                        remaining_pct = math.ceil((1 - master_closed_pct) * 100)
+                        await send_telegram_message(
+                            f"✅ <b>סגירה חלקית הושלמה</b> ללקוח <b>{name}</b>\n"
+                            f"📉 <b>אחוז נותר:</b> {remaining_pct}%"
+                        )
+                    else:
+                        msg = response.get("msg", "לא ידועה")
+                        logger.warning(f"⚠️ שגיאה לוגית בסגירה חלקית ל-{name}: {msg}")
+                        await send_telegram_message(f"⚠️ <b>שגיאה לוגית</b> בסגירה חלקית ללקוח {name}: {msg}")
+                except DispatchRefused:
+                    return
+                except Exception as e:
+                    logger.exception(f"❌ חריגה בסגירה חלקית ל-{name}: {e}")
+                    await send_telegram_message(f"❌ <b>שגיאה כללית</b> בסגירה חלקית ללקוח {name}: {e}")
+
+            # רק לקוחות שמחזיקים בסימבול תופסים מקום בפיזור
+            holders = [
+                client for client in self.clients
+                if self.client_positions.get(client.key, {}).get(symbol)
+            ]
+            await self._fan_out(holders, close_client)
 
         except Exception as main_error:
             logger.critical(f"🚨 שגיאה קריטית ב־close_partial_trades: {main_error}")
@@ -197,13 +244,13 @@ class TradeOperations:
 
 
     async def execute_full_flow_for_batch(self, batch, symbol, side, position_side, master_pct, price, leverage, isolated):
-        async def process(client):
-            client_name = client.get("name", "לא ידוע")
-            api = client["api"]
+        async def process(client, exchange):
+            client_name = client.key
+            api = client.api
+            bind_log_context(client=client_name)
 
             try:
                 # 1. שליפת יתרה
-                client_name = client_name.lower()  # הוסף שורה זו לפני השימוש בשם הלקוח
                 balance_data = self.client_balances.get(client_name, {"available": 0})
                 available_margin = float(balance_data.get("available", 0))
                 if available_margin <= 0:
@@ -220,12 +267,32 @@ class TradeOperations:
                     logger.warning(f"⚠️ כמות לא חוקית אצל {client_name}")
                     return
 
-                # 3. עדכון מינוף
-                await api.set_leverage(symbol, leverage, position_side)
+                master_margin_mode = "ISOLATED" if isolated else "CROSS"
+                plan = self.execution_plans.plan_for(client_name, symbol, position_side, leverage, master_margin_mode) \
+                    if self.execution_plans is not None else None
+                if plan is not None:
+                    qty = plan.round_quantity(qty)
+                    if qty <= 0:
+                        logger.warning(f"⚠️ כמות קטנה מדיוק החוזה אצל {client_name}")
+                        return
+
+                # 3. עדכון מינוף (מדלגים אם כבר הוגדר מראש לאותו מינוף)
+                if plan is None or not plan.leverage_ready:
+                    async with exchange():
+                        response = await api.set_leverage(symbol, leverage, position_side)
+                    if plan is not None and isinstance(response, dict) and response.get("code") == 0:
+                        self.execution_plans.mark_leverage(client_name, symbol, position_side, leverage)
+                    elif plan is not None:
+                        self.execution_plans.on_order_error(client_name, symbol, response)
 
                 # 4. עדכון מצב מרג'ין
-                master_margin_mode = "ISOLATED" if isolated else "CROSS"
-                await api.set_margin_mode(symbol, master_margin_mode)
+                if plan is None or not plan.margin_ready:
+                    async with exchange():
+                        response = await api.set_margin_mode(symbol, master_margin_mode)
+                    if plan is not None and isinstance(response, dict) and response.get("code") == 0:
+                        self.execution_plans.mark_margin(client_name, symbol, master_margin_mode)
+                    elif plan is not None:
+                        self.execution_plans.reject_margin(client_name, symbol, master_margin_mode)
 
                 # בדיקה אם כבר קיימת עסקה
                 existing_qty = self.client_positions.get(client_name, {}).get(symbol)
@@ -239,7 +306,15 @@ class TradeOperations:
                     return
 
                 # 5. פתיחת עסקה
-                response = await api.open_trade(symbol, side, position_side, qty)
+                async with exchange():
+                    if plan is not None:
+                        response = await api.open_trade(
+                            symbol, side, position_side, qty,
+                            order_template=plan.order_templates.get(position_side),
+                            quantity_precision=plan.quantity_precision
+                        )
+                    else:
+                        response = await api.open_trade(symbol, side, position_side, qty)
 
                 if response and isinstance(response, dict):
                     if response.get("code") == 0:
@@ -252,6 +327,8 @@ class TradeOperations:
                         msg = response.get("msg", "שגיאה לא ידועה")
                         code = response.get("code", "לא ידוע")
                         logger.warning(f"⚠️ שגיאה בפתיחת עסקה אצל {client_name}: {msg} (קוד: {code})")
+                        if self.execution_plans is not None:
+                            self.execution_plans.on_order_error(client_name, symbol, response)
                         await send_telegram_message(
                             f"⚠️ <b>שגיאה</b> בפתיחת עסקה ללקוח <b>{client_name}</b>:\n"
                             f"📌 סימבול: {symbol}\n🧾 קוד: {code}\n🛑 הודעה: {msg}"
@@ -262,6 +339,8 @@ class TradeOperations:
                         f"❌ <b>שגיאה לא צפויה</b> בתגובה מה־API אצל <b>{client_name}</b>"
                     )
 
+            except DispatchRefused:
+                return
             except Exception as e:
                 logger.error(f"❌ שגיאה כללית בתהליך אצל {client_name}: {e}")
                 await send_telegram_message(
@@ -269,8 +348,8 @@ class TradeOperations:
                 )
                 return e
 
-        # 🚀 הרצת כל הלקוחות בקבוצה במקביל
-        results = await asyncio.gather(*[process(client) for client in batch], return_exceptions=True)
+        # 🚀 הרצת כל הלקוחות בקבוצה במקביל; קריאות הבורסה בתוך גבול המקביליות של הבקר
+        results = await self._fan_out(batch, process)
 
         for i, res in enumerate(results):
             if isinstance(res, Exception):
@@ -1,26 +1,155 @@
+from core.bootstrap import startup, warm_up_after_startup  # ⏱️ ראשון – נקודת הייחוס לזמן האתחול
 import asyncio
 import threading
+import signal
 import os
-from Web.app import app  # אפליקציית Flask שלך
-from services.trade_manager import TradeManager
+from core import config
+from core.config import (
+    TRADE_SHARDS, SHARD_IPC_PORT,
+    CLUSTER_PARTITIONS, CLUSTER_NODE_ID, CLUSTER_LEASE_TTL, HA_MODE, HA_LEASE_TTL,
+    SHUTDOWN_DRAIN_SECONDS, MULTI_MASTER
+)
 
 import logging
 logging.getLogger('werkzeug').disabled = True
 
+# 🛑 כיבוי מסודר: SIGTERM / SIGINT ב-thread הראשי מבקשים עצירה מלולאת המסחר ומחכים לניקוז
+_shutdown_requested = threading.Event()
+_stop_callbacks = []  # (loop, callback) – נרשמים מתוך ה-thread של המסחר
+_trade_thread = None
+_shard_processes = []
+
+
+def register_stop(loop, callback):
+    _stop_callbacks.append((loop, callback))
+    if _shutdown_requested.is_set():
+        loop.call_soon_threadsafe(callback)
+
+
+def _on_shutdown_signal(signum, frame):
+    if _shutdown_requested.is_set():
+        print("⛔ אות כיבוי שני – יציאה מיידית")
+        os._exit(1)
+    _shutdown_requested.set()
+    print(f"🛑 התקבל {signal.Signals(signum).name} – מנקז פעולות פתוחות (עד {SHUTDOWN_DRAIN_SECONDS:.0f}s)")
+
+    for loop, callback in _stop_callbacks:
+        try:
+            loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            pass  # הלולאה כבר נסגרה
+
+    # קודם ה-thread של המסחר (במצב sharding – ה-watcher, שסוגר את ערוץ האירועים), ואז ה-workers
+    if _trade_thread is not None:
+        _trade_thread.join(SHUTDOWN_DRAIN_SECONDS + 10)
+        if _trade_thread.is_alive():
+            print("⚠️ לולאת המסחר לא הסתיימה בזמן – יוצאים בכל זאת")
+    for process in _shard_processes:
+        process.terminate()
+    for process in _shard_processes:
+        process.join(SHUTDOWN_DRAIN_SECONDS + 10)
+    raise SystemExit(0)
+
+# 🚀 bootstrap מפורש: כל מודול כבד (TradeManager, Flask, מונגו, cluster / HA) נטען רק במסלול שצריך אותו
+
 # ⚙ פונקציה להרצת TradeManager
 async def run_trade_manager():
-    manager = TradeManager()
+    from services.trade_manager import TradeManager
+    from services.position_reconciler import reconcile_on_startup
+    startup.mark("imports")
+
+    partition_leases = None
+    if CLUSTER_PARTITIONS > 0:
+        # 🗂️ מצב cluster – ה-node סוחר רק בלקוחות של המחיצות שב-lease שלו
+        from services.partition_leases import PartitionLeaseManager
+        partition_leases = PartitionLeaseManager(
+            config.MONGO_URI, config.DB_NAME,
+            node_id=CLUSTER_NODE_ID,
+            partition_count=CLUSTER_PARTITIONS,
+            lease_ttl=CLUSTER_LEASE_TTL
+        )
+
+    manager = TradeManager(partition_leases=partition_leases)
+    startup.mark("trade_manager_built")
     loop = asyncio.get_event_loop()
+    register_stop(loop, manager.request_stop)
     manager.start_background_tasks(loop)  # ✅ העברת הלולאה הנוכחית
     await manager.load_state()
+    startup.mark("state_loaded")
+    loop.create_task(warm_up_after_startup())
 
     try:
-        await manager.sync_trades()
+        if HA_MODE:
+            # 🔥 primary / hot-standby – רק מי שמחזיק ב-lease סוחר
+            from services.hot_standby import LeaderLease, HotStandby
+            lease = LeaderLease(config.MONGO_URI, config.DB_NAME, node_id=CLUSTER_NODE_ID, ttl=HA_LEASE_TTL)
+            await HotStandby(manager, lease).run()
+        else:
+            if manager.dry_run != "null":
+                await reconcile_on_startup(manager)  # 🔍 תיקון המצב השמור מול הבורסה לפני הסנכרון
+            await manager.sync_trades()
     except Exception as e:
         print(f"❌ שגיאה ב־TradeManager: {e}")
     finally:
         await manager.close()
 
+# 🧑‍✈️ כמה מאסטרים בתהליך אחד – TradeManager לכל מאסטר מעל session, לקוחות ומטמונים משותפים
+async def run_master_group():
+    from services.multi_master import MasterGroup
+    from services.position_reconciler import reconcile_on_startup
+    startup.mark("imports")
+
+    group = MasterGroup()
+    startup.mark("trade_manager_built")
+    loop = asyncio.get_event_loop()
+    register_stop(loop, group.request_stop)
+    group.start_background_tasks(loop)
+    await group.load_state()
+    startup.mark("state_loaded")
+    loop.create_task(warm_up_after_startup())
+
+    try:
+        for manager in group.managers:
+            if manager.dry_run != "null":
+                await reconcile_on_startup(manager)
+        await group.sync_trades()
+    except Exception as e:
+        print(f"❌ שגיאה ב־MasterGroup: {e}")
+    finally:
+        await group.close()
+
+def start_master_group():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(run_master_group())
+
+# 📡 מצב sharding – התהליך הראשי רק צופה במאסטר ומשדר אירועים ל-workers
+async def run_master_watcher():
+    from services.trade_manager import TradeManager
+    from services.sharding import MasterEventBroadcaster
+    startup.mark("imports")
+
+    broadcaster = MasterEventBroadcaster(port=SHARD_IPC_PORT, shard_count=TRADE_SHARDS)
+    await broadcaster.start()
+    manager = TradeManager(event_sink=broadcaster)
+    register_stop(asyncio.get_event_loop(), manager.request_stop)
+    await manager.load_state()
+    startup.mark("state_loaded")
+    asyncio.get_event_loop().create_task(warm_up_after_startup())
+
+    try:
+        await manager.sync_trades()
+    except Exception as e:
+        print(f"❌ שגיאה ב־Master Watcher: {e}")
+    finally:
+        await manager.close()
+        await broadcaster.close()
+
+def start_master_watcher():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(run_master_watcher())
+
 # 🎯 הרצת trade_manager בתוך Thread נפרד עם לולאת asyncio
 def start_trade_manager():
     loop = asyncio.new_event_loop()
@@ -28,9 +157,25 @@ def start_trade_manager():
     loop.run_until_complete(run_trade_manager())
 
 if __name__ == "__main__":  # ← זה התיקון החשוב
-    # 🔁 הרץ את TradeManager ברקע
-    threading.Thread(target=start_trade_manager, daemon=True).start()
+    # 🔁 הרץ את TradeManager ברקע (daemon – אבל כיבוי מסודר מחכה לו עד SHUTDOWN_DRAIN_SECONDS)
+    signal.signal(signal.SIGTERM, _on_shutdown_signal)
+    signal.signal(signal.SIGINT, _on_shutdown_signal)
+    if CLUSTER_PARTITIONS > 0 and not CLUSTER_NODE_ID:
+        # מסמך המצב של ה-node נשמר לפי המזהה – חייב להיות קבוע בין הפעלות
+        raise Exception("❌ CLUSTER_PARTITIONS מוגדר בלי CLUSTER_NODE_ID קבוע")
+    if MULTI_MASTER:
+        if TRADE_SHARDS > 0 or CLUSTER_PARTITIONS > 0 or HA_MODE:
+            raise Exception("❌ MULTI_MASTER לא נתמך יחד עם TRADE_SHARDS / CLUSTER_PARTITIONS / HA_MODE")
+        _trade_thread = threading.Thread(target=start_master_group, daemon=True, name="master-group")
+    elif TRADE_SHARDS > 0:
+        from services.sharding import start_shard_workers
+        _shard_processes = start_shard_workers(TRADE_SHARDS, port=SHARD_IPC_PORT)
+        _trade_thread = threading.Thread(target=start_master_watcher, daemon=True, name="master-watcher")
+    else:
+        _trade_thread = threading.Thread(target=start_trade_manager, daemon=True, name="trade-manager")
+    _trade_thread.start()
 
     # 🌐 הרץ את Flask בענן (Render)
+    from Web.app import app  # אפליקציית Flask שלך
     port = int(os.environ.get("PORT", 5000))  # Render מגדיר PORT בסביבה
     app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,89 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from core.metrics import metrics
+
+
+class AIMDConcurrencyController:
+    """
+    📈 בקר מקביליות AIMD לפיזור ללקוחות (משותף לפתיחה, סגירה חלקית וסגירה מלאה).
+
+    - הצלחה בזמן תקין → הגדלה אדיטיבית (+increase לכל "סבב" של limit השלמות)
+    - 429 / timeout / שגיאת רשת, או השהיה גבוהה פי latency_tolerance מהבסיס → חיתוך כפלי (decrease_factor)
+      לכל היותר פעם ב-cooldown שניות, כדי שגל אחד של שגיאות לא יאפס את הגבול
+    """
+
+    def __init__(self, initial=10, min_limit=2, max_limit=100, increase=1.0, decrease_factor=0.5,
+                 latency_tolerance=2.0, cooldown=1.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self.baseline_latency = None  # EWMA של השהיות ה-slots
+        self._last_decrease = 0.0
+        self._condition = None
+        metrics.set_gauge("fanout_concurrency_limit", self.limit)
+
+    def _get_condition(self):
+        # נוצר בשימוש הראשון – בתוך הלולאה שמריצה את הפיזור
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @asynccontextmanager
+    async def slot(self):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        metrics.set_gauge("fanout_in_flight", self.in_flight)
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.on_complete(time.perf_counter() - started)
+            async with condition:
+                self.in_flight -= 1
+                condition.notify_all()
+
+    def on_complete(self, latency):
+        metrics.observe("fanout_slot_seconds", latency)
+        if self.baseline_latency is None:
+            self.baseline_latency = latency
+            return
+
+        overloaded = latency > self.baseline_latency * self.latency_tolerance
+        # הבסיס זז לאט גם כלפי מעלה – שינוי קבוע ברשת לא ייחשב עומס לנצח
+        self.baseline_latency = 0.9 * self.baseline_latency + 0.1 * latency
+
+        if overloaded:
+            self.on_overload()
+        else:
+            self._set_limit(self.limit + self.increase / max(self.limit, 1.0))
+
+    def on_overload(self):
+        """נקרא על 429 / timeout / שגיאת רשת (מ-BingXAPI) או על השהיה חריגה"""
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        metrics.inc("fanout_backoffs")
+        self._set_limit(self.limit * self.decrease_factor)
+
+    def _set_limit(self, limit):
+        previous = int(self.limit)
+        self.limit = min(max(limit, self.min_limit), self.max_limit)
+        metrics.set_gauge("fanout_concurrency_limit", self.limit)
+        if int(self.limit) > previous and self._condition is not None:
+            # מקומות פנויים חדשים – להעיר ממתינים (בלי לחכות לשחרור הבא)
+            asyncio.ensure_future(self._wake())
+
+    async def _wake(self):
+        async with self._condition:
+            self._condition.notify_all()
@@ -0,0 +1,151 @@
+import time
+import asyncio
+from collections import OrderedDict
+from core.logger import logger
+from core.metrics import metrics
+
+
+class CacheError:
+    """
+    ❌ תוצאת כישלון מפורשת – שונה מכל ערך אמיתי (למשל יתרה 0).
+    falsy, כך שבדיקות קיימות כמו `if not positions` ממשיכות לעבוד.
+    """
+
+    __slots__ = ("error", "timestamp")
+
+    def __init__(self, error):
+        self.error = error
+        self.timestamp = time.time()
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return f"CacheError({self.error!r})"
+
+
+class AsyncTTLCache:
+    """
+    🗃️ cache אסינכרוני גנרי:
+    - single-flight לכל מפתח (טעינה אחת גם כשיש הרבה ממתינים)
+    - TTL + גבול LRU (max_entries)
+    - stale-while-revalidate: עד stale_ttl אחרי התפוגה מוחזר הערך הישן ורענון רץ ברקע
+    - negative caching: כישלון נשמר כ-CacheError ל-negative_ttl שניות
+    - סטטיסטיקות hit/miss/stale/errors/evictions, גם במדדים הגלובליים
+    """
+
+    def __init__(self, name, ttl, max_entries=1024, stale_ttl=0, negative_ttl=1, timeout=None, validate=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.validate = validate
+
+        self._entries = OrderedDict()  # {key: (value, stored_at)}
+        self._inflight = {}  # {key: Task}
+        self.stats_counters = {"hits": 0, "misses": 0, "stale_hits": 0, "errors": 0, "evictions": 0}
+
+    def _count(self, stat):
+        self.stats_counters[stat] += 1
+        metrics.inc(f"cache_{self.name}_{stat}")
+        if stat in ("hits", "stale_hits", "misses"):
+            metrics.set_gauge(f"cache_{self.name}_hit_rate", self.hit_rate())
+
+    def hit_rate(self):
+        counters = self.stats_counters
+        lookups = counters["hits"] + counters["stale_hits"] + counters["misses"]
+        return (counters["hits"] + counters["stale_hits"]) / lookups if lookups else 0.0
+
+    def peek(self, key):
+        """(value, age_seconds) בלי טעינה, או None אם אין ערך"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        return value, time.monotonic() - stored_at
+
+    async def get(self, key, loader, ttl=None):
+        value, _ = await self.get_with_age(key, loader, ttl)
+        return value
+
+    async def get_with_age(self, key, loader, ttl=None):
+        """כמו get, אבל מחזיר גם (value, age_seconds) – גיל הערך שהושלם והוחזר"""
+        ttl = self.ttl if ttl is None else ttl
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            value, stored_at = entry
+            age = time.monotonic() - stored_at
+            is_error = isinstance(value, CacheError)
+
+            if age < (self.negative_ttl if is_error else ttl):
+                self._entries.move_to_end(key)
+                self._count("hits")
+                return value, age
+
+            if not is_error and age < ttl + self.stale_ttl:
+                # ערך ישן אך שמיש – מחזירים מיד ומרעננים ברקע
+                self._entries.move_to_end(key)
+                self._count("stale_hits")
+                self._start_load(key, loader)
+                return value, age
+
+        self._count("misses")
+        value = await asyncio.shield(self._start_load(key, loader))
+        return value, 0.0
+
+    def refresh(self, key, loader):
+        """🔄 רענון יזום (prefetch) – מתחבר לטעינה שכבר בדרך אם יש כזו. מחזיר את ה-Task"""
+        return self._start_load(key, loader)
+
+    def _start_load(self, key, loader):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _load(self, key, loader):
+        try:
+            if self.timeout:
+                value = await asyncio.wait_for(loader(), timeout=self.timeout)
+            else:
+                value = await loader()
+
+            if self.validate is not None and not self.validate(value):
+                raise ValueError(f"תגובה לא תקינה: {value}")
+
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = TimeoutError(f"timeout אחרי {self.timeout} שניות")
+            logger.warning(f"⚠️ cache {self.name}: טעינה נכשלה עבור {key}: {e}")
+            self._count("errors")
+            value = CacheError(e)
+
+            # כשל לא דורס ערך תקין שעדיין בחלון ה-stale
+            previous = self._entries.get(key)
+            if previous is not None and not isinstance(previous[0], CacheError):
+                if time.monotonic() - previous[1] < self.ttl + self.stale_ttl:
+                    return value
+
+        self._store(key, value)
+        return value
+
+    def _store(self, key, value):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._count("evictions")
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        return {**self.stats_counters, "size": len(self._entries), "hit_rate": self.hit_rate()}
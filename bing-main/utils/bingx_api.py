@@ -1,9 +1,8 @@
 import asyncio
 import aiohttp
-import time
-import hmac
-import hashlib
-from utils.apiutils import APIUtils
+from utils.request_builder import RequestBuilder
+from utils.time_sync import server_clock
+from utils import json_codec
 from send_telegram_message import send_telegram_message
 from core.logger import logger
 
@@ -12,16 +11,34 @@ from core.logger import logger
 MAX_RETRIES = 3
 RETRY_DELAY = 1  # שניות
 
+# 🧾 פקודות שמזיזות פוזיציה: אחרי timeout / שגיאת רשת אין לדעת אם הבורסה ביצעה – לא שולחים שוב
+# (ניסיון חוזר חתום מחדש היה מבוצע פעמיים). 429 כן חוזר – הבקשה נדחתה לפני ביצוע
+NON_IDEMPOTENT_PATHS = frozenset({
+    "/openApi/swap/v2/trade/order",
+    "/openApi/swap/v2/trade/batchOrders",
+    "/openApi/swap/v2/trade/closeAllPositions",
+})
+
 class BingXAPI:
     APIURL = "https://open-api.bingx.com"
 
+    # 🧱 אלפי מופעים (אחד ללקוח) – בלי __dict__ לכל אחד
+    __slots__ = (
+        "api_key", "secret_key", "session", "_session_owner", "rate_limit_wait", "recorder",
+        "order_sink", "coalescer", "concurrency_controller", "request_builder", "__weakref__",
+    )
+
     def __init__(self, api_key, secret_key, session=None):
         self.api_key = api_key
         self.secret_key = secret_key
         self.session = session  # יכול להיות חיצוני
         self._session_owner = session is None  # נדע אם אנחנו צריכים לסגור אותו
         self.rate_limit_wait = 1
-        self.cache = {}
+        self.recorder = None  # 📼 SessionRecorder אופציונלי (רק למאסטר)
+        self.order_sink = None  # 🧪 dry-run: יעד חלופי לבקשות אחרי החתימה (NullOrderSink / MockExchange)
+        self.coalescer = None  # 📦 OrderCoalescer משותף – איחוד פקודות של הלקוח לבקשות batch
+        self.concurrency_controller = None  # 📈 בקר AIMD של הפיזור – מקבל איתותי 429 / timeout
+        self.request_builder = RequestBuilder(self.APIURL, api_key, secret_key)  # 🏗️ חתימה עם מצב HMAC שמור
         
     async def start_session(self):
         if not self.session or self.session.closed:
@@ -36,29 +53,64 @@ class BingXAPI:
         self.session = None
 
 
+    async def ping(self):
+        """🏓 בקשה לא חתומה ל-server time – שומרת את חיבורי ה-TLS של ה-session חמים"""
+        await self.start_session()
+        try:
+            async with self.session.get(f"{self.APIURL}/openApi/swap/v2/server/time", timeout=aiohttp.ClientTimeout(total=5)) as response:
+                await response.read()
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"⚠️ ping ל-BingX נכשל: {e}")
+            return False
+
+
+    async def get_server_time(self):
+        """🕰️ זמן השרת של BingX במילישניות (בקשה לא חתומה), או None בכישלון"""
+        await self.start_session()
+        try:
+            async with self.session.get(f"{self.APIURL}/openApi/swap/v2/server/time", timeout=aiohttp.ClientTimeout(total=5)) as response:
+                data = json_codec.loads(await response.read())
+                return int(data["data"]["serverTime"])
+        except Exception as e:
+            logger.warning(f"⚠️ שליפת server time מ-BingX נכשלה: {e}")
+            return None
+
+
     async def _send_request(self, method, path, params_map, max_retries=5):
         """🚀 שליחת בקשת API עם ניהול Rate Limit, טיפול בשגיאות רשת, ותגובות לא תקינות"""
         await self.start_session()  # יצירת session אם לא קיים
     
-        # ✅ הכנת הפרמטרים וחתימה
-        params_map["timestamp"] = str(int(time.time() * 1000))
-        params_str = APIUtils.parse_param(params_map)
-        signature = hmac.new(self.secret_key.encode(), params_str.encode(), hashlib.sha256).hexdigest()
-    
-        url = f"{self.APIURL}{path}?{params_str}&signature={signature}"
-        headers = {"X-BX-APIKEY": self.api_key}
+        headers = self.request_builder.headers
+
+        if self.order_sink is not None:
+            # 🧪 הבקשה נבנית ונחתמת כרגיל – רק היעד מוחלף. None = הסינק לא מטפל, ממשיכים לבורסה
+            self.request_builder.build(path, params_map)
+            response = await self.order_sink.handle(self.api_key, method, path, params_map)
+            if response is not None:
+                return response
     
         for attempt in range(1, max_retries + 1):
+            # ✅ הכנת הפרמטרים וחתימה בכל ניסיון – timestamp טרי מהשעון המתואם אחרי המתנה של 429
+            # (או timeout בבקשה שמותר לחזור עליה), אחרת ה-recvWindow פג והבורסה דוחה את הניסיון החוזר.
+            # החתימה על המחרוזת הגולמית, ב-URL ערכים עם תווים מיוחדים (JSON של batchOrders) מקודדים
+            url, _ = self.request_builder.build(path, params_map)
             try:
                 async with self.session.request(method, url, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                    body = await response.read()
                     try:
-                        response_data = await response.json()
+                        response_data = json_codec.loads(body)
                     except Exception:
-                        text = await response.text()
+                        text = body.decode("utf-8", errors="replace")
                         logger.error(f"❌ לא ניתן לפענח JSON ({response.status}): {text}")
                         return {"code": -1, "msg": "Invalid JSON response"}
+
+                    if self.recorder is not None:
+                        self.recorder.record(path, params_map, response_data)
     
                     if response.status == 429:
+                        if self.concurrency_controller is not None:
+                            self.concurrency_controller.on_overload()
                         wait_time = min(self.rate_limit_wait * 2, 10)  # מגביל המתנה ל־10 שניות
                         logger.warning(f"🚨 Rate Limit! ניסיון {attempt}/{max_retries}. מחכה {wait_time} שניות...")
                         self.rate_limit_wait = wait_time
@@ -72,10 +124,18 @@ class BingXAPI:
     
                     # 🔴 אם התגובה נכונה אך הקוד לא 0 – שגיאה לוגית
                     logger.warning(f"⚠️ API Error ({response.status}): {response_data}")
+                    if "timestamp" in str(response_data.get("msg", "")).lower():
+                        # 🕰️ הבורסה דחתה את ה-timestamp – סנכרון שעון מיידי
+                        server_clock.request_resync()
                     return response_data
     
             except (aiohttp.ClientError, asyncio.TimeoutError) as e:
                 logger.error(f"❌ שגיאת רשת (ניסיון {attempt}/{max_retries}): {e}")
+                if self.concurrency_controller is not None:
+                    self.concurrency_controller.on_overload()
+                if path in NON_IDEMPOTENT_PATHS:
+                    logger.critical(f"🚨 {method} {path} לא הסתיים – ייתכן שבוצע בבורסה, לא נשלח שוב")
+                    return {"code": -1, "msg": f"שגיאת רשת בשליחת פקודה – תוצאה לא ידועה: {e}"}
                 await asyncio.sleep(2)
     
         logger.critical("❌ כל הניסיונות נכשלו – לא ניתן להתחבר ל-API")
@@ -85,7 +145,7 @@ class BingXAPI:
     async def get_positions(self):
         """✅ שליפת כל הפוזיציות הפתוחות עם טיפול שגיאות חכם וריטריי"""
         endpoint = "/openApi/swap/v2/user/positions"
-        params = {"recvWindow": "5000"}
+        params = {}
     
         for attempt in range(1, MAX_RETRIES + 1):
             try:
@@ -111,26 +171,32 @@ class BingXAPI:
         logger.error("🚫 נכשל בשליפת פוזיציות לאחר כל ניסיונות הריטריי, מחזיר רשימה ריקה")
         return {"code": -1, "data": []}  # ✅ תמיד מחזיר מבנה תקני
 
-    async def open_trade(self, symbol, side, position_side, qty):
-        """🚀 פתיחת עסקה עם טיפול שגיאות חכם והחזרת תגובה תקנית"""
+    @staticmethod
+    def open_order_template(symbol, position_side):
+        """📐 פרמטרי פקודת פתיחה בלי כמות – ה-timestamp נוסף בחתימה"""
+        return {
+            "symbol": symbol,
+            "side": "SELL" if position_side.upper() == "SHORT" else "BUY",
+            "positionSide": position_side,
+            "type": "MARKET",
+        }
+
+    async def open_trade(self, symbol, side, position_side, qty, order_template=None, quantity_precision=8):
+        """
+        🚀 פתיחת עסקה עם טיפול שגיאות חכם והחזרת תגובה תקנית.
+        order_template – תבנית מוכנה מראש (תוכנית ביצוע); רק הכמות נוספת
+        """
         await self.start_session()
 
         try:
-            qty_str = "{:.8f}".format(qty)
-            side = "SELL" if position_side.upper() == "SHORT" else "BUY"
-
-            params = {
-                "symbol": symbol,
-                "side": side,
-                "positionSide": position_side,
-                "type": "MARKET",
-                "quantity": qty_str,
-                "timestamp": str(int(time.time() * 1000))
-            }
+            qty_str = f"{qty:.{quantity_precision}f}"
+            params = dict(order_template or self.open_order_template(symbol, position_side))
+            params["quantity"] = qty_str
+            side = params["side"]
 
             #logger.info(f"🚀 ניסיון לפתוח עסקה: {symbol} ({side}), Position Side: {position_side}, כמות: {qty_str}")
 
-            response = await self._send_request("POST", "/openApi/swap/v2/trade/order", params)
+            response = await self._submit_order(params)
 
             # אם אין תגובה תקפה בכלל
             if response is None:
@@ -154,8 +220,22 @@ class BingXAPI:
 
 
 
+    async def _submit_order(self, params):
+        """📦 שליחת פקודה בודדת – דרך ה-coalescer אם הוגדר, אחרת ישירות"""
+        if self.coalescer is not None:
+            return await self.coalescer.submit_order(self, params)
+        return await self._send_request("POST", "/openApi/swap/v2/trade/order", params)
+
+    async def place_batch_orders(self, orders):
+        """📦 עד 5 פקודות בבקשה אחת (batchOrders)"""
+        params = {"batchOrders": json_codec.dumps(orders)}
+        return await self._send_request("POST", "/openApi/swap/v2/trade/batchOrders", params)
+
     async def close_all_positions(self, symbol):
-        """✅ סגירת כל העסקאות הפתוחות עם טיפול שגיאות חכם ולוגים ברורים"""
+        """
+        ✅ סגירת כל העסקאות הפתוחות עם טיפול שגיאות חכם ולוגים ברורים.
+        תמיד עם symbol – בלי סימבול BingX סוגר את כל הפוזיציות בחשבון, גם כאלה שהבוט לא פתח
+        """
         #logger.info(f"🔴 ניסיון לסגור את כל העסקאות של {symbol}")
         try:
             response = await self._send_request(
@@ -195,11 +275,9 @@ class BingXAPI:
                 "positionSide": position_side,
                 "quantity": "{:.8f}".format(qty),
                 "type": "MARKET",
-                "timestamp": str(int(time.time() * 1000)),
-                "recvWindow": "10000"
             }
 
-            response = await self._send_request("POST", "/openApi/swap/v2/trade/order", params)
+            response = await self._submit_order(params)
 
             if response is None:
                 logger.error(f"❌ לא התקבלה תגובה מהשרת בסגירה חלקית של {symbol}")
@@ -230,7 +308,6 @@ class BingXAPI:
                 "symbol": symbol,
                 "leverage": str(leverage),
                 "side": position_side,  # לדוגמה: "LONG" או "SHORT"
-                "timestamp": str(int(time.time() * 1000))
             }
 
             response = await self._send_request("POST", "/openApi/swap/v2/trade/leverage", params)
@@ -263,8 +340,6 @@ class BingXAPI:
             params = {
                 "symbol": symbol,
                 "marginType": margin_type,
-                "recvWindow": "60000",
-                "timestamp": str(int(time.time() * 1000))
             }
 
             response = await self._send_request("POST", "/openApi/swap/v2/trade/marginType", params)
@@ -289,6 +364,22 @@ class BingXAPI:
 
         
         
+    async def get_contracts(self):
+        """📏 מפרט החוזים: {symbol: quantityPrecision}, או None בשגיאה"""
+        try:
+            response = await self._send_request("GET", "/openApi/swap/v2/quote/contracts", {})
+            if not response or response.get("code") != 0:
+                logger.warning(f"⚠️ לא ניתן לקבל את מפרט החוזים: {response}")
+                return None
+            return {
+                contract["symbol"]: int(contract.get("quantityPrecision", 8))
+                for contract in response.get("data") or []
+                if contract.get("symbol")
+            }
+        except Exception as e:
+            logger.warning(f"⚠️ שגיאה בשליפת מפרט החוזים: {e}")
+            return None
+
     async def get_trade_parameters(self, symbol):
         """🔍 שליפת נתוני TP, SL ו-Leverage עבור סימבול עם טיפול בשגיאות"""
         try:
@@ -301,30 +392,50 @@ class BingXAPI:
                 return None, None, None
 
             orders = response["data"].get("orders", [])
-            leverage = None
-            take_profit = None
-            stop_loss = None
+            #logger.info(f"✅ {symbol}: Leverage: {leverage}x, TP: {take_profit}, SL: {stop_loss}")
+            return self.parse_trade_parameters(orders, symbol)
 
-            for order in orders:
-                if order.get("symbol") != symbol:
-                    continue
+        except Exception as e:
+            logger.exception(f"❌ שגיאה בשליפת פרמטרים עבור {symbol}: {e}")
+            return None, None, None
 
-                # שליפת מינוף רק אם טרם הוגדר
-                if leverage is None and "leverage" in order:
-                    leverage = order["leverage"].replace("X", "")
+    @staticmethod
+    def parse_trade_parameters(orders, symbol):
+        """מחלץ (leverage, tp, sl) של סימבול מתוך רשימת open orders"""
+        leverage = None
+        take_profit = None
+        stop_loss = None
 
-                if order.get("type") == "TAKE_PROFIT_MARKET":
-                    take_profit = order.get("stopPrice", "לא נקבע")
+        for order in orders:
+            if order.get("symbol") != symbol:
+                continue
 
-                if order.get("type") == "STOP_MARKET":
-                    stop_loss = order.get("stopPrice", "לא נקבע")
+            # שליפת מינוף רק אם טרם הוגדר
+            if leverage is None and "leverage" in order:
+                leverage = order["leverage"].replace("X", "")
 
-            #logger.info(f"✅ {symbol}: Leverage: {leverage}x, TP: {take_profit}, SL: {stop_loss}")
-            return leverage, take_profit, stop_loss
+            if order.get("type") == "TAKE_PROFIT_MARKET":
+                take_profit = order.get("stopPrice", "לא נקבע")
+
+            if order.get("type") == "STOP_MARKET":
+                stop_loss = order.get("stopPrice", "לא נקבע")
+
+        return leverage, take_profit, stop_loss
+
+    async def get_all_open_orders(self):
+        """📋 כל הפקודות הפתוחות בכל הסימבולים בקריאה אחת. מחזיר רשימת orders (None בשגיאה)"""
+        try:
+            response = await self._send_request("GET", "/openApi/swap/v2/trade/openOrders", {})
+
+            if not response or response.get("code") != 0 or "data" not in response:
+                logger.warning(f"⚠️ לא ניתן לקבל את כל ה-Open Orders: {response}")
+                return None
+
+            return response["data"].get("orders", []) or []
 
         except Exception as e:
-            logger.exception(f"❌ שגיאה בשליפת פרמטרים עבור {symbol}: {e}")
-            return None, None, None
+            logger.exception(f"❌ שגיאה בשליפת כל ה-Open Orders: {e}")
+            return None
 
 
     async def get_balance_details(self, asset="USDT"):
@@ -332,7 +443,7 @@ class BingXAPI:
         מחזיר את פרטי היתרה (equity, availableMargin, usedMargin, balance) כולל ריטריי ויציבות
         """
         endpoint = "/openApi/swap/v3/user/balance"
-        params = {"recvWindow": "5000"}
+        params = {}
 
         for attempt in range(1, MAX_RETRIES + 1):
             try:
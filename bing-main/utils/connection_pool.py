@@ -0,0 +1,124 @@
+import time
+import asyncio
+import aiohttp
+from core.logger import logger
+from core.metrics import metrics
+
+
+class ConnectionPoolManager:
+    """
+    🔌 מאגר חיבורים מנוהל ל-open-api.bingx.com.
+
+    - גודל מאגר מפורש (כולל ומגבלה ל-host)
+    - DNS cache ו-keep-alive ארוך
+    - pre-warming תקופתי של N חיבורים, כך שפיזור פקודות לא ימתין ל-TCP/TLS handshake
+    - מדדים: ניצול המאגר, זמן המתנה לחיבור פנוי, זמן יצירת חיבור חדש
+    """
+
+    APIURL = "https://open-api.bingx.com"
+    WARM_PATH = "/openApi/swap/v2/server/time"
+
+    def __init__(self, limit=200, limit_per_host=100, dns_ttl=300, keepalive_timeout=60,
+                 prewarm_connections=10, prewarm_interval=20):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.prewarm_connections = prewarm_connections
+        self.prewarm_interval = prewarm_interval
+
+        self.connector = None
+        self.session = None
+
+    def create_session(self):
+        """יוצר את ה-session המשותף (חייב לרוץ בתוך לולאת asyncio פעילה)"""
+        self.connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self.session = aiohttp.ClientSession(connector=self.connector, trace_configs=[self._trace_config()])
+        return self.session
+
+    def _trace_config(self):
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_queued_start(session, ctx, params):
+            ctx.queued_at = time.perf_counter()
+            metrics.inc("pool_connection_queued")
+            self.publish_stats()
+
+        async def on_queued_end(session, ctx, params):
+            metrics.observe("pool_connection_wait_seconds", time.perf_counter() - ctx.queued_at)
+
+        async def on_create_start(session, ctx, params):
+            ctx.create_at = time.perf_counter()
+
+        async def on_create_end(session, ctx, params):
+            metrics.inc("pool_connections_created")
+            metrics.observe("pool_connection_create_seconds", time.perf_counter() - ctx.create_at)
+
+        async def on_reuse(session, ctx, params):
+            metrics.inc("pool_connections_reused")
+
+        trace_config.on_connection_queued_start.append(on_queued_start)
+        trace_config.on_connection_queued_end.append(on_queued_end)
+        trace_config.on_connection_create_start.append(on_create_start)
+        trace_config.on_connection_create_end.append(on_create_end)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        return trace_config
+
+    def pool_stats(self):
+        """📊 חיבורים בשימוש / פנויים וניצול ביחס למגבלת ה-host"""
+        if self.connector is None:
+            return {"in_use": 0, "idle": 0, "saturation": 0.0}
+
+        # aiohttp לא חושף את המונים האלה ב-API ציבורי
+        in_use = len(getattr(self.connector, "_acquired", ()))
+        idle = sum(len(conns) for conns in getattr(self.connector, "_conns", {}).values())
+        return {
+            "in_use": in_use,
+            "idle": idle,
+            "saturation": in_use / self.limit_per_host if self.limit_per_host else 0.0
+        }
+
+    def publish_stats(self):
+        stats = self.pool_stats()
+        metrics.set_gauge("pool_in_use", stats["in_use"])
+        metrics.set_gauge("pool_idle", stats["idle"])
+        metrics.set_gauge("pool_saturation", stats["saturation"])
+        return stats
+
+    async def _warm_one(self):
+        try:
+            async with self.session.get(f"{self.APIURL}{self.WARM_PATH}", timeout=aiohttp.ClientTimeout(total=5)) as response:
+                await response.read()
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"⚠️ pre-warm לחיבור נכשל: {e}")
+            return False
+
+    async def prewarm(self, count=None):
+        """🔥 פותח/מרענן count חיבורים במקביל (בקשות בו-זמניות מחייבות חיבור נפרד לכל אחת)"""
+        if self.session is None or self.session.closed:
+            return 0
+
+        count = count or self.prewarm_connections
+        results = await asyncio.gather(*[self._warm_one() for _ in range(count)])
+        warmed = sum(1 for ok in results if ok)
+        metrics.set_gauge("pool_prewarmed", warmed)
+        self.publish_stats()
+        return warmed
+
+    async def run_prewarm_loop(self):
+        while True:
+            try:
+                await self.prewarm()
+            except Exception as e:
+                logger.exception(f"❌ שגיאה בלולאת pre-warm של מאגר החיבורים: {e}")
+            await asyncio.sleep(self.prewarm_interval)
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
@@ -0,0 +1,29 @@
+import json
+
+try:
+    import orjson  # אופציונלי – פענוח/קידוד מהיר פי כמה מ-json הסטנדרטי
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def loads(data):
+        """bytes / str → אובייקט Python"""
+        return orjson.loads(data)
+
+    def dumps(obj):
+        """אובייקט → str קומפקטי (בלי רווחים)"""
+        return orjson.dumps(obj).decode("utf-8")
+
+else:
+    BACKEND = "json"
+
+    def loads(data):
+        """bytes / str → אובייקט Python"""
+        return json.loads(data)
+
+    def dumps(obj):
+        """אובייקט → str קומפקטי (בלי רווחים)"""
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
@@ -0,0 +1,114 @@
+import time
+import json
+import asyncio
+from utils.bingx_api import BingXAPI
+from core.metrics import metrics
+
+
+class MockExchange:
+    """
+    🧪 סימולטור מקומי של BingX Futures – מחזיק פוזיציות ויתרות בזיכרון לכל api_key.
+    עונה על אותם endpoints ש-BingXAPI משתמש בהם, בפורמט תגובה של הבורסה.
+    """
+
+    def __init__(self, latency=0.02, default_balance=1000.0):
+        self.latency = latency
+        self.default_balance = default_balance
+        self.positions = {}  # {api_key: {(symbol, position_side): qty}}
+        self.balances = {}  # {api_key: available}
+        self.orders = []  # [(timestamp, api_key, path, params)]
+        self.first_order_at = {}  # {symbol: perf_counter}
+        self.last_order_at = {}
+
+    def _record_order(self, api_key, path, params):
+        now = time.perf_counter()
+        self.orders.append((now, api_key, path, dict(params)))
+        symbol = params.get("symbol")
+        if symbol:
+            self.first_order_at.setdefault(symbol, now)
+            self.last_order_at[symbol] = now
+
+    def _apply_order(self, api_key, path, params):
+        positions = self.positions.setdefault(api_key, {})
+        self._record_order(api_key, path, params)
+        key = (params["symbol"], params["positionSide"])
+        qty = float(params["quantity"])
+        opening = (params["side"] == "BUY") == (params["positionSide"].upper() == "LONG")
+        positions[key] = max(positions.get(key, 0) + (qty if opening else -qty), 0)
+        if not positions[key]:
+            del positions[key]
+        return {"symbol": params["symbol"], "orderId": len(self.orders)}
+
+    async def handle(self, api_key, method, path, params):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        positions = self.positions.setdefault(api_key, {})
+
+        if path == "/openApi/swap/v2/trade/order":
+            return {"code": 0, "msg": "", "data": {"order": self._apply_order(api_key, path, params)}}
+
+        if path == "/openApi/swap/v2/trade/batchOrders":
+            orders = [self._apply_order(api_key, path, order) for order in json.loads(params["batchOrders"])]
+            return {"code": 0, "msg": "", "data": {"orders": orders}}
+
+        if path == "/openApi/swap/v2/trade/closeAllPositions":
+            self._record_order(api_key, path, params)
+            symbol = params.get("symbol")
+            for key in [k for k in positions if symbol is None or k[0] == symbol]:
+                del positions[key]
+            return {"code": 0, "msg": "", "data": {"success": []}}
+
+        if path in ("/openApi/swap/v2/trade/leverage", "/openApi/swap/v2/trade/marginType"):
+            return {"code": 0, "msg": "", "data": {}}
+
+        if path == "/openApi/swap/v2/user/positions":
+            return {"code": 0, "msg": "", "data": [
+                {"symbol": symbol, "positionSide": side, "positionAmt": str(qty)}
+                for (symbol, side), qty in positions.items()
+            ]}
+
+        if path == "/openApi/swap/v3/user/balance":
+            available = self.balances.get(api_key, self.default_balance)
+            return {"code": 0, "msg": "", "data": [{
+                "asset": "USDT", "availableMargin": str(available), "equity": str(available),
+                "usedMargin": "0", "balance": str(available)
+            }]}
+
+        if path == "/openApi/swap/v2/trade/openOrders":
+            return {"code": 0, "msg": "", "data": {"orders": []}}
+
+        return {"code": -1, "msg": f"mock exchange: endpoint לא נתמך {path}"}
+
+
+class NullOrderSink:
+    """🕳️ בולע כל בקשת כתיבה (POST) ומחזיר הצלחה; בקשות קריאה ממשיכות לבורסה האמיתית"""
+
+    def __init__(self):
+        self.orders = 0
+
+    async def handle(self, api_key, method, path, params):
+        if method != "POST":
+            return None
+        self.orders += 1
+        metrics.inc("dry_run_requests")
+        if path == "/openApi/swap/v2/trade/batchOrders":
+            batch = json.loads(params["batchOrders"])
+            return {"code": 0, "msg": "dry-run", "data": {"orders": [
+                {"symbol": order.get("symbol"), "orderId": self.orders} for order in batch
+            ]}}
+        return {"code": 0, "msg": "dry-run", "data": {"order": {"symbol": params.get("symbol"), "orderId": self.orders}}}
+
+
+class MockBingXAPI(BingXAPI):
+    """BingXAPI שכל הבקשות שלו מנותבות ל-MockExchange במקום לרשת"""
+
+    def __init__(self, api_key, secret_key, exchange, session=None):
+        super().__init__(api_key, secret_key, session=session)
+        self.exchange = exchange
+
+    async def start_session(self):
+        pass
+
+    async def _send_request(self, method, path, params_map, max_retries=5):
+        return await self.exchange.handle(self.api_key, method, path, params_map)
@@ -0,0 +1,82 @@
+import re
+import hmac
+import hashlib
+from urllib.parse import quote
+from utils.time_sync import server_clock
+
+
+# תווים שאפשר להשאיר ב-URL כמו שהם; כל דבר אחר (למשל JSON של batchOrders) מקודד
+_NEEDS_QUOTING = re.compile(r"[^A-Za-z0-9_.~=&\-]")
+
+
+class RequestSigner:
+    """
+    🔏 חתימת HMAC-SHA256 עם מצב מפתח מחושב מראש.
+    hmac.new מחשב את ה-inner/outer pads מהסוד בכל קריאה – כאן זה קורה פעם אחת ו-copy() משכפל.
+    """
+
+    __slots__ = ("_base",)
+
+    def __init__(self, secret_key):
+        self._base = hmac.new(secret_key.encode("utf-8"), digestmod=hashlib.sha256)
+
+    def sign(self, payload):
+        mac = self._base.copy()
+        mac.update(payload.encode("utf-8"))
+        return mac.hexdigest()
+
+
+class EndpointTemplate:
+    """
+    📐 תבנית endpoint: קידומת URL בנויה מראש וסדר מפתחות ממוין שמור לכל סט פרמטרים.
+    """
+
+    __slots__ = ("url_prefix", "_key_orders")
+
+    def __init__(self, base_url, path):
+        self.url_prefix = f"{base_url}{path}?"
+        self._key_orders = {}  # {frozenset(keys): tuple(sorted keys)}
+
+    def sorted_keys(self, params_map):
+        keys = frozenset(params_map)
+        order = self._key_orders.get(keys)
+        if order is None:
+            order = self._key_orders[keys] = tuple(sorted(keys))
+        return order
+
+
+class RequestBuilder:
+    """
+    🏗️ בניית בקשה חתומה ל-BingX: timestamp מהשעון המתואם (פעם אחת), recvWindow אחיד,
+    query ממוין, חתימה ו-URL.
+    תבניות ה-endpoints משותפות לכל הלקוחות; ה-signer וה-headers – לכל מפתח.
+    """
+
+    _templates = {}  # {(base_url, path): EndpointTemplate}
+
+    __slots__ = ("base_url", "headers", "clock", "_signer")
+
+    def __init__(self, base_url, api_key, secret_key, clock=server_clock):
+        self.base_url = base_url
+        self.headers = {"X-BX-APIKEY": api_key}
+        self.clock = clock
+        self._signer = RequestSigner(secret_key)
+
+    @classmethod
+    def template(cls, base_url, path):
+        template = cls._templates.get((base_url, path))
+        if template is None:
+            template = cls._templates[(base_url, path)] = EndpointTemplate(base_url, path)
+        return template
+
+    def build(self, path, params_map, timestamp=None):
+        """מוסיף timestamp ו-recvWindow ל-params_map ומחזיר (url, params_str) – החתימה על המחרוזת הגולמית"""
+        params_map["timestamp"] = str(timestamp if timestamp is not None else self.clock.now_ms())
+        params_map["recvWindow"] = str(self.clock.recv_window)
+        template = self.template(self.base_url, path)
+
+        params_str = "&".join([f"{key}={params_map[key]}" for key in template.sorted_keys(params_map)])
+        signature = self._signer.sign(params_str)
+
+        query = quote(params_str, safe="=&") if _NEEDS_QUOTING.search(params_str) else params_str
+        return f"{template.url_prefix}{query}&signature={signature}", params_str
@@ -0,0 +1,82 @@
+import time
+import asyncio
+from core.logger import logger
+from core.metrics import metrics
+
+
+class ServerClock:
+    """
+    🕰️ שעון מתואם לשרת של BingX.
+
+    מודד offset ו-RTT מול endpoint ה-server time (כמה דגימות, נבחרת זו עם ה-RTT הנמוך ביותר)
+    וכל timestamp חתום נלקח מ-now_ms() – כך סטיית שעון של המארח לא גורמת לדחיית בקשות.
+    """
+
+    def __init__(self, samples=5, interval=60, recv_window=5000):
+        self.samples = samples
+        self.interval = interval
+        self.recv_window = recv_window  # אחיד לכל הבקשות החתומות – בטוח כשהשעון מתואם
+        self.offset_ms = 0.0
+        self.rtt_ms = None
+        self.synced_at = None
+        self._resync = None
+
+    def now_ms(self):
+        return int(time.time() * 1000 + self.offset_ms)
+
+    async def sample(self, api):
+        """(offset_ms, rtt_ms) מדגימה אחת, או None בכישלון"""
+        sent = time.time() * 1000
+        server_time = await api.get_server_time()
+        received = time.time() * 1000
+        if server_time is None:
+            return None
+        rtt = received - sent
+        # הנחה: השרת חתם את הזמן באמצע הדרך
+        return server_time - (sent + rtt / 2), rtt
+
+    async def sync(self, api):
+        results = []
+        for _ in range(self.samples):
+            result = await self.sample(api)
+            if result is not None:
+                results.append(result)
+
+        if not results:
+            logger.warning("⚠️ סנכרון שעון מול BingX נכשל – ממשיכים עם ה-offset הקודם")
+            return False
+
+        offset, rtt = min(results, key=lambda r: r[1])
+        if abs(offset - self.offset_ms) > 500:
+            logger.info(f"🕰️ offset שעון מול BingX: {offset:.0f}ms (RTT {rtt:.0f}ms)")
+
+        self.offset_ms, self.rtt_ms, self.synced_at = offset, rtt, time.time()
+        metrics.set_gauge("clock_offset_ms", offset)
+        metrics.set_gauge("clock_rtt_ms", rtt)
+        return True
+
+    def request_resync(self):
+        """נקרא כשהבורסה דוחה timestamp – מקדים את הסנכרון הבא"""
+        metrics.inc("clock_timestamp_rejections")
+        if self._resync is not None:
+            self._resync.set()
+
+    async def run(self, api):
+        self._resync = asyncio.Event()
+        while True:
+            # דחיות שמגיעות בזמן הסנכרון נובעות מה-offset הישן – לא מפעילות סנכרון נוסף
+            self._resync.clear()
+            try:
+                await self.sync(api)
+            except Exception as e:
+                logger.warning(f"⚠️ שגיאה בסנכרון שעון: {e}")
+            self._resync.clear()
+
+            try:
+                await asyncio.wait_for(self._resync.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+# מופע יחיד לתהליך – כל ה-BingXAPI חותמים לפיו
+server_clock = ServerClock()